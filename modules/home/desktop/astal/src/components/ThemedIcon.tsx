@@ -1,5 +1,5 @@
 import { bind } from "astal";
-import iconManifest from "../services/IconService";
+import iconManifest, { requestIcon } from "../services/IconService";
 
 interface ThemedIconProps {
   appId: string;
@@ -26,6 +26,8 @@ export default function ThemedIcon({
     const path = manifest[palette]?.[appId];
 
     if (!path) {
+      // Not tinted yet (background batch still running): tint this one now
+      requestIcon(appId, palette);
       // Uncomment this to see exactly why it fails in the logs
       // print(`[ThemedIcon] Lookup failed for '${appId}' in palette '${palette}'`);
       // print(`[ThemedIcon] Manifest keys example: ${Object.keys(manifest[palette]).slice(0, 5).join(", ")}`);
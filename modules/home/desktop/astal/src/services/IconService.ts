@@ -1,5 +1,6 @@
 import { Variable, GLib } from "astal";
 import { monitorFile, readFileAsync } from "astal/file";
+import { execAsync } from "astal/process";
 
 // This module provides a single, global, reactive variable
 // containing the icon manifest generated by the backend.
@@ -10,6 +11,9 @@ const SIGNAL_FILE = `${GLib.get_home_dir()}/.cache/theme-engine/signal`;
 export interface IconManifest {
   primary: { [app_id: string]: string };
   accent: { [app_id: string]: string };
+  // Present when tinting ran with atlas=True: paths to each color's
+  // atlas.json ({ image, size, rects: { [app_id]: [x, y, w, h] } }).
+  atlas?: { primary: string; accent: string };
 }
 
 // 1. Create the reactive variable that will be the single source of truth.
@@ -30,11 +34,35 @@ const loadManifest = () => {
     });
 };
 
-// 3. Set up the watcher to automatically reload on theme changes.
+// On-demand tinting for icons the manifest does not list yet:
+// `magician icon` tints one icon (cached afterwards) and prints its path.
+const pending = new Set<string>();
+const failed = new Set<string>();
+
+// 3. Set up the watchers: theme changes, and the background tint batch
+// (it rewrites the manifest when it starts and when it finishes).
 monitorFile(SIGNAL_FILE, () => {
   print("[IconService] Signal received. Reloading icon manifest...");
+  failed.clear();
   loadManifest();
 });
+monitorFile(MANIFEST_PATH, () => loadManifest());
+
+export const requestIcon = (appId: string, palette: "primary" | "accent") => {
+  const key = `${palette}:${appId}`;
+  if (pending.has(key) || failed.has(key)) return;
+  pending.add(key);
+  execAsync(["magician", "icon", appId, "--role", palette])
+    .then((path) => {
+      const manifest = iconManifest.get() ?? { primary: {}, accent: {} };
+      iconManifest.set({
+        ...manifest,
+        [palette]: { ...manifest[palette], [appId]: path.trim() },
+      });
+    })
+    .catch(() => failed.add(key)) // No icon source: don't ask again until the theme changes
+    .finally(() => pending.delete(key));
+};
 
 // 4. Perform the initial load when the application starts.
 loadManifest();
@@ -0,0 +1,164 @@
+"""
+bench.py — Pipeline Benchmark
+Deterministic synthetic corpus, per-stage timings and baseline regression checks.
+
+Runs fully offline: the corpus is generated from a fixed seed and written
+once; every run recomputes the whole pipeline (no palette store).
+"""
+import os
+import time
+import warnings
+import platform
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from core.pipeline import Pipeline
+from core.profiler import Profiler, span
+
+CORPUS_VERSION = 1
+SEED = 1337
+
+# Reported in pipeline order
+STAGES = ["decode", "mood", "saliency", "oklab", "kmeans", "template_fit", "solver", "map_colors"]
+
+# name -> (width, height, kind)
+CORPUS = {
+    "1080p": (1920, 1080, "scene"),
+    "4k": (3840, 2160, "scene"),
+    "8k": (7680, 4320, "scene"),
+    "noisy": (1920, 1080, "noise"),
+    "flat": (1920, 1080, "flat"),
+    "gradient": (1920, 1080, "gradient"),
+}
+
+# Stages faster than this (ms) are too noisy to gate on
+NOISE_FLOOR_MS = 2.0
+
+
+def _synthesize(width: int, height: int, kind: str, rng: np.random.Generator) -> np.ndarray:
+    """Uint8 RGB test image of a given kind."""
+    if kind == "flat":
+        return np.broadcast_to(np.array([72, 96, 140], dtype=np.uint8), (height, width, 3)).copy()
+    if kind == "noise":
+        return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+    if kind == "gradient":
+        start = np.array([0.9, 0.35, 0.2], dtype=np.float32)
+        end = np.array([0.1, 0.2, 0.55], dtype=np.float32)
+        img = start + (end - start) * (0.7 * x + 0.3 * y)
+    else:
+        # "Scene": smooth colored blobs over a sky-like gradient, plus grain
+        img = np.broadcast_to(np.array([0.15, 0.2, 0.35], dtype=np.float32) + 0.4 * y, (height, width, 3)).copy()
+        for _ in range(12):
+            cx, cy = rng.random(2)
+            radius = 0.05 + 0.2 * rng.random()
+            color = rng.random(3).astype(np.float32)
+            mask = np.exp(-((x[..., 0] - cx) ** 2 + ((y[..., 0] - cy) * height / width) ** 2) / (2 * radius ** 2))
+            img += (color - img) * mask[..., None]
+        img += rng.normal(0.0, 0.02, (height, width, 1)).astype(np.float32)
+    return (np.clip(img, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def ensure_corpus(root: Path, names: Optional[List[str]] = None) -> Dict[str, Path]:
+    """Generate (once) and return the corpus images by name."""
+    corpus_dir = root / f"corpus-v{CORPUS_VERSION}"
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for i, (name, (width, height, kind)) in enumerate(CORPUS.items()):
+        if names and name not in names:
+            continue
+        path = corpus_dir / f"{name}.jpg"
+        if not path.exists():
+            img = _synthesize(width, height, kind, np.random.default_rng(SEED + i))
+            tmp = path.with_suffix(".tmp.jpg")
+            Image.fromarray(img).save(tmp, quality=92)
+            os.replace(tmp, path)
+        paths[name] = path
+    return paths
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    arr = np.array(samples) * 1000
+    return {"median": round(float(np.median(arr)), 3), "p95": round(float(np.percentile(arr, 95)), 3)}
+
+
+def run_bench(
+    images: Dict[str, Path],
+    mood: str = "adaptive",
+    repeat: int = 5,
+    warmup: int = 1,
+    on_image: Optional[Callable[[str, Dict], None]] = None,
+    trace: Optional[Profiler] = None,
+) -> Dict:
+    """
+    Time every stage of the uncached pipeline, `repeat` times per image.
+    A `trace` profiler collects the spans of every timed run.
+
+    Returns:
+        {"meta": {...}, "results": {image: {stage: {"median", "p95"} (ms), "total": ...}}}
+    """
+    from sklearn.exceptions import ConvergenceWarning
+    # Flat images have fewer distinct colors than clusters; expected here
+    warnings.filterwarnings("ignore", category=ConvergenceWarning)
+
+    pipeline = Pipeline(store=None)
+    results = {}
+    for name, path in images.items():
+        for _ in range(warmup):
+            pipeline.run(path, mood, img_hash=name)
+
+        samples: Dict[str, List[float]] = {stage: [] for stage in STAGES + ["total"]}
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with Profiler() as profiler, span("bench_run", image=name):
+                pipeline.run(path, mood, img_hash=name)
+            samples["total"].append(time.perf_counter() - start)
+            if trace is not None:
+                trace.extend(profiler.spans)
+            totals = profiler.totals()
+            for stage in STAGES:
+                samples[stage].append(totals.get(stage, 0.0))
+
+        results[name] = {stage: _summary(values) for stage, values in samples.items()}
+        if on_image:
+            on_image(name, results[name])
+
+    return {
+        "meta": {
+            "corpus_version": CORPUS_VERSION,
+            "mood": mood,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare_baseline(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Regressions of median stage times beyond `threshold` (0.2 = +20%).
+    Stages under NOISE_FLOOR_MS in both runs are ignored.
+    """
+    regressions = []
+    for image, stages in current["results"].items():
+        base_stages = baseline.get("results", {}).get(image)
+        if not base_stages:
+            continue
+        for stage, stats in stages.items():
+            base = base_stages.get(stage)
+            if not base:
+                continue
+            now, before = stats["median"], base["median"]
+            if max(now, before) < NOISE_FLOOR_MS:
+                continue
+            if now > before * (1 + threshold):
+                change = f" (+{(now / before - 1) * 100:.0f}%)" if before else ""
+                regressions.append(f"{image}/{stage}: {before:.1f} -> {now:.1f} ms{change}")
+    return regressions
@@ -0,0 +1,129 @@
+"""
+bundle.py — Output Bundles
+Pre-rendered theme outputs per (image hash, mood), applied by atomic swaps.
+
+A bundle is a directory of rendered files plus a manifest mapping each
+file to its destination. The manifest records the palette digest and a
+stamp (resolved path, mtime, size) of every input file (templates and
+settings-base.json), so edits, or a Nix rebuild that repoints the
+template symlinks, invalidate the bundle.
+"""
+import os
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.outputs import output_inputs, render_outputs
+from core.pipeline import fingerprint
+
+MANIFEST = "manifest.json"
+BUNDLE_VERSION = 2  # 2: Noctalia variants/outline from derive.GRAPH
+
+
+def bundle_dir(bundles_root: Path, img_hash: str, mood: str) -> Path:
+    return bundles_root / img_hash / mood
+
+
+def _stamp(paths: List[Path]) -> Dict[str, Optional[list]]:
+    stamp = {}
+    for path in paths:
+        try:
+            st = path.stat()
+            stamp[str(path)] = [os.path.realpath(path), st.st_mtime_ns, st.st_size]
+        except OSError:
+            stamp[str(path)] = None
+    return stamp
+
+
+def build_bundle(target: Path, palette: Dict, template_dir: Path, config_home: Path, cache_home: Path) -> Dict:
+    """
+    Render every output for a palette into a bundle directory.
+    The bundle is assembled next to the target and swapped in at once.
+
+    Returns:
+        The written manifest
+    """
+    inputs = output_inputs(template_dir, config_home, cache_home)
+    stamp = _stamp(inputs)
+    outputs = render_outputs(palette, template_dir, config_home, cache_home)
+
+    staging = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    (staging / "files").mkdir(parents=True)
+
+    files = []
+    for i, (dest, content) in enumerate(outputs.items()):
+        name = f"{i:02d}-{dest.name}"
+        (staging / "files" / name).write_text(content)
+        files.append({"file": name, "dest": str(dest)})
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "palette": fingerprint(palette),
+        "inputs": stamp,
+        "files": files,
+    }
+    (staging / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    shutil.rmtree(target, ignore_errors=True)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(staging, target)
+    return manifest
+
+
+def load_bundle(target: Path, palette: Dict, template_dir: Path, config_home: Path, cache_home: Path) -> Optional[Dict]:
+    """Return the bundle manifest if it is complete and still current, else None."""
+    try:
+        manifest = json.loads((target / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != BUNDLE_VERSION or manifest.get("palette") != fingerprint(palette):
+        return None
+    if manifest.get("inputs") != _stamp(output_inputs(template_dir, config_home, cache_home)):
+        return None
+    if not all((target / "files" / entry["file"]).exists() for entry in manifest["files"]):
+        return None
+    return manifest
+
+
+def apply_bundle(target: Path, manifest: Dict) -> List[Path]:
+    """
+    Install every bundled file: copy next to the destination, then rename
+    over it, so readers never see a partially written file.
+    """
+    written = []
+    for entry in manifest["files"]:
+        dest = Path(entry["dest"])
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.bundle.tmp")
+        shutil.copyfile(target / "files" / entry["file"], tmp)
+        os.replace(tmp, dest)
+        written.append(dest)
+    return written
+
+
+def ensure_bundle(target: Path, palette: Dict, template_dir: Path, config_home: Path, cache_home: Path) -> bool:
+    """Build the bundle unless a current one exists. Returns True if (re)built."""
+    if load_bundle(target, palette, template_dir, config_home, cache_home):
+        return False
+    build_bundle(target, palette, template_dir, config_home, cache_home)
+    return True
+
+
+def prune_bundles(bundles_root: Path, live: Set[Tuple[str, str]]) -> int:
+    """Remove bundles whose (img_hash, mood) no longer has a stored palette."""
+    removed = 0
+    if not bundles_root.is_dir():
+        return removed
+    for hash_dir in bundles_root.iterdir():
+        if not hash_dir.is_dir():
+            continue
+        for mood_dir in hash_dir.iterdir():
+            if (hash_dir.name, mood_dir.name) not in live:
+                shutil.rmtree(mood_dir, ignore_errors=True)
+                removed += 1
+        if not any(hash_dir.iterdir()):
+            hash_dir.rmdir()
+    return removed
@@ -0,0 +1,311 @@
+"""
+cache.py — Palette Store
+Single-file SQLite (WAL) cache for generated palettes and pipeline artifacts.
+
+Replaces the legacy `palettes/{hash}/{mood}.json` directory layout.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Bump when the table layout changes (see _migrate_schema)
+SCHEMA_VERSION = 2
+
+# Eviction stops once the store is back under this fraction of the cap,
+# so a full cache does not evict on every single write.
+GC_LOW_WATER = 0.9
+
+# Config key for rows imported from the legacy tree. They predate
+# config-aware keys, so they are kept for export but never served.
+LEGACY_CONFIG = "legacy"
+
+_SCHEMA_V2 = [
+    """CREATE TABLE IF NOT EXISTS palettes (
+        img_hash TEXT NOT NULL,
+        mood     TEXT NOT NULL,
+        config   TEXT NOT NULL,
+        data     TEXT NOT NULL,
+        size     INTEGER NOT NULL,
+        source   TEXT,
+        created  REAL NOT NULL,
+        accessed REAL NOT NULL,
+        hits     INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (img_hash, mood, config)
+    )""",
+    "CREATE INDEX IF NOT EXISTS palettes_lru ON palettes(accessed)",
+    """CREATE TABLE IF NOT EXISTS artifacts (
+        key      TEXT PRIMARY KEY,
+        stage    TEXT NOT NULL,
+        img_hash TEXT NOT NULL,
+        data     BLOB NOT NULL,
+        size     INTEGER NOT NULL,
+        created  REAL NOT NULL,
+        accessed REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS artifacts_lru ON artifacts(accessed)",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+]
+
+
+class PaletteStore:
+    """
+    Indexed palette cache with last-access tracking and LRU eviction.
+
+    Palettes are keyed by (image hash, mood, config), where config is the
+    pipeline's version + config fingerprint. Intermediate stage outputs
+    (decoded buffer, saliency map, clusters) live in a separate artifacts
+    table under the same size cap.
+
+    Safe to share between threads and processes: every thread/process gets
+    its own connection and WAL mode lets readers proceed while a writer commits.
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int = 256 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._migrate_schema(self._conn())
+
+    # --- Connection Handling ---
+
+    def _conn(self) -> sqlite3.Connection:
+        """Per-thread (and per-process, after fork) connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _migrate_schema(self, conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        if version == 1:
+            # v1 rows were keyed by mood name only; keep them as legacy rows
+            conn.execute("ALTER TABLE palettes RENAME TO palettes_v1")
+            conn.execute("DROP INDEX IF EXISTS palettes_accessed")
+        for statement in _SCHEMA_V2:
+            conn.execute(statement)
+        if version == 1:
+            conn.execute(
+                """INSERT INTO palettes (img_hash, mood, config, data, size, source, created, accessed, hits)
+                   SELECT img_hash, mood, ?, data, size, source, created, accessed, hits FROM palettes_v1""",
+                (LEGACY_CONFIG,)
+            )
+            conn.execute("DROP TABLE palettes_v1")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+
+    # --- Palettes ---
+
+    def get(self, img_hash: str, mood: str, config: str) -> Optional[Dict]:
+        """Return cached palette (and bump its access time) or None."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT data FROM palettes WHERE img_hash = ? AND mood = ? AND config = ?",
+            (img_hash, mood, config)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE palettes SET accessed = ?, hits = hits + 1 WHERE img_hash = ? AND mood = ? AND config = ?",
+            (time.time(), img_hash, mood, config)
+        )
+        return json.loads(row[0])
+
+    def find(self, img_hash: str, config: str) -> Optional[Dict]:
+        """Any palette for this image + config, whatever mood name it was stored under."""
+        row = self._conn().execute(
+            "SELECT data FROM palettes WHERE img_hash = ? AND config = ? ORDER BY accessed DESC LIMIT 1",
+            (img_hash, config)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, img_hash: str, mood: str, config: str, palette: Dict, source: Optional[str] = None):
+        """Insert or replace a palette, then evict if over the size cap."""
+        data = json.dumps(palette)
+        now = time.time()
+        self._conn().execute(
+            """INSERT INTO palettes (img_hash, mood, config, data, size, source, created, accessed)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (img_hash, mood, config) DO UPDATE SET
+                   data = excluded.data, size = excluded.size,
+                   source = COALESCE(excluded.source, palettes.source),
+                   accessed = excluded.accessed""",
+            (img_hash, mood, config, data, len(data), source, now, now)
+        )
+        self._maybe_gc()
+
+    # --- Stage Artifacts ---
+
+    def get_artifact(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        row = conn.execute("SELECT data FROM artifacts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE artifacts SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put_artifact(self, key: str, stage: str, img_hash: str, data: bytes):
+        now = time.time()
+        self._conn().execute(
+            """INSERT OR REPLACE INTO artifacts (key, stage, img_hash, data, size, created, accessed)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (key, stage, img_hash, sqlite3.Binary(data), len(data), now, now)
+        )
+        self._maybe_gc()
+
+    # --- Maintenance ---
+
+    def total_bytes(self) -> int:
+        return self._conn().execute(
+            """SELECT (SELECT COALESCE(SUM(size), 0) FROM palettes)
+                    + (SELECT COALESCE(SUM(size), 0) FROM artifacts)"""
+        ).fetchone()[0]
+
+    def _maybe_gc(self):
+        if self.total_bytes() > self.max_bytes:
+            self.gc()
+
+    def gc(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Evict least-recently-used palettes and artifacts until under the cap.
+
+        Returns:
+            Number of evicted rows
+        """
+        cap = self.max_bytes if max_bytes is None else max_bytes
+        total = self.total_bytes()
+        if total <= cap:
+            return 0
+
+        target = int(cap * GC_LOW_WATER)
+        conn = self._conn()
+        victims = []
+        for table, rowid, size, _ in conn.execute(
+            """SELECT 'palettes', rowid, size, accessed FROM palettes
+               UNION ALL
+               SELECT 'artifacts', rowid, size, accessed FROM artifacts
+               ORDER BY accessed ASC"""
+        ).fetchall():
+            if total <= target:
+                break
+            victims.append((table, rowid))
+            total -= size
+
+        conn.execute("BEGIN IMMEDIATE")
+        for table in ("palettes", "artifacts"):
+            conn.executemany(
+                f"DELETE FROM {table} WHERE rowid = ?",
+                [(rowid,) for t, rowid in victims if t == table]
+            )
+        conn.execute("COMMIT")
+        return len(victims)
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        entries, images, palette_bytes, hits, oldest = conn.execute(
+            """SELECT COUNT(*), COUNT(DISTINCT img_hash), COALESCE(SUM(size), 0),
+                      COALESCE(SUM(hits), 0), MIN(accessed) FROM palettes"""
+        ).fetchone()
+        moods = dict(conn.execute("SELECT mood, COUNT(*) FROM palettes GROUP BY mood ORDER BY mood").fetchall())
+        configs = dict(conn.execute("SELECT config, COUNT(*) FROM palettes GROUP BY config ORDER BY config").fetchall())
+        artifacts = {
+            stage: {"entries": count, "bytes": size}
+            for stage, count, size in conn.execute(
+                "SELECT stage, COUNT(*), SUM(size) FROM artifacts GROUP BY stage ORDER BY stage"
+            )
+        }
+        return {
+            "path": str(self.db_path),
+            "entries": entries,
+            "images": images,
+            "bytes": self.total_bytes(),
+            "palette_bytes": palette_bytes,
+            "max_bytes": self.max_bytes,
+            "file_bytes": self.db_path.stat().st_size if self.db_path.exists() else 0,
+            "hits": hits,
+            "oldest_access": oldest,
+            "moods": moods,
+            "configs": configs,
+            "artifacts": artifacts,
+        }
+
+    def export(self) -> List[Dict]:
+        """Dump every palette row (palette + metadata) as plain dicts."""
+        rows = self._conn().execute(
+            """SELECT img_hash, mood, config, source, created, accessed, hits, data
+               FROM palettes ORDER BY img_hash, mood, config"""
+        )
+        return [
+            {
+                "hash": img_hash,
+                "mood": mood,
+                "config": config,
+                "source": source,
+                "created": created,
+                "accessed": accessed,
+                "hits": hits,
+                "palette": json.loads(data),
+            }
+            for img_hash, mood, config, source, created, accessed, hits, data in rows
+        ]
+
+    def keys(self) -> set:
+        """Every (img_hash, mood) with at least one stored palette."""
+        return set(self._conn().execute("SELECT DISTINCT img_hash, mood FROM palettes").fetchall())
+
+    def vacuum(self):
+        self._conn().execute("VACUUM")
+
+    # --- Legacy Migration ---
+
+    def migrate_legacy(self, palettes_dir: Path) -> int:
+        """
+        One-time import of the old `{hash}/{mood}.json` tree.
+
+        Returns:
+            Number of imported palettes (0 if already migrated)
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+            return 0
+
+        count = 0
+        if palettes_dir.is_dir():
+            conn.execute("BEGIN IMMEDIATE")
+            for hash_dir in palettes_dir.iterdir():
+                if not hash_dir.is_dir():
+                    continue
+                for mood_file in hash_dir.glob("*.json"):
+                    try:
+                        data = json.dumps(json.loads(mood_file.read_text()))
+                    except (OSError, ValueError):
+                        continue
+                    mtime = mood_file.stat().st_mtime
+                    conn.execute(
+                        """INSERT OR IGNORE INTO palettes (img_hash, mood, config, data, size, created, accessed)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (hash_dir.name, mood_file.stem, LEGACY_CONFIG, data, len(data), mtime, mtime)
+                    )
+                    count += 1
+            conn.execute("COMMIT")
+
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', ?)",
+            (str(time.time()),)
+        )
+        return count
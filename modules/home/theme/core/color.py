@@ -1,8 +1,10 @@
 """
 Core Color Utilities
-Native coloraide implementation (no subprocess to `pastel`).
+Native coloraide implementation (no subprocess to `pastel`), plus
+vectorized NumPy Oklab conversions for bulk work.
 """
-from typing import Tuple
+from typing import List, Tuple
+import numpy as np
 from coloraide import Color
 
 
@@ -25,3 +27,52 @@ def get_lch(hex_val: str) -> Tuple[float, float, float]:
         return l, chroma, h
     except Exception:
         return 0.0, 0.0, 0.0
+
+
+# --- Vectorized Oklab (NumPy) ---
+# Björn Ottosson's reference matrices; arrays are (..., 3) floats.
+
+_RGB_TO_LMS = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+])
+_LMS_TO_OKLAB = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+])
+_OKLAB_TO_LMS = np.linalg.inv(_LMS_TO_OKLAB)
+_LMS_TO_RGB = np.linalg.inv(_RGB_TO_LMS)
+
+
+def srgb_to_oklab(rgb: np.ndarray) -> np.ndarray:
+    """Gamma-encoded sRGB (0-1) to Oklab."""
+    rgb = np.asarray(rgb, dtype=np.float64)
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return np.cbrt(linear @ _RGB_TO_LMS.T) @ _LMS_TO_OKLAB.T
+
+
+def oklab_to_srgb(lab: np.ndarray) -> np.ndarray:
+    """Oklab to gamma-encoded sRGB, clipped to 0-1."""
+    linear = np.clip(((np.asarray(lab, dtype=np.float64) @ _OKLAB_TO_LMS.T) ** 3) @ _LMS_TO_RGB.T, 0.0, 1.0)
+    return np.where(linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055)
+
+
+def hex_to_array(hexes: List[str]) -> np.ndarray:
+    """'#rrggbb' / '#rrggbbaa' strings to an (N, 4) RGBA array (0-1)."""
+    out = np.ones((len(hexes), 4))
+    for i, h in enumerate(hexes):
+        h = h.lstrip("#")
+        channels = [int(h[j:j + 2], 16) / 255 for j in range(0, len(h), 2)]
+        out[i, :len(channels)] = channels
+    return out
+
+
+def array_to_hex(rgba: np.ndarray) -> List[str]:
+    """(N, 3|4) array (0-1) to hex; alpha is only written when below 1."""
+    values = np.rint(np.clip(rgba, 0.0, 1.0) * 255).astype(int)
+    return [
+        "#" + "".join(f"{v:02x}" for v in (row if len(row) == 4 and row[3] < 255 else row[:3]))
+        for row in values
+    ]
@@ -0,0 +1,115 @@
+"""
+compare.py — Mood Comparison
+Runs every mood against one or more images on a process pool and yields
+one result per image (palettes + timings) as soon as it is complete.
+
+Each image is decoded once in the parent; its mood groups (see
+group_moods) are then fanned out to the workers with the shared buffer.
+"""
+import time
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from core.cache import PaletteStore
+from core.pipeline import Pipeline, group_moods, image_hash
+from core.precache import make_pool, worker_pipeline
+
+
+def compare_group(img_path: str, names: List[str], img_hash: str, decoded: np.ndarray) -> Dict[str, Dict]:
+    """
+    Worker task: one mood group on a decoded image.
+    The group runs once; its wall/CPU time is charged to the mood that was computed.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        palettes, status = worker_pipeline().run_group(Path(img_path), names, img_hash=img_hash, decoded=decoded)
+    except Exception as e:
+        return {name: {"status": f"failed ({e})", "wall_ms": 0.0, "cpu_ms": 0.0, "colors": {}} for name in names}
+    wall = (time.perf_counter() - wall) * 1000
+    cpu = (time.process_time() - cpu) * 1000
+
+    results = {}
+    for name in names:
+        spent = status[name] != "aliased"
+        results[name] = {
+            "status": status[name],
+            "wall_ms": round(wall, 2) if spent else 0.0,
+            "cpu_ms": round(cpu, 2) if spent else 0.0,
+            "colors": palettes[name]["colors"],
+        }
+    return results
+
+
+def run_compare(
+    images: List[Path],
+    moods: List[str],
+    db_path: Optional[Path],
+    max_bytes: int,
+    jobs: int,
+) -> Iterator[Dict]:
+    """
+    Compare moods across images, yielding each image's record when all of
+    its moods are done (completion order, not input order).
+
+    db_path=None disables the palette store, so every mood is recomputed
+    and timings reflect the full pipeline.
+
+    Yields:
+        {"image", "hash", "decode_ms", "moods": {name: {status, wall_ms, cpu_ms, colors}}}
+    """
+    groups = list(group_moods(moods).values())
+    decoder = Pipeline(PaletteStore(db_path, max_bytes=max_bytes) if db_path else None)
+    # Bound decoded buffers held in the task queue
+    max_in_flight = max(2, jobs * 2)
+
+    records: Dict[Path, Dict] = {}
+    remaining: Dict[Path, int] = {}
+    futures = {}
+
+    def reap(done) -> Iterator[Dict]:
+        for future in done:
+            img = futures.pop(future)
+            records[img]["moods"].update(future.result())
+            remaining[img] -= 1
+            if remaining[img] == 0:
+                del remaining[img]
+                record = records.pop(img)
+                record["moods"] = dict(sorted(record["moods"].items()))
+                yield record
+
+    executor = make_pool(db_path, max_bytes, jobs)
+    try:
+        for img in images:
+            while len(remaining) >= max_in_flight:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                yield from reap(done)
+
+            start = time.perf_counter()
+            try:
+                img_hash = image_hash(str(img))
+                decoded = decoder.decode(img, img_hash)
+            except Exception as e:
+                yield {"image": str(img), "hash": None, "decode_ms": 0.0, "moods": {}, "error": str(e)}
+                continue
+            records[img] = {
+                "image": str(img),
+                "hash": img_hash,
+                "decode_ms": round((time.perf_counter() - start) * 1000, 2),
+                "moods": {},
+            }
+            remaining[img] = len(groups)
+            for names in groups:
+                futures[executor.submit(compare_group, str(img), names, img_hash, decoded)] = img
+
+            # Stream anything that finished meanwhile
+            done, _ = wait(futures, timeout=0)
+            yield from reap(done)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            yield from reap(done)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,290 @@
+"""
+derive.py — Derived Colors
+Declarative graph of every color computed from the generator's base roles.
+
+Each key names its inputs and a transform. A request for some keys plans
+the needed subgraph in topological order and evaluates each node once;
+color conversions (hex -> Color/Oklch/luminance) are memoized for the pass.
+Consumers (palette schema, Noctalia, Antigravity) only map their own
+names onto graph keys, so nothing they don't use is computed.
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from coloraide import Color
+
+# Generator output roles, with the fallbacks used when one is missing
+BASE_DEFAULTS = {
+    "anchor": "#000000",
+    "bg_base": "#000000",
+    "fg_base": "#ffffff",
+    "primary": "#888888",
+    "secondary": "#666666",
+    "error": "#ff0000",
+    "success": "#00ff00",
+    "warning": "#ffff00",
+    "tertiary": "#0000ff",
+}
+
+
+class Derivations:
+    """Memoized color operations for one evaluation pass."""
+
+    def __init__(self):
+        self._colors: Dict[str, Color] = {}
+        self._oklch: Dict[str, Tuple[float, float, float]] = {}
+        self._luminance: Dict[str, float] = {}
+        self._results: Dict[tuple, str] = {}
+
+    def color(self, value: str) -> Color:
+        """Parsed color (shared: clone before mutating)."""
+        c = self._colors.get(value)
+        if c is None:
+            c = self._colors[value] = Color(value)
+        return c
+
+    def oklch(self, value: str) -> Tuple[float, float, float]:
+        coords = self._oklch.get(value)
+        if coords is None:
+            coords = self._oklch[value] = tuple(self.color(value).convert("oklch").coords())
+        return coords
+
+    def luminance(self, value: str) -> float:
+        lum = self._luminance.get(value)
+        if lum is None:
+            lum = self._luminance[value] = self.color(value).luminance()
+        return lum
+
+    def _memo(self, key: tuple, compute: Callable[[], str]) -> str:
+        result = self._results.get(key)
+        if result is None:
+            result = self._results[key] = compute()
+        return result
+
+    # --- Transforms (color string in, hex out) ---
+
+    def sanitize(self, value: str) -> str:
+        """Normalize CSS color functions (oklch(...), rgb(...)) to hex."""
+        if isinstance(value, str) and (value.startswith("oklch") or value.startswith("rgb") or "(" in value):
+            try:
+                return self.color(value).convert("srgb").to_string(hex=True)
+            except Exception:
+                return value
+        return value
+
+    def shift(self, value: str, delta: float) -> str:
+        """Oklch lightness + delta (clamped), gamut-fitted hex (alpha kept: #RRGGBBAA if translucent)."""
+        def compute():
+            l, c, h = self.oklch(value)
+            shifted = Color("oklch", [max(0.0, min(1.0, l + delta)), c, h], self.color(value).alpha())
+            return shifted.convert("srgb").to_string(hex=True)
+        return self._memo(("shift", value, delta), compute)
+
+    def set_lightness(self, value: str, fn: Callable[[float], float], tag: str) -> str:
+        """Oklch lightness through fn, converted in place (the palette surface recipe)."""
+        return self._memo(("lightness", value, tag),
+                          lambda: self.color(value).clone().set("oklch.l", fn).to_string(hex=True))
+
+    def alpha(self, value: str, alpha: float) -> str:
+        """CSS-style #RRGGBBAA."""
+        return self._memo(("alpha", value, alpha),
+                          lambda: self.color(value).clone().set("alpha", alpha).to_string(hex=True))
+
+    def qt_alpha(self, value: str, alpha: float) -> str:
+        """Qt/QML-style #AARRGGBB."""
+        clean = value.lstrip("#")
+        if len(clean) != 6:
+            return value
+        return f"#{int(alpha * 255):02x}{clean}"
+
+    def on_color(self, value: str) -> str:
+        """Accessible text color on top of `value` (white or black)."""
+        return self._memo(("on", value),
+                          lambda: "#ffffff" if self.color(value).contrast("#ffffff") >= 4.5 else "#000000")
+
+    def is_dark(self, value: str) -> bool:
+        return self.luminance(value) < 0.5
+
+
+@dataclass(frozen=True)
+class Node:
+    inputs: Tuple[str, ...]
+    transform: Callable  # (Derivations, *input values) -> str
+
+
+def alias(key: str) -> Node:
+    return Node((key,), lambda d, v: v)
+
+
+def _surface_shift(dark_delta: float, light_delta: float, clamp: bool) -> Callable:
+    """The palette surface recipe: lightness +/- delta depending on bg darkness."""
+    def transform(d: Derivations, bg: str) -> str:
+        if d.is_dark(bg):
+            fn = (lambda l: max(0, l + dark_delta)) if clamp else (lambda l: l + dark_delta)
+            return d.set_lightness(bg, fn, f"dark{dark_delta}")
+        fn = (lambda l: min(1, l + light_delta)) if clamp else (lambda l: l + light_delta)
+        return d.set_lightness(bg, fn, f"light{light_delta}")
+    return transform
+
+
+GRAPH: Dict[str, Node] = {
+    # Palette roles (V1 system keys)
+    "bg": Node(("bg_base",), lambda d, v: v),
+    "fg": Node(("fg_base",), lambda d, v: v),
+    "ui_prim": Node(("primary",), lambda d, v: v),
+    "ui_sec": Node(("secondary",), lambda d, v: v),
+    "sem_red": Node(("error",), lambda d, v: v),
+    "sem_green": Node(("success",), lambda d, v: v),
+    "sem_yellow": Node(("warning",), lambda d, v: v),
+    "sem_blue": Node(("tertiary",), lambda d, v: v),
+
+    # Surfaces: lighter than bg on dark themes, darker on light ones
+    "surface": Node(("bg",), _surface_shift(0.05, -0.05, clamp=False)),
+    "surfaceLighter": Node(("bg",), _surface_shift(0.10, -0.10, clamp=False)),
+    "surfaceDarker": Node(("bg",), _surface_shift(-0.02, 0.02, clamp=True)),
+
+    # Text variants
+    "fg_dim": Node(("fg",), lambda d, v: d.alpha(v, 0.7)),
+    "fg_muted": Node(("fg",), lambda d, v: d.alpha(v, 0.4)),
+
+    # Syntax / text aliases
+    "syn_key": alias("ui_prim"),
+    "syn_str": alias("sem_green"),
+    "syn_fun": alias("sem_blue"),
+    "syn_acc": alias("sem_red"),
+    "text": alias("fg"),
+    "textDim": alias("fg_dim"),
+    "textMuted": alias("fg_muted"),
+
+    # Contrast text on accents
+    "on_prim": Node(("ui_prim",), lambda d, v: d.on_color(v)),
+    "on_sec": Node(("ui_sec",), lambda d, v: d.on_color(v)),
+    "on_acc": Node(("syn_acc",), lambda d, v: d.on_color(v)),
+    "on_red": Node(("sem_red",), lambda d, v: d.on_color(v)),
+
+    # Shell (Qt) surfaces
+    "bg_raised": Node(("bg",), lambda d, v: d.shift(v, 0.05)),
+    "fg_variant": Node(("fg",), lambda d, v: d.shift(v, -0.1)),
+    "outline": Node(("bg",), lambda d, v: d.shift(v, 0.15)),
+    "qt_surface": Node(("bg",), lambda d, v: d.qt_alpha(v, 0.85)),
+    "qt_surface_variant": Node(("bg_raised",), lambda d, v: d.qt_alpha(v, 0.75)),
+    "shadow": Node((), lambda d: "#000000"),
+}
+
+# --- Consumers: output name -> graph key ---
+
+# Palette schema (palette.json, astal, templates); order = JSON key order
+PALETTE_KEYS = [
+    "anchor", "bg", "fg", "ui_prim", "ui_sec",
+    "sem_red", "sem_green", "sem_yellow", "sem_blue",
+    "surface", "surfaceLighter", "surfaceDarker",
+    "fg_dim", "fg_muted",
+    "syn_key", "syn_str", "syn_fun", "syn_acc",
+    "text", "textDim", "textMuted",
+]
+
+# Noctalia shell (MD3-style names)
+NOCTALIA = {
+    "mPrimary": "ui_prim",
+    "mOnPrimary": "on_prim",
+    "mSecondary": "ui_sec",
+    "mOnSecondary": "on_sec",
+    "mTertiary": "syn_acc",
+    "mOnTertiary": "on_acc",
+    "mError": "sem_red",
+    "mOnError": "on_red",
+    "mSurface": "qt_surface",
+    "mOnSurface": "fg",
+    "mSurfaceVariant": "qt_surface_variant",
+    "mOnSurfaceVariant": "fg_variant",
+    "mOutline": "outline",
+    "mShadow": "shadow",
+    "mHover": "syn_acc",
+    "mOnHover": "on_acc",
+}
+
+# Antigravity (VS Code) workbench.colorCustomizations
+ANTIGRAVITY = {
+    "activityBar.background": "ui_sec",
+    "activityBar.foreground": "fg",
+    "editor.background": "bg",
+    "editor.foreground": "fg",
+    "statusBar.background": "ui_sec",
+    "sideBar.background": "bg",
+    "titleBar.activeBackground": "bg",
+    "terminal.background": "bg",
+}
+
+
+def plan(requested: Iterable[str], given: Iterable[str]) -> List[str]:
+    """
+    Graph keys to compute, in topological order, for `requested`.
+    Keys present in `given` are leaves (used as-is, never recomputed).
+
+    Raises:
+        ValueError: on a dependency cycle
+    """
+    given = set(given)
+    order: List[str] = []
+    state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+    def visit(key: str):
+        if key in given or state.get(key) == 2:
+            return
+        if state.get(key) == 1:
+            raise ValueError(f"Derived color cycle at {key!r}")
+        node = GRAPH.get(key)
+        if node is None:
+            return  # Base role: taken from given or BASE_DEFAULTS
+        state[key] = 1
+        for dep in node.inputs:
+            visit(dep)
+        state[key] = 2
+        order.append(key)
+
+    for key in requested:
+        visit(key)
+    return order
+
+
+def resolve(given: Dict[str, str], requested: Iterable[str],
+            derivations: Optional[Derivations] = None) -> Dict[str, str]:
+    """
+    Evaluate graph keys from known values.
+
+    A node whose transform fails is left out, along with everything that
+    depends on it (matching the old best-effort derivations).
+
+    Returns:
+        dict of requested key -> hex (in request order)
+    """
+    d = derivations or Derivations()
+    requested = list(requested)
+    values: Dict[str, str] = {}
+
+    def value(key: str) -> Optional[str]:
+        if key in values:
+            return values[key]
+        if key in given:
+            values[key] = given[key]
+        elif key not in GRAPH and key in BASE_DEFAULTS:
+            values[key] = BASE_DEFAULTS[key]
+        return values.get(key)
+
+    for key in plan(requested, given):
+        inputs = [value(dep) for dep in GRAPH[key].inputs]
+        if any(v is None for v in inputs):
+            continue
+        try:
+            values[key] = GRAPH[key].transform(d, *inputs)
+        except Exception:
+            pass
+
+    # Transforms see inputs as given; only outputs are normalized to hex
+    return {key: d.sanitize(value(key)) for key in requested if value(key) is not None}
+
+
+def resolve_mapping(given: Dict[str, str], mapping: Dict[str, str],
+                    derivations: Optional[Derivations] = None) -> Dict[str, str]:
+    """Evaluate a consumer mapping (output name -> graph key)."""
+    values = resolve(given, dict.fromkeys(mapping.values()), derivations)
+    return {name: values[key] for name, key in mapping.items() if key in values}
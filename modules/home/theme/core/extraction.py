@@ -11,6 +11,8 @@ import numpy as np
 from sklearn.cluster import KMeans
 from coloraide import Color
 
+from core.profiler import span, timed
+
 @dataclass
 class ExtractionConfig:
     downsample_size: int = 128
@@ -24,6 +26,7 @@ class SaliencyExtractor:
     def __init__(self, config: ExtractionConfig):
         self.config = config
 
+    @timed("saliency")
     def get_saliency_map(self, img: np.ndarray) -> np.ndarray:
         """
         Compute saliency map from image.
@@ -88,25 +91,39 @@ class PerceptualExtractor:
         Returns:
             dict containing anchor, palette, weights
         """
+        img_rgb = self.load_rgb(image_source)
+        if img_rgb is None:
+            return {"anchor": "#000000", "palette": ["#000000"], "weights": [1.0]}
+        
+        # 1. Get Saliency Map
+        weights_map = self.saliency.get_saliency_map(img_rgb)
+        
+        return self.cluster(img_rgb, weights_map)
+
+    def load_rgb(self, image_source) -> Optional[np.ndarray]:
+        """Normalize a path or array source to Uint8 RGB (None if unreadable)."""
         # Load image if path
         if isinstance(image_source, str):
             img_bgr = cv2.imread(image_source)
             if img_bgr is None:
-                return {"anchor": "#000000", "palette": ["#000000"], "weights": [1.0]}
-            img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        else:
-            # Assume input is numpy array
-            # If float (0-1) from MoodEngine, convert to uint8 0-255 for OpenCV processing
-            if image_source.dtype == np.float32 or image_source.dtype == np.float64:
-                # Expect RGB 0-1
-                img_rgb = (image_source * 255).astype(np.uint8)
-            else:
-                # Assume Uint8 RGB (Standard Pillow/OpenCV)
-                img_rgb = image_source
-        
-        # 1. Get Saliency Map
-        weights_map = self.saliency.get_saliency_map(img_rgb)
+                return None
+            return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+        
+        # Assume input is numpy array
+        # If float (0-1) from MoodEngine, convert to uint8 0-255 for OpenCV processing
+        if image_source.dtype == np.float32 or image_source.dtype == np.float64:
+            # Expect RGB 0-1
+            return (image_source * 255).astype(np.uint8)
+        # Assume Uint8 RGB (Standard Pillow/OpenCV)
+        return image_source
+
+    def cluster(self, img_rgb: np.ndarray, weights_map: np.ndarray) -> Dict:
+        """
+        Saliency-weighted K-Means on a Uint8 RGB image.
         
+        Returns:
+            dict containing anchor, palette, weights
+        """
         # 2. Reshape Image to Match Saliency
         # Downsample image to same size as saliency map for clustering
         small_img = cv2.resize(img_rgb, (weights_map.shape[1], weights_map.shape[0]), interpolation=cv2.INTER_AREA)
@@ -146,7 +163,8 @@ class PerceptualExtractor:
             n_init=3, # Lower n_init for speed, 3 is usually enough
             random_state=42
         )
-        kmeans.fit(pixels_oklab, sample_weight=weights_valid)
+        with span("kmeans"):
+            kmeans.fit(pixels_oklab, sample_weight=weights_valid)
         
         centers_oklab = kmeans.cluster_centers_
         labels = kmeans.labels_
@@ -173,6 +191,7 @@ class PerceptualExtractor:
             "weights": sorted_scores.tolist()
         }
 
+    @timed("oklab")
     def _rgb_to_oklab_batch(self, rgb_arr: np.ndarray) -> np.ndarray:
         """Batch convert RGB (0-1) to Oklab using coloraide."""
         # Note: Ideally we'd use a numpy vectorized formula here for speed.
@@ -0,0 +1,176 @@
+"""
+fidelity.py — Fast-Path Fidelity Harness
+Runs the reference pipeline and a candidate configuration side by side and
+measures how far the candidate's palettes drift.
+
+Candidates are expressed as overrides of the pipeline knobs, e.g.
+`decode_size=256` or `extraction.k_clusters=6`; new ExtractionConfig
+fields are picked up automatically.
+"""
+import time
+import warnings
+from dataclasses import fields, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from coloraide import Color
+
+from core.extraction import ExtractionConfig
+from core.pipeline import DECODE_SIZE, Pipeline
+
+# Opaque palette roles (aliases and alpha variants follow these)
+ROLES = [
+    "anchor", "bg", "fg", "ui_prim", "ui_sec",
+    "sem_red", "sem_green", "sem_yellow", "sem_blue",
+    "surface", "surfaceLighter", "surfaceDarker",
+]
+
+# Anchors closer than this (ΔE2000) count as the same color
+ANCHOR_JND = 1.0
+
+DEFAULT_GATES = {
+    "max_de2000_p95": 2.0,
+    "max_deok_p95": 0.02,
+    "min_anchor_match": 0.9,
+    "min_template_agreement": 0.9,
+    "min_speedup": None,
+}
+
+
+def _coerce(default, raw: str):
+    if isinstance(default, bool):
+        if raw.lower() not in ("1", "0", "true", "false", "yes", "no"):
+            raise ValueError(f"Expected a boolean, got {raw!r}")
+        return raw.lower() in ("1", "true", "yes")
+    return type(default)(raw)
+
+
+def parse_overrides(items: List[str]) -> Dict:
+    """
+    Parse `key=value` overrides into Pipeline keyword arguments.
+
+    Raises:
+        ValueError: on unknown keys or unparsable values
+    """
+    decode_size = DECODE_SIZE
+    extraction = ExtractionConfig()
+    known = {f.name for f in fields(ExtractionConfig)}
+
+    for item in items:
+        key, sep, raw = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got {item!r}")
+        if key == "decode_size":
+            decode_size = int(raw)
+        elif key.startswith("extraction.") and key.split(".", 1)[1] in known:
+            name = key.split(".", 1)[1]
+            extraction = replace(extraction, **{name: _coerce(getattr(extraction, name), raw)})
+        else:
+            options = ["decode_size"] + [f"extraction.{name}" for name in sorted(known)]
+            raise ValueError(f"Unknown override {key!r}. Available: {', '.join(options)}")
+
+    return {"extraction": extraction, "decode_size": decode_size}
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"mean": 0.0, "median": 0.0, "p95": 0.0, "max": 0.0}
+    arr = np.array(values)
+    return {
+        "mean": round(float(arr.mean()), 4),
+        "median": round(float(np.median(arr)), 4),
+        "p95": round(float(np.percentile(arr, 95)), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+
+def run_fidelity(
+    images: List[Path],
+    moods: List[str],
+    overrides: List[str],
+    on_result: Optional[Callable[[Path, str, Dict], None]] = None,
+) -> Dict:
+    """
+    Reference vs candidate over every (image, mood), uncached.
+
+    Returns:
+        report with per-role ΔE2000/ΔEOK distributions, anchor-match and
+        template-agreement rates and the speedup (reference time / candidate time)
+    """
+    from sklearn.exceptions import ConvergenceWarning
+    warnings.filterwarnings("ignore", category=ConvergenceWarning)
+
+    reference = Pipeline(store=None)
+    candidate = Pipeline(store=None, **parse_overrides(overrides))
+
+    # Warm imports/JIT paths so neither side pays them in the timings
+    if images and moods:
+        reference.run(images[0], moods[0], img_hash="warmup")
+        candidate.run(images[0], moods[0], img_hash="warmup")
+
+    deltas = {role: {"de2000": [], "deok": []} for role in ROLES}
+    anchor_matches = template_matches = samples = 0
+    ref_time = cand_time = 0.0
+
+    for img in images:
+        for mood in moods:
+            start = time.perf_counter()
+            ref = reference.run(img, mood, img_hash="reference")
+            ref_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cand = candidate.run(img, mood, img_hash="candidate")
+            cand_time += time.perf_counter() - start
+
+            record = {}
+            for role in ROLES:
+                a, b = Color(ref["colors"][role]), Color(cand["colors"][role])
+                de2000, deok = a.delta_e(b, method="2000"), a.delta_e(b, method="ok")
+                deltas[role]["de2000"].append(de2000)
+                deltas[role]["deok"].append(deok)
+                record[role] = de2000
+
+            samples += 1
+            anchor_matches += record["anchor"] <= ANCHOR_JND
+            template_matches += ref["harmonic_template"] == cand["harmonic_template"]
+            if on_result:
+                on_result(img, mood, {
+                    "max_de2000": max(record.values()),
+                    "worst_role": max(record, key=record.get),
+                    "template": (ref["harmonic_template"], cand["harmonic_template"]),
+                })
+
+    pooled = {metric: [v for role in ROLES for v in deltas[role][metric]] for metric in ("de2000", "deok")}
+    return {
+        "candidate": overrides,
+        "images": [str(p) for p in images],
+        "moods": moods,
+        "samples": samples,
+        "roles": {role: {metric: _stats(v) for metric, v in d.items()} for role, d in deltas.items()},
+        "overall": {metric: _stats(v) for metric, v in pooled.items()},
+        "anchor_match": anchor_matches / samples if samples else 0.0,
+        "template_agreement": template_matches / samples if samples else 0.0,
+        "reference_s": round(ref_time, 3),
+        "candidate_s": round(cand_time, 3),
+        "speedup": ref_time / cand_time if cand_time else 0.0,
+    }
+
+
+def check_gates(report: Dict, gates: Dict) -> List[str]:
+    """Failed quality gates (empty list = pass). Gates set to None are skipped."""
+    checks = [
+        ("max_de2000_p95", report["overall"]["de2000"]["p95"], "ΔE2000 p95", False),
+        ("max_deok_p95", report["overall"]["deok"]["p95"], "ΔEOK p95", False),
+        ("min_anchor_match", report["anchor_match"], "anchor match", True),
+        ("min_template_agreement", report["template_agreement"], "template agreement", True),
+        ("min_speedup", report["speedup"], "speedup", True),
+    ]
+    failures = []
+    for gate, value, label, at_least in checks:
+        limit = gates.get(gate)
+        if limit is None:
+            continue
+        if (value < limit) if at_least else (value > limit):
+            failures.append(f"{label} {value:.4g} {'<' if at_least else '>'} {limit:g}")
+    return failures
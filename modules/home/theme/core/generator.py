@@ -9,6 +9,8 @@ from typing import List, Tuple, Dict, Optional
 import numpy as np
 from coloraide import Color
 
+from core.profiler import timed
+
 # -------------------------------------------------------------------------
 # 1. Harmonic Templates (Matsuda 1995)
 # -------------------------------------------------------------------------
@@ -169,6 +171,7 @@ class PaletteGenerator:
         d = abs(a - b)
         return min(d, 360 - d)
 
+    @timed("template_fit")
     def _fit_template(self, hues: List[float], weights: List[float]) -> Tuple[HarmonicTemplate, float]:
         """Finds the template and rotation that minimizes exclusion cost."""
         best_t = self.templates[0]
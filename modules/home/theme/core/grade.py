@@ -0,0 +1,50 @@
+"""
+grade.py — Wallpaper Grading
+Applies the mood grade to the full-resolution wallpaper, so moods like
+`deep` or `nord` show on screen and not only in the extracted palette
+(extraction grades a 512px thumbnail).
+
+The mood's LUT runs through Pillow's Color3DLUT band by band on a thread
+pool (see tiles.py). Results are cached by (image hash, mood config).
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from core.mood import DISPLAY_LUT_SIZE, MoodConfig, MoodEngine
+from core.pipeline import fingerprint
+from core.profiler import span
+from core.tiles import load_rgb, map_tiles, save_rgb
+
+# Bump when grading output changes (invalidates cached images)
+GRADE_VERSION = 1
+
+
+def graded_path(cache_dir: Path, img_hash: str, config: MoodConfig) -> Path:
+    return cache_dir / f"{img_hash}-{fingerprint(GRADE_VERSION, DISPLAY_LUT_SIZE, config)}.jpg"
+
+
+def grade_array(rgb: np.ndarray, config: MoodConfig, threads: Optional[int] = None) -> np.ndarray:
+    """Grade a full-resolution uint8 RGB image."""
+    table = MoodEngine(config).pillow_lut(DISPLAY_LUT_SIZE)
+    return map_tiles(rgb, lambda tile, y0: np.asarray(Image.fromarray(tile).filter(table)), threads)
+
+
+def ensure_graded(img_path: Path, img_hash: str, config: MoodConfig, cache_dir: Path,
+                  threads: Optional[int] = None) -> Path:
+    """Graded wallpaper for (image, mood config), built on first use."""
+    dest = graded_path(cache_dir, img_hash, config)
+    if dest.exists():
+        os.utime(dest)  # LRU order for tiles.prune_cache
+        return dest
+
+    with span("grade:decode"):
+        rgb = load_rgb(img_path)
+    with span("grade:map", mood=config.name, pixels=int(rgb.shape[0] * rgb.shape[1])):
+        out = grade_array(rgb, config, threads)
+    with span("grade:encode"):
+        save_rgb(out, dest)
+    return dest
@@ -1,147 +1,513 @@
 """
 Icon Tinting Module
 Replaces icon-tinter.sh
+
+Icons are rasterized by `magick` in batches (one process per RASTER_BATCH
+icons, raw RGBA on stdout); everything after that runs in NumPy: the
+color-independent mask (background flood fill, alpha erosion + blur,
+grayscale) is computed once per icon and then tinted for every color with
+an Overlay blend and the mask's alpha.
+
+Masks are cached in masks/ (uint8 gray + alpha, keyed by source path and
+mtime), so a palette change only runs the Overlay and the PNG encode.
+Tinted icons live in tinted/<color signature>/, one directory per color,
+so switching back to a previous palette is a manifest rewrite. With
+`atlas=True` each color directory also gets atlas.png + atlas.json (one
+packed image, name -> [x, y, w, h]) for consumers that prefer one decode.
+tint_icon() serves a single icon on demand (`magician icon`, see
+icon_command), so the full batch can run in the background at low priority
+(`magician icons --background`). That path stays light: a cached icon
+costs a few stats, and no pipeline/extraction module is imported.
 """
 import os
+import sys
+import argparse
+import fcntl
 import json
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
+from typing import Dict, List, Optional, Set
+
+import blake3
+import numpy as np
+from PIL import Image
+
+from core.color import hex_to_array
+from core.tiles import default_threads
 
 CACHE_DIR = Path(os.environ.get("HOME", "")) / ".cache" / "lis-icons"
 MAP_FILE = CACHE_DIR / "index.map"
 MANIFEST_FILE = CACHE_DIR / "manifest.json"
-COLOR_LOCK = CACHE_DIR / "colors.lock"
+MANIFEST_LOCK = CACHE_DIR / "manifest.lock"  # Batch and on-demand requests both write the manifest
+BATCH_LOCK = CACHE_DIR / "batch.lock"  # One full batch at a time (see batch_lock)
+PALETTE_FILE = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "theme-engine" / "palette.json"
+ICON_ROLES = {"primary": "ui_prim", "accent": "syn_acc"}  # Icon tint role -> palette key
+MASK_DIR = CACHE_DIR / "masks"
+TINTED_DIR = CACHE_DIR / "tinted"  # One directory per color, see tinted_dir()
+TINTED_MAX_MB = 64  # Least-recently-used color directories are evicted beyond this
+ATLAS_COLUMNS = 16  # Atlas grid width in icons (rows grow as icons are added)
+
+# Bump when the mask pipeline changes (invalidates cached masks)
+MASK_VERSION = 1
+
+ICON_SIZE = 128
+RASTER_DENSITY = 384
+RASTER_BATCH = 32  # Icons per magick process
+FLOOD_FUZZ = 0.10  # Background flood fill tolerance (RMS over RGBA, 0-1)
 
 def resolve_icons():
     """
     Call resolve-icons script to build the icon map.
-    Writes output to MAP_FILE.
+    It writes MAP_FILE itself, only when the map changed (incremental,
+    cheap enough to run every time).
     """
     try:
-        with open(MAP_FILE, 'w') as f:
-            result = subprocess.run(
-                ["resolve-icons"], 
-                stdout=f, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            if result.returncode != 0:
-                print(f"Warning: resolve-icons failed: {result.stderr}")
+        result = subprocess.run(
+            ["resolve-icons", "--output", str(MAP_FILE)], 
+            stdout=subprocess.DEVNULL, 
+            stderr=subprocess.PIPE, 
+            text=True
+        )
+        if result.returncode != 0:
+            print(f"Warning: resolve-icons failed: {result.stderr}")
     except FileNotFoundError:
-        print("Error: resolve-icons not found in PATH. Icon tinting skipped.")
+        print("Error: resolve-icons not found in PATH. Keeping the existing icon map.")
     except Exception as e:
         print(f"Error running resolve-icons: {e}")
 
-def tint_worker(args):
-    """
-    Worker for tinting a single icon. 
-    args: (src_path, dest_prim, dest_acc, prim_hex, acc_hex)
-    """
-    src, dest_prim, dest_acc, prim, acc = args
-    
-    # Base command parts
-    # We use magick command from icon-tinter.sh
-    
-    def build_cmd(color_hex, dest_path):
-        return [
-            "magick", "-density", "384", "-background", "none", src,
-            "-resize", "128x128", "-gravity", "center", "-extent", "128x128",
-            "-fuzz", "10%", "-fill", "none", "-draw", "alpha 0,0 floodfill",
-            "-channel", "alpha", "-morphology", "Erode", "Disk:1", "-blur", "0x0.5",
-            "-channel", "RGB", "-colorspace", "gray", "-colorspace", "sRGB",
-            "(", "+clone", "-fill", color_hex, "-colorize", "100", ")", "-compose", "Overlay", "-composite",
-            "(", "+clone", "-alpha", "extract", ")", "-compose", "DstIn", "-composite",
-            str(dest_path)
-        ]
-    
-    cmd_prim = build_cmd(prim, dest_prim)
-    cmd_acc = build_cmd(acc, dest_acc)
-    
+MAGICK_MISSING = "`magick` (ImageMagick) not found in PATH: new icons cannot be rasterized"
+
+def rasterize(sources: List[str]) -> List[Optional[np.ndarray]]:
+    """
+    Rasterize icons to ICON_SIZE² uint8 RGBA (fit + centered on transparent)
+    with a single magick call. A failing file fails the whole call, so the
+    batch is bisected until the bad icon is isolated (None).
+    """
+    if not sources:
+        return []
+    frame = ICON_SIZE * ICON_SIZE * 4
+    cmd = [
+        "magick", "-density", str(RASTER_DENSITY), "-background", "none",
+        *[f"{src}[0]" for src in sources],
+        "-resize", f"{ICON_SIZE}x{ICON_SIZE}", "-gravity", "center", "-extent", f"{ICON_SIZE}x{ICON_SIZE}",
+        "-depth", "8", "RGBA:-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode == 0 and len(result.stdout) == frame * len(sources):
+        data = np.frombuffer(result.stdout, dtype=np.uint8)
+        return list(data.reshape(len(sources), ICON_SIZE, ICON_SIZE, 4))
+    if len(sources) == 1:
+        print(f"Error rasterizing {sources[0]}: {result.stderr.decode(errors='replace').strip()}")
+        return [None]
+    mid = len(sources) // 2
+    return rasterize(sources[:mid]) + rasterize(sources[mid:])
+
+def icon_mask(rgba: np.ndarray) -> np.ndarray:
+    """
+    Color-independent part of the tint (the old magick chain): flood-fill the
+    background from the top-left corner to transparent, erode the alpha by a
+    1px disk and blur it (σ 0.5), convert the color to grayscale (Rec. 709).
+
+    Returns:
+        (2, ICON_SIZE, ICON_SIZE) uint8: gray, alpha
+    """
+    from scipy import ndimage  # Only needed on a mask miss (keeps `magician icon` light)
+
+    px = rgba.astype(np.float32) / 255.0
+
+    # Background: pixels connected to (0,0) within FLOOD_FUZZ of its color
+    close = np.sqrt(((px - px[0, 0]) ** 2).mean(axis=-1)) <= FLOOD_FUZZ
+    labels, _ = ndimage.label(close)
+    alpha = px[..., 3].copy()
+    alpha[labels == labels[0, 0]] = 0.0
+
+    alpha = ndimage.grey_erosion(alpha, footprint=ndimage.generate_binary_structure(2, 1))  # Disk:1
+    alpha = ndimage.gaussian_filter(alpha, sigma=0.5)
+    gray = px[..., :3] @ np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+    return np.rint(np.clip(np.stack([gray, alpha]), 0.0, 1.0) * 255).astype(np.uint8)
+
+def signature(*parts) -> str:
+    """Short stable hash of plain values (same digest as pipeline.fingerprint)."""
+    return blake3.blake3(json.dumps(list(parts), sort_keys=True).encode()).hexdigest()[:12]
+
+def mask_path(src: str) -> Optional[Path]:
+    """Cache file for the mask of `src` at its current mtime (None if unreadable)."""
+    try:
+        mtime = os.stat(src).st_mtime_ns
+    except OSError:
+        return None
+    return MASK_DIR / f"{signature(MASK_VERSION, ICON_SIZE, src, mtime)}.npy"
+
+def failed_path(mask: Path) -> Path:
+    """Marker for a source that could not be masked (same key: retried once the source changes)."""
+    return mask.with_suffix(".failed")
+
+def mask_worker(items) -> int:
+    """
+    Worker for building the masks of a batch of icons.
+    items: [(src_path, mask_path)]
+    """
+    rasters = rasterize([src for src, _ in items])
+    done = 0
+    for (src, dest), rgba in zip(items, rasters):
+        try:
+            if rgba is None:
+                raise ValueError("rasterization failed")
+            # Per-process temp name (on-demand requests may race the batch);
+            # the mask GC only touches *.npy / *.failed
+            tmp = dest.with_name(f"{dest.stem}.{os.getpid()}.tmp")
+            with open(tmp, 'wb') as f:
+                np.save(f, icon_mask(rgba))
+            os.replace(tmp, dest)
+            done += 1
+        except Exception as e:
+            if rgba is not None:
+                print(f"Error masking {src}: {e}")
+            failed_path(dest).touch()
+    return done
+
+def tint(mask: np.ndarray, color_hex: str) -> np.ndarray:
+    """Overlay a solid color on an icon_mask() and apply its alpha (uint8 RGBA)."""
+    color = hex_to_array([color_hex])[0, :3].astype(np.float32)
+    g = mask[0, ..., None].astype(np.float32) / 255.0
+    rgb = np.where(g <= 0.5, 2.0 * g * color, 1.0 - 2.0 * (1.0 - g) * (1.0 - color))
+    rgb = np.rint(np.clip(rgb, 0.0, 1.0) * 255).astype(np.uint8)
+    return np.concatenate([rgb, mask[1, ..., None]], axis=-1)
+
+def tinted_dir(color_hex: str) -> Path:
+    """Content-addressed output directory for one tint color."""
+    return TINTED_DIR / signature(MASK_VERSION, ICON_SIZE, color_hex.lower())
+
+def active_tinted() -> Set[Path]:
+    """Color directories the current manifest points at."""
+    try:
+        manifest = json.loads(MANIFEST_FILE.read_text())
+    except (OSError, ValueError):
+        return set()
+    return {Path(path).parent for icons in manifest.values() for path in icons.values()}
+
+def prune_tinted(max_bytes: int, keep: Optional[Set[Path]] = None) -> int:
+    """
+    Evict least recently used (mtime) color directories until TINTED_DIR
+    fits `max_bytes`. Directories in `keep` (default: the manifest's) stay.
+    """
+    if not TINTED_DIR.is_dir():
+        return 0
+    keep = active_tinted() if keep is None else keep
+    dirs = []
+    for folder in TINTED_DIR.iterdir():
+        if folder.is_dir():
+            size = sum(f.stat().st_size for f in folder.iterdir() if f.is_file())
+            dirs.append((folder.stat().st_mtime, size, folder))
+
+    total = sum(size for _, size, _ in dirs)
+    removed = 0
+    for _, size, folder in sorted(dirs):
+        if total <= max_bytes:
+            break
+        if folder in keep:
+            continue
+        shutil.rmtree(folder, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+def tint_one(mask_file: Path, targets: List[tuple]):
+    """Tint one cached mask in every (color_hex, dest_png) target."""
+    mask = np.load(mask_file)
+    for color_hex, dest in targets:
+        # Atomic: on-demand requests and the background batch may race
+        tmp = dest.with_name(f"{dest.stem}.{os.getpid()}.tmp.png")
+        Image.fromarray(tint(mask, color_hex)).save(tmp, compress_level=1)
+        os.replace(tmp, dest)
+
+def update_atlas(folder: Path, names: List[str], changed: Set[str]) -> Path:
+    """
+    Pack the tinted icons of `folder` into atlas.png on a fixed grid of
+    ICON_SIZE cells and write atlas.json ({"image", "size", "rects"}).
+
+    Incremental: icons keep their cell, new icons take free cells (or new
+    rows), removed icons are cleared, and only new or `changed` icons are
+    decoded and pasted into the previous atlas.
+    """
+    index_file = folder / "atlas.json"
+    image_file = folder / "atlas.png"
+    names = [n for n in names if (folder / f"{n}.png").exists()]
+
+    rects: Dict[str, List[int]] = {}
+    if image_file.exists():
+        try:
+            index = json.loads(index_file.read_text())
+            if index.get("size") == ICON_SIZE:
+                rects = index["rects"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    wanted = set(names)
+    removed = [r for n, r in rects.items() if n not in wanted]
+    kept = {n: r for n, r in rects.items() if n in wanted}
+    dirty = [n for n in names if n not in kept or n in changed]
+    if rects and not removed and not dirty:
+        return index_file
+
+    used = {r[1] // ICON_SIZE * ATLAS_COLUMNS + r[0] // ICON_SIZE for r in kept.values()}
+    free = (cell for cell in range(len(names) + len(used)) if cell not in used)
+    for name in names:
+        if name not in kept:
+            cell = next(free)
+            kept[name] = [cell % ATLAS_COLUMNS * ICON_SIZE, cell // ATLAS_COLUMNS * ICON_SIZE, ICON_SIZE, ICON_SIZE]
+
+    rows = max([r[1] // ICON_SIZE + 1 for r in kept.values()] or [1])
+    atlas = Image.new("RGBA", (ATLAS_COLUMNS * ICON_SIZE, rows * ICON_SIZE))
+    if rects:
+        with Image.open(image_file) as old:
+            atlas.paste(old.convert("RGBA"), (0, 0))
+    blank = Image.new("RGBA", (ICON_SIZE, ICON_SIZE))
+    for x, y, _, _ in removed:
+        atlas.paste(blank, (x, y))
+    for name in dirty:
+        x, y, _, _ = kept[name]
+        with Image.open(folder / f"{name}.png") as icon:
+            atlas.paste(icon.convert("RGBA"), (x, y))
+
+    tmp = image_file.with_name("atlas.tmp.png")
+    atlas.save(tmp, compress_level=1)
+    os.replace(tmp, image_file)
+    tmp = index_file.with_name(index_file.name + ".tmp")
+    tmp.write_text(json.dumps({"image": str(image_file), "size": ICON_SIZE, "rects": kept}))
+    os.replace(tmp, index_file)
+    return index_file
+
+def icon_source(name: str) -> Optional[str]:
+    """Source file of `name` in MAP_FILE."""
     try:
-        subprocess.run(cmd_prim, check=True, stderr=subprocess.PIPE, text=True)
-        subprocess.run(cmd_acc, check=True, stderr=subprocess.PIPE, text=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error tinting {src}: {e.stderr}")
-        return False
+        with open(MAP_FILE, 'r') as f:
+            for line in f:
+                parts = line.strip().split('|')
+                if len(parts) == 2 and parts[0] == name:
+                    return parts[1]
+    except OSError:
+        pass
+    return None
+
+def tint_icon(name: str, color_hex: str) -> Optional[Path]:
+    """
+    One tinted icon, built on first request (mask included) in the same
+    content-addressed directory tint_icons() uses. None if `name` has no
+    usable source.
 
-def tint_icons(prim_hex: str, acc_hex: str, force: bool = False):
+    Raises:
+        RuntimeError: the mask must be built and `magick` is missing
+    """
+    src = icon_source(name)
+    mask = mask_path(src) if src else None
+    if mask is None or failed_path(mask).exists():
+        return None
+    if not mask.exists():
+        if shutil.which("magick") is None:
+            raise RuntimeError(MAGICK_MISSING)
+        MASK_DIR.mkdir(parents=True, exist_ok=True)
+        if not mask_worker([(src, mask)]):
+            return None
+
+    dest = tinted_dir(color_hex) / f"{name}.png"
+    if not dest.exists() or dest.stat().st_mtime_ns < mask.stat().st_mtime_ns:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tint_one(mask, [(color_hex, dest)])
+    return dest
+
+@contextmanager
+def _flock(path: Path):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def manifest_lock():
+    return _flock(MANIFEST_LOCK)
+
+def batch_lock():
+    """
+    Serializes full batches (every `set` spawns one). A queued batch should
+    read the palette only once it holds the lock, so back-to-back switches
+    end with the latest palette and the extra runs are cache hits. Not taken
+    by on-demand requests, which must never wait on a batch.
+    """
+    return _flock(BATCH_LOCK)
+
+def write_manifest(manifest: Dict):
+    """Atomic write (call with manifest_lock held)."""
+    tmp = MANIFEST_FILE.with_name(MANIFEST_FILE.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, MANIFEST_FILE)
+
+def record_icon(role: str, name: str, path: Path):
+    """Add an on-demand tint to the manifest (no write if it is already there)."""
+    with manifest_lock():
+        try:
+            manifest = json.loads(MANIFEST_FILE.read_text())
+        except (OSError, ValueError):
+            manifest = {"primary": {}, "accent": {}}
+        if manifest.setdefault(role, {}).get(name) != str(path):
+            manifest[role][name] = str(path)
+            write_manifest(manifest)
+
+def icon_colors() -> Dict[str, str]:
+    """{role: hex} for ICON_ROLES from the active palette."""
+    colors = json.loads(PALETTE_FILE.read_text()).get("colors", {})
+    return {role: colors[key] for role, key in ICON_ROLES.items() if key in colors}
+
+def icon_command(argv: List[str]) -> int:
+    """
+    `magician icon <name> [--role R | --color HEX]`: print the tinted path.
+    magician dispatches here before its own (heavy) imports.
+    """
+    parser = argparse.ArgumentParser(prog="magician icon", description="Print the tinted path of one icon (tints on first request)")
+    parser.add_argument("name", help="App id (as in index.map)")
+    parser.add_argument("--role", choices=sorted(ICON_ROLES), default="primary", help="Palette role (default: primary)")
+    parser.add_argument("--color", help="Explicit hex color instead of the palette role", default=None)
+    args = parser.parse_args(argv)
+
+    try:
+        color = args.color or icon_colors()[args.role]
+    except (OSError, ValueError, KeyError):
+        print(f"Error: No active palette color for role '{args.role}'", file=sys.stderr)
+        return 1
+    try:
+        path = tint_icon(args.name, color)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if path is None:
+        print(f"Error: No icon source for '{args.name}'", file=sys.stderr)
+        return 1
+    if not args.color:
+        record_icon(args.role, args.name, path)
+    print(path)
+    return 0
+
+def tint_icons(prim_hex: str, acc_hex: str, force: bool = False, atlas: bool = False):
     """
     Main entry point for tinting.
     """
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    prim_dir = CACHE_DIR / "primary"
-    acc_dir = CACHE_DIR / "accent"
-    prim_dir.mkdir(exist_ok=True)
-    acc_dir.mkdir(exist_ok=True)
-    
-    # 1. Check Lock
-    current_sig = f"{prim_hex}-{acc_hex}"
-    should_repaint = force
-    
-    if COLOR_LOCK.exists():
-        if COLOR_LOCK.read_text().strip() != current_sig:
-            should_repaint = True
-            # Clean old
-            shutil.rmtree(prim_dir)
-            shutil.rmtree(acc_dir)
-            prim_dir.mkdir()
-            acc_dir.mkdir()
-    else:
-        should_repaint = True
-        
-    if not should_repaint and not force:
-        print(":: Icons up to date.")
-        return
+    prim_dir = tinted_dir(prim_hex)
+    acc_dir = tinted_dir(acc_hex)
+    prim_dir.mkdir(parents=True, exist_ok=True)
+    acc_dir.mkdir(parents=True, exist_ok=True)
+    MASK_DIR.mkdir(exist_ok=True)
 
-    COLOR_LOCK.write_text(current_sig)
-    
-    # 2. Index
-    if not MAP_FILE.exists():
-        print(":: Indexing icons...")
-        resolve_icons()
+    # Single-set layout from before tinted/ (wiped on every color change)
+    for legacy in ("primary", "accent"):
+        shutil.rmtree(CACHE_DIR / legacy, ignore_errors=True)
+    (CACHE_DIR / "colors.lock").unlink(missing_ok=True)
+
+    # 1. Index (refreshed every run, so newly installed apps show up)
+    print(":: Indexing icons...")
+    resolve_icons()
         
     if not MAP_FILE.exists():
         print("Error: Icon map creation failed.")
         return
 
-    # 3. Prepare Tasks
-    tasks = []
+    icons: Dict[str, tuple] = {}
     with open(MAP_FILE, 'r') as f:
         for line in f:
             parts = line.strip().split('|')
             if len(parts) != 2: continue
             name, src = parts
-            
-            dest_prim = prim_dir / f"{name}.png"
-            dest_acc = acc_dir / f"{name}.png"
-            
-            if dest_prim.exists() and dest_acc.exists():
-                continue
-                
-            tasks.append((src, dest_prim, dest_acc, prim_hex, acc_hex))
-            
-    # 4. Run Pool
-    if not tasks:
-        print(":: No new icons to tint.")
+            mask = mask_path(src)
+            if mask is not None:
+                icons[name] = (src, mask)
+
+    def current_manifest() -> Dict:
+        manifest = {"primary": {}, "accent": {}}
+        for key, folder in (("primary", prim_dir), ("accent", acc_dir)):
+            for name in icons:
+                dest = folder / f"{name}.png"
+                if dest.exists():
+                    manifest[key][name] = str(dest)
+        return manifest
+
+    # Point consumers at the new colors right away: cached tints show at
+    # once, the rest via `magician icon` or the final manifest below
+    with manifest_lock():
+        write_manifest(current_manifest())
+
+    # 2. Masks (color-independent, cached per source + mtime)
+    # Sources that failed before are skipped until they change (new key)
+    pending = [
+        (src, mask) for src, mask in icons.values()
+        if not mask.exists() and not failed_path(mask).exists()
+    ]
+    if pending and shutil.which("magick") is None:
+        print(f"Error: {MAGICK_MISSING} ({len(pending)} icons skipped)")
+    elif pending:
+        print(f":: Masking {len(pending)} icons...")
+        tasks = [pending[i:i + RASTER_BATCH] for i in range(0, len(pending), RASTER_BATCH)]
+        with Pool(processes=min(cpu_count(), len(tasks))) as pool:
+            done = sum(pool.map(mask_worker, tasks))
+        if done < len(pending):
+            print(f"   [!] {len(pending) - done} icons failed")
+
+    live = {mask.stem for _, mask in icons.values()}
+    for f in MASK_DIR.iterdir():
+        if f.suffix in (".npy", ".failed") and f.stem not in live:
+            f.unlink(missing_ok=True)
+
+    # 3. Tint what each color directory lacks (or holds from an older mask)
+    jobs = []
+    changed: Dict[Path, Set[str]] = {prim_dir: set(), acc_dir: set()}
+    for name, (_, mask) in icons.items():
+        if not mask.exists():
+            continue
+        mask_mtime = mask.stat().st_mtime_ns
+        targets = []
+        for color_hex, folder in ((prim_hex, prim_dir), (acc_hex, acc_dir)):
+            dest = folder / f"{name}.png"
+            if force or not dest.exists() or dest.stat().st_mtime_ns < mask_mtime:
+                targets.append((color_hex, dest))
+                changed[folder].add(name)
+        if targets:
+            jobs.append((mask, targets))
+
+    if not jobs:
+        print(":: Icons up to date.")
     else:
-        print(f":: Tinting {len(tasks)} icons...")
-        with Pool(processes=cpu_count()) as pool:
-            pool.map(tint_worker, tasks)
-            
-    # 5. Generate Manifest
+        print(f":: Tinting {len(jobs)} icons...")
+        with ThreadPoolExecutor(default_threads()) as executor:
+            for future in [executor.submit(tint_one, mask, targets) for mask, targets in jobs]:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error tinting icon: {e}")
+
+    # 4. Generate Manifest (points at the active color directories)
     print(":: Generating Manifest...")
-    # Read dirs
-    manifest = {"primary": {}, "accent": {}}
-    
-    for f in prim_dir.glob("*.png"):
-        manifest["primary"][f.stem] = str(f)
-    for f in acc_dir.glob("*.png"):
-        manifest["accent"][f.stem] = str(f)
-        
-    with open(MANIFEST_FILE, 'w') as f:
-        json.dump(manifest, f)
+    for folder in (prim_dir, acc_dir):
+        os.utime(folder)  # LRU order for prune_tinted
+
+    atlases = None
+    if atlas:
+        print(":: Packing atlases...")
+        atlases = {
+            key: str(update_atlas(folder, list(icons), changed[folder]))
+            for key, folder in (("primary", prim_dir), ("accent", acc_dir))
+        }
+
+    with manifest_lock():
+        manifest = current_manifest()
+        if atlases:
+            manifest["atlas"] = atlases
+        write_manifest(manifest)
+
+    evicted = prune_tinted(TINTED_MAX_MB * 1024 * 1024, keep={prim_dir, acc_dir})
+    if evicted:
+        print(f":: Evicted {evicted} tinted icon sets")
         
     print(":: Icons Done.")
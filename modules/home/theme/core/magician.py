@@ -10,73 +10,27 @@ import time
 import subprocess
 import shutil
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import blake3
+
+# `magician icon` is called per lookup by consumers: answer it before the
+# pipeline imports below (sklearn alone costs over a second)
+if __name__ == "__main__" and sys.argv[1:2] == ["icon"]:
+    from core.icons import icon_command
+    sys.exit(icon_command(sys.argv[2:]))
 
 # Add current directory to path if needed (though wrapper handles it)
 # Local imports
-from core.mood import MoodEngine, get_mood
-from core.extraction import PerceptualExtractor
 from core.generator import PaletteGenerator, PaletteConfig
-from core.renderer import render_template
-# from core.icons import tint_icons # Disabled
-from coloraide import Color
-
-def map_colors(raw_colors):
-    """Map V2 scientific keys to V1 system keys w/ derivations."""
-    colors = {}
-    
-    # Core
-    colors['anchor'] = raw_colors.get('anchor', '#000000')
-    colors['bg'] = raw_colors.get('bg_base', '#000000')
-    colors['fg'] = raw_colors.get('fg_base', '#ffffff')
-    colors['ui_prim'] = raw_colors.get('primary', '#888888')
-    colors['ui_sec'] = raw_colors.get('secondary', '#666666')
-    
-    # Semantics
-    colors['sem_red'] = raw_colors.get('error', '#ff0000')
-    colors['sem_green'] = raw_colors.get('success', '#00ff00')
-    colors['sem_yellow'] = raw_colors.get('warning', '#ffff00')
-    colors['sem_blue'] = raw_colors.get('tertiary', '#0000ff') 
-    
-    # Derived Surfaces
-    try:
-        c_bg = Color(colors['bg'])
-        is_dark = c_bg.luminance() < 0.5
-        if is_dark:
-            colors['surface'] = c_bg.clone().set('oklch.l', lambda l: l + 0.05).to_string(hex=True)
-            colors['surfaceLighter'] = c_bg.clone().set('oklch.l', lambda l: l + 0.10).to_string(hex=True)
-            colors['surfaceDarker'] = c_bg.clone().set('oklch.l', lambda l: max(0, l - 0.02)).to_string(hex=True)
-        else:
-            colors['surface'] = c_bg.clone().set('oklch.l', lambda l: l - 0.05).to_string(hex=True)
-            colors['surfaceLighter'] = c_bg.clone().set('oklch.l', lambda l: l - 0.10).to_string(hex=True)
-            colors['surfaceDarker'] = c_bg.clone().set('oklch.l', lambda l: min(1, l + 0.02)).to_string(hex=True)
-    except: pass
-        
-    # Derived Text
-    try:
-        c_fg = Color(colors['fg'])
-        colors['fg_dim'] = c_fg.clone().set('alpha', 0.7).to_string(hex=True)
-        colors['fg_muted'] = c_fg.clone().set('alpha', 0.4).to_string(hex=True)
-    except: pass
-    
-    # Aliases
-    colors['syn_key'] = colors['ui_prim']
-    colors['syn_str'] = colors['sem_green']
-    colors['syn_fun'] = colors['sem_blue']
-    colors['syn_acc'] = colors['sem_red']
-    colors['text'] = colors['fg']
-    colors['textDim'] = colors['fg_dim']
-    colors['textMuted'] = colors['fg_muted']
-    
-    # Sanitize
-    for k, v in colors.items():
-        if isinstance(v, str) and (v.startswith("oklch") or v.startswith("rgb") or "(" in v):
-            try:
-                c = Color(v)
-                colors[k] = c.convert('srgb').to_string(hex=True)
-            except: pass
-    return colors
+from core.outputs import render_outputs
+from core.bundle import apply_bundle, build_bundle, bundle_dir, load_bundle, prune_bundles
+from core.cache import PaletteStore
+from core.pipeline import Pipeline, group_moods, image_hash, map_colors, resolve_mood
+from core.profiler import Profiler, span
+from core.recolor import MODES as RECOLOR_MODES, ensure_recolored
+from core.grade import ensure_graded
+from core.tiles import prune_cache
+from core.renderer import RenderPass, compile_template, render_compiled
+from core.transition import format_stats, interpolate_palettes, play
+# core.icons is imported lazily by the `icon`/`icons` commands
 
 # CONFIG
 XDG_CONFIG_HOME = Path(os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config"))
@@ -88,9 +42,23 @@ MOODS_FILE = CONFIG_DIR / "moods.json"
 TEMPLATE_DIR = CONFIG_DIR / "templates"
 
 CACHE_DIR = XDG_CACHE_HOME / "theme-engine"
-PALETTES_DIR = CACHE_DIR / "palettes"  # Precached palettes by hash/mood
+PALETTES_DIR = CACHE_DIR / "palettes"  # Legacy per-file cache (migrated into PALETTE_DB)
+PALETTE_DB = CACHE_DIR / "palettes.db"  # Precached palettes by hash/mood
+CACHE_MAX_MB = 256  # Default store cap, override with "cache": {"max_mb": N} in moods.json
 PALETTE_FILE = CACHE_DIR / "palette.json"
 SIGNAL_FILE = CACHE_DIR / "signal"
+BUNDLES_DIR = CACHE_DIR / "bundles"  # Pre-rendered outputs by hash/mood
+STATE_FILE = CACHE_DIR / "state.json"  # Active image/mood (followed by the daemon)
+BENCH_DIR = CACHE_DIR / "bench"  # Synthetic corpus + baseline
+RECOLOR_DIR = CACHE_DIR / "recolor"  # Recolored wallpapers by image hash + palette hash
+RECOLOR_MAX_MB = 512  # `cache gc` evicts least-recently-used recolored wallpapers beyond this
+GRADED_DIR = CACHE_DIR / "graded"  # Mood-graded wallpapers by image hash + mood config
+GRADED_MAX_MB = 512
+WALLPAPER_DIR = Path.home() / "Pictures" / "Wallpapers"
+SWWW_TRANSITION_FPS = 60
+SWWW_TRANSITION_DURATION = 2  # Seconds (the crossfade runs over the same span)
+CROSSFADE_FRAMES = 24  # Default `set --transition` frame count
+ICONS_NICE = 19  # `icons --background` niceness
 
 # Ensures
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
@@ -116,91 +84,191 @@ def load_config():
         print(f"Error loading moods.json: {e}")
         return {"moods": {}, "active_mood": "adaptive"}
 
-def export_gowall_json(colors: dict, path: Path):
-    """Export palette to JSON format compatible with Gowall (-t)."""
-    # Documentation says: "colors": ["#hex", "#hex"...]
-    # It expects a list of hex strings, not a dict.
-    
-    # We'll gather all unique colors from our palette to form the target scheme.
-    # Order shouldn't matter for specific quantization, but standard ordering helps.
-    
-    # Priority colors first
-    color_list = [
-        colors.get("bg", "#000000"),
-        colors.get("fg", "#ffffff"),
-        colors.get("ui_prim", "#ff00ff"),
-        colors.get("ui_sec", "#00ffff"),
-        colors.get("sem_red", "#ff0000"),
-        colors.get("sem_green", "#00ff00"),
-        colors.get("sem_yellow", "#ffff00"),
-        colors.get("sem_blue", "#0000ff"),
-        colors.get("surface", "#111111"),
-        colors.get("surfaceLighter", "#222222"),
-        colors.get("surfaceDarker", "#000000"),
-        # Add ANSI semantic overrides if they differ?
-        # Actually, let's just make sure we capture the essence.
-        # Gowall likely clusters these.
-    ]
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_colors = []
-    for c in color_list:
-        if c not in seen:
-            unique_colors.append(c)
-            seen.add(c)
-
-    mapped = {
-        "name": "Generated",
-        "colors": unique_colors
-    }
-    
-    with open(path, 'w') as f:
-        json.dump(mapped, f, indent=2)
-
 def process_pipeline(img_path: Path, mood_name: str) -> dict:
-    """Run full color pipeline: Mood -> Extract -> Generate."""
+    """Run full color pipeline: Mood -> Extract -> Generate (stages cached)."""
     try:
-        # 1. Mood
-        mood_cfg = get_mood(mood_name)
-        engine = MoodEngine(mood_cfg)
-        img_buffer = engine.process_image(str(img_path))
-        
-        # 2. Extract
-        extractor = PerceptualExtractor()
-        extracted_data = extractor.extract(img_buffer)
-        anchor = extracted_data['anchor']
-        
-        # 3. Generate
-        # 3. Generate
-        gen_config = PaletteConfig(mood=mood_name)
-        generator = PaletteGenerator(config=gen_config)
-        gen_result = generator.generate(anchor, extracted_data['palette'], extracted_data['weights'])
-        
-        # 4. Map to System Keys (V1 Schema)
-        # 4. Map to System Keys (V1 Schema)
-        colors = map_colors(gen_result['colors'])
-        
-        # Return Structured Object
-        
-        # Return Structured Object
-        return {
-            "colors": colors,
-            "active_mood": mood_name,
-            "harmonic_template": gen_result['template'],
-            "harmonic_rotation": gen_result['rotation']
-        }
+        return get_pipeline().run(img_path, mood_name)
     except Exception as e:
         print(f"Pipeline Error ({mood_name}): {e}")
         return None
 
+def bundle_options() -> dict:
+    """Paths needed to render/validate output bundles (picklable, for workers)."""
+    return {
+        "bundles_root": BUNDLES_DIR,
+        "template_dir": TEMPLATE_DIR,
+        "config_home": XDG_CONFIG_HOME,
+        "cache_home": XDG_CACHE_HOME,
+    }
+
+def write_outputs(palette: dict, img_hash: str = None, mood: str = None) -> list:
+    """
+    Write every output file for a palette.
+    With an image hash, a current pre-rendered bundle is swapped in directly;
+    otherwise outputs are rendered (and bundled for next time).
+
+    Returns:
+        list of written destination paths
+    """
+    if img_hash and mood:
+        target = bundle_dir(BUNDLES_DIR, img_hash, mood)
+        with span("bundle:load"):
+            manifest = load_bundle(target, palette, TEMPLATE_DIR, XDG_CONFIG_HOME, XDG_CACHE_HOME)
+        if manifest:
+            print(":: Applying Pre-rendered Bundle...")
+            with span("bundle:apply"):
+                written = apply_bundle(target, manifest)
+            for dest in written:
+                print(f"   -> {dest}")
+            return written
+        
+        print(":: Rendering Outputs...")
+        try:
+            with span("bundle:build"):
+                manifest = build_bundle(target, palette, TEMPLATE_DIR, XDG_CONFIG_HOME, XDG_CACHE_HOME)
+            with span("bundle:apply"):
+                written = apply_bundle(target, manifest)
+            for dest in written:
+                print(f"   -> {dest}")
+            return written
+        except OSError as e:
+            print(f"   [!] Bundle write failed ({e}), rendering in place")
+    
+    print(":: Rendering Outputs...")
+    return write_rendered(render_outputs(palette, TEMPLATE_DIR, XDG_CONFIG_HOME, XDG_CACHE_HOME))
+
+def write_rendered(outputs: dict) -> list:
+    with span("write"):
+        for dest, content in outputs.items():
+            print(f"   -> {dest}")
+            atomic_write(dest, content)
+    return list(outputs)
+
+def reload_apps(changed: list = None):
+    """Reload apps that consume the written outputs (None: all)."""
+    print(":: Reloading Apps...")
+    changed = None if changed is None else set(changed)
+    
+    kitty_conf = XDG_CACHE_HOME / "wal" / "colors-kitty.conf"
+    if changed is None or kitty_conf in changed:
+        try:
+            with span("reload:kitty"):
+                subprocess.run(["kitty", "@", "--to=unix:@mykitty", "set-colors", "-a", "-c", str(kitty_conf)], stderr=subprocess.DEVNULL)
+        except: pass
+    
+    # Niri
+    niri_base = XDG_CONFIG_HOME / "niri" / "config-base.kdl"
+    niri_colors = XDG_CONFIG_HOME / "niri" / "colors.kdl"
+    niri_final = XDG_CONFIG_HOME / "niri" / "config.kdl"
+    if (changed is None or niri_colors in changed) and niri_base.exists() and niri_colors.exists():
+        with span("reload:niri"):
+            with open(niri_final, 'w') as f:
+                f.write(niri_base.read_text() + "\n" + niri_colors.read_text())
+            subprocess.run(["niri", "msg", "action", "load-config-file"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # GTK 3
+    gtk3_dest = XDG_CONFIG_HOME / "gtk-3.0" / "gtk.css"
+    gtk4_src = XDG_CONFIG_HOME / "gtk-4.0" / "gtk.css"
+    if (changed is None or gtk4_src in changed) and gtk4_src.exists():
+        with span("reload:gtk3"):
+            gtk3_dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(gtk4_src, gtk3_dest)
+
+def crossfade(previous: dict, palette: dict, frames: int) -> dict:
+    """
+    Fade kitty and the astal palette from `previous` to `palette` over the
+    swww transition (call right after spawning it). Returns frame stats.
+    """
+    kitty_tpl = TEMPLATE_DIR / "kitty.conf"
+    kitty_parts = compile_template(kitty_tpl.read_text()) if kitty_tpl.exists() and shutil.which("kitty") else None
+    appearance = XDG_CONFIG_HOME / "astal" / "appearance.json"
+
+    def push(colors: dict):
+        if kitty_parts is not None:
+            conf = render_compiled(kitty_parts, RenderPass(colors))
+            settings = [
+                "=".join(fields) for fields in (line.split(None, 1) for line in conf.splitlines())
+                if len(fields) == 2 and not fields[0].startswith("#")
+            ]
+            subprocess.run(["kitty", "@", "--to=unix:@mykitty", "set-colors", "-a", *settings],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        atomic_write(appearance, json.dumps({**palette, "colors": colors}, indent=2))
+
+    print(f":: Crossfading Colors ({frames} frames)...")
+    with span("crossfade:interpolate"):
+        steps = interpolate_palettes(previous.get("colors", {}), palette["colors"], frames)
+    with span("crossfade", frames=frames):
+        stats = play(steps, SWWW_TRANSITION_DURATION, push)
+    print(f"   {format_stats(stats)}")
+    return stats
+
+def set_wallpaper(target_wall: Path):
+    """Point current_wallpaper.jpg at the image and start the swww transition."""
+    print(":: Setting Wallpaper...")
+    
+    # Link wallpaper
+    wall_link = XDG_CACHE_HOME / "current_wallpaper.jpg"
+    try:
+        if wall_link.is_symlink() or wall_link.exists():
+            wall_link.unlink()
+        wall_link.symlink_to(target_wall)
+    except: pass
+    
+    # SWWW
+    with span("swww:daemon_check"):
+        if subprocess.call(["pgrep", "-x", "swww-daemon"], stdout=subprocess.DEVNULL) != 0:
+             subprocess.Popen(["swww-daemon"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             time.sleep(0.5)
+         
+    with span("swww:spawn"):
+        subprocess.Popen([
+            "swww", "img", str(target_wall),
+            "--transition-type", "grow",
+            "--transition-pos", "0.5,0.5",
+            "--transition-fps", str(SWWW_TRANSITION_FPS),
+            "--transition-duration", str(SWWW_TRANSITION_DURATION)
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def spawn_icon_batch(atlas: bool = False):
+    """Run `magician icons` detached at ICONS_NICE (returns immediately)."""
+    cmd = [sys.executable, os.path.abspath(sys.argv[0]), "icons"] + (["--atlas"] if atlas else [])
+    subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True, preexec_fn=lambda: os.nice(ICONS_NICE))
+
+def load_state() -> dict | None:
+    """Last applied image/mood, as written by `set`."""
+    try:
+        state = json.loads(STATE_FILE.read_text())
+    except (OSError, ValueError):
+        return None
+    if "gowall" in state:
+        # Pre-recolor state files
+        state.setdefault("recolor", "nearest" if state.pop("gowall") else None)
+    return state
+
 def action_set(args):
+    """Set theme from image (optionally profiled: per-step timings, memory, trace)."""
+    if not getattr(args, "profile", False):
+        return set_theme(args)
+    
+    profiler = Profiler(memory=True)
+    try:
+        with profiler, span("set"):
+            set_theme(args)
+    finally:
+        trace_path = Path(args.trace) if getattr(args, "trace", None) else CACHE_DIR / "trace-set.json"
+        profiler.save_trace(trace_path)
+        print("\n=== PROFILE (tracemalloc on: timings inflated) ===")
+        print(profiler.summary())
+        print(f"\n:: Chrome trace -> {trace_path} (open in chrome://tracing or ui.perfetto.dev)")
+
+def set_theme(args):
     """Set theme from image."""
     img_path = Path(args.image)
     
     # Path Resolution (Auto-check Wallpapers folder)
     if not img_path.exists():
-        wall_dir = Path.home() / "Pictures/Wallpapers"
+        wall_dir = WALLPAPER_DIR
         candidate = wall_dir / img_path.name
         if candidate.exists():
             img_path = candidate
@@ -215,6 +283,8 @@ def action_set(args):
     
     palette = None
     processed_wallpaper = None
+    img_hash = None
+    active_mood_name = None
     
     # Preset Logic
     if hasattr(args, 'preset') and args.preset:
@@ -227,21 +297,6 @@ def action_set(args):
                 "harmonic_template": "preset",
                 "harmonic_rotation": 0
             }
-            
-            # Gowall Tinting for Presets
-            if hasattr(args, 'gowall') and args.gowall:
-                print(f":: Tinting with Gowall [{args.preset}]...")
-                try:
-                    theme_name = args.preset.replace('_', '-') 
-                    # Fix specific mappings for Gowall
-                    if theme_name == "catppuccin-mocha": theme_name = "catppuccin"
-                    dest = XDG_CACHE_HOME / "wal" / "processed_wallpaper.png"
-                    
-                    subprocess.run(["gowall", "convert", str(img_path), "--output", str(dest), "-t", theme_name], check=True, stdout=subprocess.DEVNULL)
-                    processed_wallpaper = dest
-                    print(f"   -> {dest}")
-                except Exception as e:
-                    print(f"   [!] Gowall failed: {e}")
         else:
             print(f"Error: Preset '{args.preset}' not found. Available: {list(PRESETS.keys())}")
             sys.exit(1)
@@ -261,7 +316,10 @@ def action_set(args):
         active_mood_name = config_data.get("active_mood", "adaptive")
         
         # ─── CACHE LOOKUP (Hot Path) ───────────────────────────────────────────
-        cached_palette = get_cached_palette(str(img_path), active_mood_name)
+        with span("hash"):
+            img_hash = get_image_hash(str(img_path))
+        with span("cache_lookup"):
+            cached_palette = get_cached_palette(str(img_path), active_mood_name, img_hash)
         if cached_palette:
             print(f":: Cache HIT for {img_path.name} [{active_mood_name}]")
             palette = cached_palette
@@ -270,153 +328,97 @@ def action_set(args):
             print(f":: Processing Image {img_path.name} [Mood: {active_mood_name}]...")
             t0 = time.time()
             
-            palette = process_pipeline(img_path, active_mood_name)
+            with span("pipeline"):
+                palette = process_pipeline(img_path, active_mood_name)
             if not palette:
                 print("Error: Pipeline failed.")
                 sys.exit(1)
                 
             print(f"   Harmonic: {palette['harmonic_template']} ({palette['harmonic_rotation']}°) [{time.time()-t0:.3f}s]")
-            
-            # Save to cache for next time
-            save_cached_palette(str(img_path), active_mood_name, palette)
     
     # 2. Save Palette
     print(":: Saving State...")
     
-    # Gowall Tinting for Dynamic Palette
-    if hasattr(args, 'gowall') and args.gowall and not processed_wallpaper:
-         print(":: Tinting with Gowall (Generated Palette)...")
-         try:
-             json_path = XDG_CACHE_HOME / "wal" / "gowall-palette.json"
-             export_gowall_json(palette['colors'], json_path)
-             
-             dest = XDG_CACHE_HOME / "wal" / "processed_wallpaper.png"
-             
-             subprocess.run(["gowall", "convert", str(img_path), "--output", str(dest), "-t", str(json_path)], check=True, stdout=subprocess.DEVNULL)
-             processed_wallpaper = dest
-             print(f"   -> {dest}")
-         except Exception as e:
-              print(f"   [!] Gowall failed: {e}")
-    palette_json = json.dumps(palette, indent=2)
-    atomic_write(PALETTE_FILE, palette_json)
-    atomic_write(XDG_CONFIG_HOME / "astal" / "appearance.json", palette_json)
-
-    # 3. Render Templates
-    print(":: Rendering Templates...")
-    templates = [
-        ("ags-colors.css", XDG_CACHE_HOME / "wal" / "ags-colors.css"),
-        ("kitty.conf", XDG_CACHE_HOME / "wal" / "colors-kitty.conf"),
-        ("rofi.rasi", XDG_CACHE_HOME / "wal" / "colors-rofi.rasi"),
-        ("starship.toml", XDG_CONFIG_HOME / "starship.toml"),
-        ("niri.kdl", XDG_CONFIG_HOME / "niri" / "colors.kdl"),
-        ("zed.json", XDG_CONFIG_HOME / "zed" / "themes" / "LisTheme.json"),
-        ("vesktop.css", XDG_CONFIG_HOME / "vesktop" / "themes" / "lis.css"),
-        ("wezterm.lua", XDG_CACHE_HOME / "wal" / "colors-wezterm.lua"),
-        ("antigravity.template", Path.home() / ".antigravity" / "extensions" / "lis-theme" / "themes" / "lis-theme.json"),
-        ("hyfetch.json", XDG_CONFIG_HOME / "hyfetch.json"),
-        ("zellij.kdl", XDG_CONFIG_HOME / "zellij" / "themes" / "default.kdl"),
-        ("gtk.css", XDG_CONFIG_HOME / "gtk-4.0" / "gtk.css"),
-        ("colors.sh", XDG_CACHE_HOME / "wal" / "colors.sh")
-    ]
-
-    for tpl_name, dest in templates:
-        src = TEMPLATE_DIR / tpl_name
-        if src.exists():
-            print(f"   -> {dest}")
-            render_template(src, dest, palette)
-            
-    # 4. Reloaders
-    print(":: Reloading Apps...")
-    try:
-        subprocess.run(["kitty", "@", "--to=unix:@mykitty", "set-colors", "-a", "-c", str(XDG_CACHE_HOME / "wal" / "colors-kitty.conf")], stderr=subprocess.DEVNULL)
-    except: pass
-    
-    # Niri
-    niri_base = XDG_CONFIG_HOME / "niri" / "config-base.kdl"
-    niri_colors = XDG_CONFIG_HOME / "niri" / "colors.kdl"
-    niri_final = XDG_CONFIG_HOME / "niri" / "config.kdl"
-    if niri_base.exists() and niri_colors.exists():
-        with open(niri_final, 'w') as f:
-            f.write(niri_base.read_text() + "\n" + niri_colors.read_text())
-        subprocess.run(["niri", "msg", "action", "load-config-file"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    # GTK 3
-    gtk3_dest = XDG_CONFIG_HOME / "gtk-3.0" / "gtk.css"
-    gtk4_src = XDG_CONFIG_HOME / "gtk-4.0" / "gtk.css"
-    if gtk4_src.exists():
-        gtk3_dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy(gtk4_src, gtk3_dest)
-        
-    # 5. Icons (DISABLED for performance)
-    # ─────────────────────────────────────────────────────────────────────
-    # To re-enable icon tinting:
-    #   1. Uncomment the lines below
-    #   2. Ensure `imagemagick` is in runtimeDeps (packages.nix)
-    #   3. Run `theme-engine <wallpaper>` - icons will be regenerated
-    # ─────────────────────────────────────────────────────────────────────
-    # prim = palette["colors"]["ui_prim"]
-    # acc = palette["colors"]["syn_acc"]
-    
-    # 5b. Antigravity Settings
-    settings_base = XDG_CONFIG_HOME / "Antigravity" / "User" / "settings-base.json"
-    settings_final = XDG_CONFIG_HOME / "Antigravity" / "User" / "settings.json"
-    
-    if settings_base.exists():
-        print(":: Merging Antigravity Settings...")
+    # Wallpaper Recolor (generated palette or preset)
+    recolor = getattr(args, "recolor", None)
+    if recolor:
+        print(f":: Recoloring Wallpaper [{recolor}]...")
         try:
-            with open(settings_base) as f:
-                base_data = json.load(f)
-            c = palette["colors"]
-            workbench_colors = {
-                "activityBar.background": c["ui_sec"],
-                "activityBar.foreground": c["fg"],
-                "editor.background": c["bg"],
-                "editor.foreground": c["fg"],
-                "statusBar.background": c["ui_sec"],
-                "sideBar.background": c["bg"],
-                "titleBar.activeBackground": c["bg"],
-                "terminal.background": c["bg"]
-            }
-            customizations = base_data.get("workbench.colorCustomizations", {})
-            customizations.update(workbench_colors)
-            base_data["workbench.colorCustomizations"] = customizations
-            atomic_write(settings_final, json.dumps(base_data, indent=4))
+            with span("recolor"):
+                wall_hash = img_hash or get_image_hash(str(img_path))
+                processed_wallpaper = ensure_recolored(img_path, wall_hash, palette["colors"], recolor, RECOLOR_DIR)
+            print(f"   -> {processed_wallpaper}")
         except Exception as e:
-            print(f"Error updating Antigravity settings: {e}")
-
-    # print(":: Tinting Icons...")
-    # tint_icons(prim, acc)
-    
-    # 6. Wallpaper
-    print(":: Setting Wallpaper...")
+            print(f"   [!] Recolor failed: {e}")
     
+    # Mood Grading of the displayed wallpaper (a recolor replaces its colors anyway)
+    grade = getattr(args, "grade", False)
+    if grade and not processed_wallpaper:
+        from core.mood import MOOD_PRESETS
+        if palette.get("active_mood") == "preset":
+            grade_cfg = MOOD_PRESETS.get(args.preset)
+        else:
+            grade_cfg = resolve_mood(active_mood_name)[0]
+        if grade_cfg is None:
+            print(f":: No grading mood for preset {args.preset}, showing the original wallpaper")
+        else:
+            print(f":: Grading Wallpaper [{grade_cfg.name}]...")
+            try:
+                with span("grade"):
+                    wall_hash = img_hash or get_image_hash(str(img_path))
+                    processed_wallpaper = ensure_graded(img_path, wall_hash, grade_cfg, GRADED_DIR)
+                print(f"   -> {processed_wallpaper}")
+            except Exception as e:
+                print(f"   [!] Grading failed: {e}")
+
     # Use processed (tinted) wallpaper if it exists, else original
     target_wall = processed_wallpaper if processed_wallpaper else img_path
     
-    # Link wallpaper
-    wall_link = XDG_CACHE_HOME / "current_wallpaper.jpg"
-    try:
-        if wall_link.is_symlink() or wall_link.exists():
-            wall_link.unlink()
-        wall_link.symlink_to(target_wall)
-    except: pass
+    # Crossfade: start the wallpaper transition first and fade colors along with it;
+    # the final outputs below then match the last frame
+    faded = False
+    if getattr(args, "transition", None):
+        try:
+            previous = json.loads(PALETTE_FILE.read_text())
+        except (OSError, ValueError):
+            previous = None
+        if previous and previous.get("colors") != palette["colors"]:
+            set_wallpaper(target_wall)
+            crossfade(previous, palette, args.transition)
+            faded = True
     
-    # SWWW
-    if subprocess.call(["pgrep", "-x", "swww-daemon"], stdout=subprocess.DEVNULL) != 0:
-         subprocess.Popen(["swww-daemon"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-         time.sleep(0.5)
-         
-    subprocess.Popen([
-        "swww", "img", str(target_wall),
-        "--transition-type", "grow",
-        "--transition-pos", "0.5,0.5",
-        "--transition-fps", "60",
-        "--transition-duration", "2"
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # 3. Write Outputs (palette state, templates, Antigravity, Noctalia)
+    with span("outputs"):
+        write_outputs(palette, img_hash, active_mood_name)
+            
+    # Remember what is applied (the daemon regenerates from this)
+    with span("state"):
+        atomic_write(STATE_FILE, json.dumps({
+            "image": str(img_path),
+            "hash": img_hash,
+            "mood": args.mood if active_mood_name == args.mood else None,
+            "preset": args.preset if palette.get("active_mood") == "preset" else None,
+            "recolor": recolor,
+            "grade": grade,
+        }, indent=2))
+            
+    # 4. Reloaders
+    with span("reload"):
+        reload_apps()
+        
+    # 5. Icons (niced, detached batch: never blocks the switch; ThemedIcon
+    #    asks `magician icon` for anything the manifest lacks meanwhile)
+    with span("icons:spawn"):
+        spawn_icon_batch()
+    
+    # 6. Wallpaper
+    if not faded:
+        set_wallpaper(target_wall)
     
     SIGNAL_FILE.touch()
     anchor_display = palette.get("colors", {}).get("anchor", "cached")
-    subprocess.run(["notify-send", "-u", "low", "Theme Refreshed", f"Anchor: {anchor_display}"], check=False)
+    with span("notify"):
+        subprocess.run(["notify-send", "-u", "low", "Theme Refreshed", f"Anchor: {anchor_display}"], check=False)
 
     # VISUALIZER (Single Mood)
     print(f"\n=== PALETTE PREVIEW [{config_data.get('active_mood')}] ===")
@@ -436,124 +438,11 @@ def action_set(args):
         if val.startswith("#"):
             print(f"{key:<15} {format_color_cell(val)}")
 
-    # ----------------------------------------------------------------
-    # NOCTALIA INTEGRATION (Shim)
-    # ----------------------------------------------------------------
-    print(":: Generating Noctalia Shims...")
-    try:
-        c = palette["colors"]
-        
-        def on_color(hex_str):
-            """Calculate accessible text color (onPrimary, etc)."""
-            try:
-                base = Color(hex_str)
-                # Standard MD3 typically uses white or black (usually tone 10 or 90)
-                # We'll stick to simple black/white for max contrast safety
-                if base.contrast("#ffffff") >= 4.5:
-                    return "#ffffff"
-                return "#000000"
-            except:
-                return "#ffffff"
-
-        def shift(hex_str, light_delta=0):
-            """Shift lightness."""
-            try:
-                col = Color(hex_str)
-                # Oklch lightness is 0-1
-                l = col.convert("oklch").coords[0]
-                new_l = max(0, min(1, l + light_delta))
-                col.convert("oklch").coords[0] = new_l
-                return col.to_string(hex=True)
-            except:
-                return hex_str
-        
-        def derive_outline(bg_hex):
-            """Derive outline from background."""
-            return shift(bg_hex, 0.15)  # Slightly lighter/distinct from BG
-            
-        def derive_shadow(bg_hex):
-            return shift(bg_hex, -0.05) # Slightly darker
-
-        # Mapping Lis-OS Concept -> MD3 Concept
-        # ui_prim -> Primary
-        # ui_sec  -> Secondary
-        # syn_acc -> Tertiary
-        # bg      -> Surface
-        # fg      -> OnSurface
-        
-        def with_alpha(hex_str, alpha_float):
-            """Add transparency (Qt/QML uses #AARRGGBB)."""
-            try:
-                # remove #
-                clean = hex_str.lstrip('#')
-                if len(clean) == 6:
-                    val = int(alpha_float * 255)
-                    alpha_hex = f"{val:02x}"
-                    return f"#{alpha_hex}{clean}"
-                return hex_str
-            except:
-                return hex_str
-
-        noctalia_colors = {
-            "mPrimary": c["ui_prim"],
-            "mOnPrimary": on_color(c["ui_prim"]),
-            
-            "mSecondary": c["ui_sec"],
-            "mOnSecondary": on_color(c["ui_sec"]),
-            
-            "mTertiary": c["syn_acc"],
-            "mOnTertiary": on_color(c["syn_acc"]),
-            
-            "mError": c["sem_red"],
-            "mOnError": on_color(c["sem_red"]),
-            
-            # Apply Opacity to Surfaces (0.85 approx D9, 0.75 approx BF)
-            "mSurface": with_alpha(c["bg"], 0.85),
-            "mOnSurface": c["fg"],
-            
-            "mSurfaceVariant": with_alpha(shift(c["bg"], 0.05), 0.75),
-            "mOnSurfaceVariant": shift(c["fg"], -0.1),
-            
-            # Shadows often need strict handling, but pure black/dark is better
-            "mOutline": derive_outline(c["bg"]),
-            "mShadow": "#000000", # Force black shadow for better contrast
-            
-            "mHover": c["syn_acc"],     # Using accent as hover state
-            "mOnHover": on_color(c["syn_acc"])
-        }
-        
-        noc_dir = XDG_CONFIG_HOME / "noctalia"
-        noc_dir.mkdir(parents=True, exist_ok=True)
-        atomic_write(noc_dir / "colors.json", json.dumps(noctalia_colors, indent=2))
-        print(f"   -> {noc_dir / 'colors.json'}")
-        
-    except Exception as e:
-        print(f"Error generating Noctalia shim: {e}")
-
-
-def action_compare(args):
-    """Compare all moods against an image."""
-    img_path = Path(args.image).resolve()
-    if not img_path.exists():
-        print(f"Error: Image not found: {img_path}")
-        sys.exit(1)
 
-    from core.mood import MOOD_PRESETS
-    moods = list(MOOD_PRESETS.keys())
+def compare_table(name: str, record: dict, mood_names: list):
+    """Print one image's comparison as an ANSI table (variable keys per mood, then constants)."""
+    results = {m: r["colors"] for m, r in record["moods"].items()}
     
-    print(f":: Comparing Moods for {img_path.name}...")
-    
-    results = {}
-    for mood_name in moods:
-        try:
-            # Run full V2 pipeline
-            res = process_pipeline(img_path, mood_name)
-            if res:
-                results[mood_name] = res["colors"]
-        except Exception as e:
-            print(f"Error processing {mood_name}: {e}")
-
-
     # Helper for Visuals
     def format_color_cell(hex_val, width=20):
         if not hex_val or not isinstance(hex_val, str) or not hex_val.startswith("#"):
@@ -566,9 +455,13 @@ def action_compare(args):
         except ValueError:
             return f"{hex_val:<{width}}"
 
+    print(f"\n:: {name} (decode {record['decode_ms']:.0f} ms)")
+    for mood, res in record["moods"].items():
+        if res["status"].startswith("failed"):
+            print(f"Error processing {mood}: {res['status']}")
+
     # Print Table
     # Columns: Component | Mood 1 | Mood 2 | ...
-    mood_names = sorted(moods)
     col_width = 22
     header = f"{'COMPONENT':<15}" + "".join([f"{m:<{col_width}}" for m in mood_names])
     print("\n" + header)
@@ -588,7 +481,7 @@ def action_compare(args):
     
     for key in sorted_keys:
         # Check if values differ across moods
-        values = [results[m].get(key) for m in mood_names]
+        values = [results.get(m, {}).get(key) for m in mood_names]
         if all(v == values[0] for v in values):
             constant_keys.append((key, values[0]))
         else:
@@ -598,9 +491,17 @@ def action_compare(args):
     for key in variable_keys:
         row = f"{key:<15}"
         for m in mood_names:
-            val = results[m].get(key, "N/A")
+            val = results.get(m, {}).get(key, "N/A")
             row += format_color_cell(val, col_width)
         print(row)
+    
+    # Timings
+    row = f"{'time (ms)':<15}"
+    for m in mood_names:
+        res = record["moods"].get(m)
+        cell = f"{res['wall_ms']:.0f} {res['status']}" if res else "N/A"
+        row += f"{cell:<{col_width}}"
+    print(row)
         
     # Print Constants Summary
     if constant_keys:
@@ -610,41 +511,190 @@ def action_compare(args):
             print(f"{key:<15} {format_color_cell(val, col_width)}")
     print("")
 
+def action_compare(args):
+    """Compare all moods against one or more images."""
+    from core.compare import run_compare
+    from core.mood import MOOD_PRESETS
+    from core.precache import find_images
+    
+    images = []
+    for raw in ([args.image] if args.image else []) + (args.images or []):
+        path = Path(raw).expanduser().resolve()
+        if path.is_dir():
+            images.extend(find_images(path))
+        elif path.exists():
+            images.append(path)
+        else:
+            print(f"Error: Image not found: {path}", file=sys.stderr)
+            sys.exit(1)
+    if not images:
+        print("Error: No images given (use <image> or --images PATH...)", file=sys.stderr)
+        sys.exit(1)
+
+    moods = list(MOOD_PRESETS.keys())
+    mood_names = sorted(moods)
+    machine = args.format != "table"
+    # Keep stdout clean for scripts
+    log = sys.stderr if machine else sys.stdout
+    
+    groups = group_moods(moods)
+    jobs = args.jobs or min(os.cpu_count() or 1, len(groups) * len(images))
+    print(f":: Comparing {len(moods)} moods on {len(images)} image(s) with {jobs} workers...", file=log)
+    
+    # Moods with identical effective configs run once
+    if len(groups) < len(moods):
+        print(f":: {len(moods)} moods resolve to {len(groups)} unique pipelines", file=log)
+    
+    writer = None
+    db_path = None if args.no_cache else PALETTE_DB
+    try:
+        for record in run_compare(images, moods, db_path, get_store().max_bytes, jobs):
+            name = Path(record["image"]).name
+            if record.get("error"):
+                print(f"Error processing {name}: {record['error']}", file=log)
+                if args.format == "json":
+                    print(json.dumps(record), flush=True)
+                continue
+            
+            if args.format == "json":
+                # One JSON object per line, streamed as each image finishes
+                print(json.dumps(record), flush=True)
+            elif args.format == "csv":
+                keys = sorted({k for r in record["moods"].values() for k in r["colors"]})
+                if writer is None:
+                    import csv
+                    writer = csv.writer(sys.stdout)
+                    color_keys = keys
+                    writer.writerow(["image", "hash", "mood", "status", "decode_ms", "wall_ms", "cpu_ms"] + color_keys)
+                for mood, res in record["moods"].items():
+                    writer.writerow([record["image"], record["hash"], mood, res["status"], record["decode_ms"],
+                                     res["wall_ms"], res["cpu_ms"]] + [res["colors"].get(k, "") for k in color_keys])
+                sys.stdout.flush()
+            else:
+                compare_table(name, record, mood_names)
+    except KeyboardInterrupt:
+        print("\n:: Compare interrupted.", file=log)
+        sys.exit(130)
+
 def action_daemon(args):
-    """Watch for changes and regenerate."""
-    print(":: Magician Daemon Started.")
+    """
+    Watch moods.json, the templates and the active wallpaper; regenerate incrementally.
+    
+    - Wallpaper content changed: full `set` (new image hash).
+    - moods.json changed: regenerate for the active mood from cached stage
+      artifacts (no re-decode), then rewrite outputs.
+    - Template (or Antigravity base settings) changed: re-render only that output.
+    """
     from watchfiles import watch
+    from core.outputs import output_inputs
+    
+    print(":: Magician Daemon Started.")
     
-    paths = [CONFIG_DIR]
+    def regenerate(state: dict) -> None:
+        try:
+            config_data = json.loads(MOODS_FILE.read_text())
+        except (OSError, ValueError) as e:
+            print(f"   [!] Skipping: moods.json unreadable ({e})")
+            return
+        mood = state.get("mood") or config_data.get("active_mood", "adaptive")
+        t0 = time.time()
+        try:
+            palette = get_pipeline().run(Path(state["image"]), mood, img_hash=state["hash"])
+        except Exception as e:
+            print(f"   [!] Pipeline Error ({mood}): {e}")
+            return
+        print(f"   Mood: {mood} [{time.time()-t0:.3f}s]")
+        try:
+            if json.loads(PALETTE_FILE.read_text()) == palette:
+                print("   Palette unchanged.")
+                return
+        except (OSError, ValueError):
+            pass
+        reload_apps(write_outputs(palette, state["hash"], mood))
+        SIGNAL_FILE.touch()
     
-    for changes in watch(*paths):
-        print(f":: Detected changes: {changes}")
+    def rerender(inputs: set) -> None:
+        try:
+            palette = json.loads(PALETTE_FILE.read_text())
+        except (OSError, ValueError):
+            print("   [!] No active palette, skipping.")
+            return
+        written = write_rendered(render_outputs(palette, TEMPLATE_DIR, XDG_CONFIG_HOME, XDG_CACHE_HOME, inputs))
+        if written:
+            reload_apps(written)
+    
+    while True:
+        state = load_state()
+        wallpaper = Path(state["image"]) if state else None
+        inputs = set(output_inputs(TEMPLATE_DIR, XDG_CONFIG_HOME, XDG_CACHE_HOME))
         
-        if not PALETTE_FILE.exists():
-            continue
-            
+        roots = {CONFIG_DIR, CACHE_DIR} | {p.parent for p in inputs}
+        if wallpaper:
+            roots.add(wallpaper.parent)
+        roots = sorted(str(r) for r in roots if r.is_dir())
+        watched = {str(p) for p in inputs} | {str(MOODS_FILE), str(STATE_FILE), str(TEMPLATE_DIR)}
+        if wallpaper:
+            watched.add(str(wallpaper))
+        
+        print(f":: Watching {len(roots)} directories"
+              + (f" (wallpaper: {wallpaper.name}, mood: {state.get('mood') or 'active'})" if state else ""))
+        restart = False
         try:
-            with open(PALETTE_FILE) as f:
-                data = json.load(f)
-                anchor = data["colors"].get("anchor")
-        except:
-            continue
+            for changes in watch(*roots, watch_filter=lambda change, path: path in watched,
+                                 debounce=args.debounce, recursive=False):
+                changed = {Path(path) for change, path in changes}
+                print(f":: Detected changes: {', '.join(sorted(p.name for p in changed))}")
             
-        if not anchor:
-            continue
+                if STATE_FILE in changed:
+                    # `set` ran elsewhere: follow the new image (already applied)
+                    new_state = load_state()
+                    if new_state and new_state.get("image") != (state or {}).get("image"):
+                        restart = True
+                        break
+                    state = new_state
             
-        print(f":: Regenerating with anchor {anchor}...")
-        try:
-            config_data = load_config()
-            palette = generate_palette(anchor, config_data)
+                if not state:
+                    continue
+                if state.get("preset"):
+                    # Static palette: only templates can change
+                    changed.discard(MOODS_FILE)
+                    changed.discard(wallpaper)
             
-            palette_json = json.dumps(palette, indent=2)
-            atomic_write(PALETTE_FILE, palette_json)
-            atomic_write(XDG_CONFIG_HOME / "astal" / "appearance.json", palette_json)
+                if wallpaper in changed:
+                    if wallpaper.exists() and get_image_hash(str(wallpaper)) != state.get("hash"):
+                        print(f":: Wallpaper changed, re-applying {wallpaper.name}...")
+                        try:
+                            action_set(argparse.Namespace(image=str(wallpaper), mood=state.get("mood"),
+                                                          preset=None, recolor=state.get("recolor"),
+                                                          grade=state.get("grade", False)))
+                        except SystemExit:
+                            print(f"   [!] Failed to apply {wallpaper.name}")
+                        state = load_state()
+                        continue
             
-            # Re-render essential templates... (Logic omitted for brevity, similar to set)
-        except Exception as e:
-            print(f"Error regenerating: {e}")
+                if MOODS_FILE in changed:
+                    print(":: moods.json changed, regenerating from cached stages...")
+                    if state.get("recolor") or state.get("grade"):
+                        # Recolored/graded wallpaper follows the mood: take the full path
+                        action_set(argparse.Namespace(image=state["image"], mood=state.get("mood"), preset=None,
+                                                      recolor=state.get("recolor"), grade=state.get("grade", False)))
+                        state = load_state()
+                    else:
+                        regenerate(state)
+                    continue
+            
+                if TEMPLATE_DIR in changed:
+                    # Template dir replaced (e.g. Nix rebuild relinked it)
+                    print(":: Templates replaced, re-rendering all...")
+                    rerender(inputs)
+                elif changed & inputs:
+                    print(f":: Re-rendering {', '.join(sorted(p.name for p in changed & inputs))}...")
+                    rerender(changed & inputs)
+        except KeyboardInterrupt:
+            print("\n:: Daemon stopped.")
+            break
+        if not restart:
+            break
 
 def action_test(args):
     """Run stress test: generate palettes for multiple anchors across all moods."""
@@ -727,47 +777,46 @@ def action_test(args):
 
 def get_image_hash(image_path: str) -> str:
     """Get Blake3 hash of file contents for cache key."""
-    hasher = blake3.blake3()
-    with open(image_path, 'rb') as f:
-        # Stream in chunks for large images
-        for chunk in iter(lambda: f.read(65536), b''):
-            hasher.update(chunk)
-    return hasher.hexdigest()[:16]  # Short hash is sufficient
+    return image_hash(image_path)
+
+
+_store = None
+
+def get_store() -> PaletteStore:
+    """Open the palette store (once), importing the legacy cache tree on first use."""
+    global _store
+    if _store is None:
+        max_mb = load_config().get("cache", {}).get("max_mb", CACHE_MAX_MB)
+        _store = PaletteStore(PALETTE_DB, max_bytes=int(max_mb * 1024 * 1024))
+        migrated = _store.migrate_legacy(PALETTES_DIR)
+        if migrated:
+            print(f":: Migrated {migrated} cached palettes into {PALETTE_DB.name}")
+    return _store
 
 
-def get_cached_palette(image_path: str, mood: str) -> dict | None:
-    """Try to load a cached palette for this image + mood."""
+def get_pipeline() -> Pipeline:
+    """Pipeline bound to the palette store (stage artifacts are cached too)."""
+    return Pipeline(get_store())
+
+
+def get_cached_palette(image_path: str, mood: str, img_hash: str = None) -> dict | None:
+    """Try to load a cached palette for this image + mood (current algorithm/configs only)."""
     try:
-        img_hash = get_image_hash(image_path)
-        cache_file = PALETTES_DIR / img_hash / f"{mood}.json"
-        if cache_file.exists():
-            with open(cache_file) as f:
-                return json.load(f)
+        return get_pipeline().cached(img_hash or get_image_hash(image_path), mood)
     except Exception:
         pass
     return None
 
 
-def save_cached_palette(image_path: str, mood: str, palette: dict):
-    """Save a palette to the cache."""
-    try:
-        img_hash = get_image_hash(image_path)
-        cache_dir = PALETTES_DIR / img_hash
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        cache_file = cache_dir / f"{mood}.json"
-        atomic_write(cache_file, json.dumps(palette, indent=2))
-    except Exception as e:
-        print(f"   [!] Cache write failed: {e}")
-
-
 def action_precache(args):
     """Pre-generate palettes for all images in a folder, for all moods."""
-    folder = Path(args.folder).resolve()
+    from core.precache import find_images, run_precache, watch_precache
+    
+    folder = Path(args.folder).expanduser().resolve()
     if not folder.is_dir():
         print(f"Error: Not a directory: {folder}")
         sys.exit(1)
     
-    jobs = args.jobs or 4
     config_data = load_config()
     moods = list(config_data.get("moods", {}).keys())
     
@@ -775,52 +824,296 @@ def action_precache(args):
         print("Error: No moods defined in configuration.")
         sys.exit(1)
     
+    bundles = bundle_options() if args.bundles else None
+    
+    if args.watch:
+        # Background mode: bounded + niced so it never competes with the desktop
+        watch_precache(folder, moods, PALETTE_DB, get_store().max_bytes,
+                       jobs=args.jobs or 2, niceness=args.nice, bundles=bundles)
+        return
+    
+    jobs = args.jobs or os.cpu_count() or 1
+    
     # Find all images
-    extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
-    images = [f for f in folder.iterdir() if f.suffix.lower() in extensions]
+    images = find_images(folder)
     
     if not images:
         print(f"No images found in {folder}")
         return
     
+    groups = group_moods(moods)
     print(f":: Pre-caching {len(images)} images × {len(moods)} moods = {len(images) * len(moods)} palettes")
-    print(f":: Using {jobs} parallel workers\n")
+    if len(groups) < len(moods):
+        aliases = "; ".join(" = ".join(names) for names in groups.values() if len(names) > 1)
+        print(f":: {len(moods)} moods resolve to {len(groups)} unique pipelines ({aliases})")
+    print(f":: Using {jobs} worker processes\n")
     
-    PALETTES_DIR.mkdir(parents=True, exist_ok=True)
+    store = get_store()
+    profiler = Profiler() if args.profile else None
+    summary = run_precache(images, moods, PALETTE_DB, store.max_bytes, jobs=jobs, bundles=bundles, profiler=profiler)
     
-    def process_image(img_path: Path):
-        """Process one image for all moods."""
-        results = []
-        try:
-            for mood in moods:
-                cached = get_cached_palette(str(img_path), mood)
-                if cached:
-                    results.append((mood, "cached"))
-                    continue
-                
-                # Full pipeline per mood
-                palette = process_pipeline(img_path, mood)
-                if palette:
-                    save_cached_palette(str(img_path), mood, palette)
-                    results.append((mood, "generated"))
-                else:
-                    results.append((mood, "failed"))
-                
-        except Exception as e:
-            results.append(("error", str(e)))
-        
-        return img_path.name, results
+    if profiler:
+        trace_path = Path(args.trace) if args.trace else CACHE_DIR / "trace-precache.json"
+        profiler.save_trace(trace_path)
+        print("\n=== PROFILE (all workers, tracemalloc on) ===")
+        print(profiler.summary())
+        print(f"\n:: Chrome trace -> {trace_path}")
+    
+    counts = summary["counts"]
+    if counts.get("aliased"):
+        print(f":: Deduplicated {counts['aliased']} of {counts['aliased'] + counts.get('generated', 0)} "
+              f"palette runs (aliased to an identical mood)")
+    
+    if summary["interrupted"]:
+        print(f"\n:: Precache interrupted ({summary['done']}/{summary['total']} images). Re-run to resume.")
+        sys.exit(130)
+    print(f"\n:: Precache complete. Cache at: {PALETTE_DB}")
+
+
+def action_rotate(args):
+    """Rotate wallpapers on a timer, prefetching the upcoming themes."""
+    from core.rotate import RotationQueue, parse_interval
+    from core.precache import make_pool, precache_image
+    
+    folder = Path(args.folder).expanduser().resolve()
+    if not folder.is_dir():
+        print(f"Error: Not a directory: {folder}")
+        sys.exit(1)
+    try:
+        interval = parse_interval(args.interval)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    mood = args.mood or load_config().get("active_mood", "adaptive")
+    queue = RotationQueue(folder, order=args.order, seed=args.seed)
+    
+    # Low-priority prefetch: palettes and rendered outputs for the next N wallpapers are ready before they are due
+    pool = make_pool(PALETTE_DB, get_store().max_bytes, jobs=args.jobs, niceness=10)
+    prefetching = {}
     
-    # Process in parallel
-    with ThreadPoolExecutor(max_workers=jobs) as executor:
-        futures = {executor.submit(process_image, img): img for img in images}
+    print(f":: Rotating {folder} every {args.interval} [{args.order}, mood: {mood}, prefetch: {args.prefetch}]")
+    try:
+        while True:
+            img_path = queue.next()
+            if img_path is None:
+                print(f"Error: No images found in {folder}")
+                sys.exit(1)
+            if not img_path.exists():
+                prefetching.pop(img_path, None)
+                continue
+            
+            future = prefetching.pop(img_path, None)
+            if future is not None:
+                future.result()  # Still running: finish it rather than duplicating the work
+            
+            print(f"\n:: [rotate] {img_path.name}")
+            try:
+                action_set(argparse.Namespace(image=str(img_path), mood=mood, preset=None, recolor=None))
+            except SystemExit:
+                print(f"   [!] Failed to apply {img_path.name}, skipping")
+            
+            for upcoming in queue.upcoming(args.prefetch):
+                if upcoming not in prefetching:
+                    prefetching[upcoming] = pool.submit(precache_image, str(upcoming), [[mood]], bundle_options())
+            
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n:: Rotation stopped.")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def action_cache(args):
+    """Inspect and maintain the palette store."""
+    store = get_store()
+    
+    if args.cache_command == "stats":
+        stats = store.stats()
+        print(f":: Palette Store: {stats['path']}")
+        print(f"   Entries:  {stats['entries']} ({stats['images']} images)")
+        print(f"   Size:     {stats['bytes'] / 1024:.1f} KiB of {stats['max_bytes'] / 1024 / 1024:.0f} MiB cap "
+              f"(file: {stats['file_bytes'] / 1024:.1f} KiB)")
+        print(f"   Hits:     {stats['hits']}")
+        if stats['oldest_access']:
+            print(f"   Oldest:   {time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['oldest_access']))}")
+        for mood, count in stats['moods'].items():
+            print(f"   {mood:<15} {count}")
+        if stats['configs']:
+            print("   Configs:  " + ", ".join(f"{cfg} ({n})" for cfg, n in stats['configs'].items()))
+        for stage, info in stats['artifacts'].items():
+            print(f"   [{stage}] {info['entries']} artifacts, {info['bytes'] / 1024:.1f} KiB")
+            
+    elif args.cache_command == "gc":
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+        evicted = store.gc(max_bytes)
+        store.vacuum()
+        print(f":: Evicted {evicted} palettes ({store.total_bytes() / 1024:.1f} KiB left)")
+        live = store.keys()
+        pruned = prune_bundles(BUNDLES_DIR, live)
+        if pruned:
+            print(f":: Removed {pruned} orphaned output bundles")
+        live_hashes = {img_hash for img_hash, _ in live}
+        for label, cache_dir, max_mb in (("recolored", RECOLOR_DIR, RECOLOR_MAX_MB), ("graded", GRADED_DIR, GRADED_MAX_MB)):
+            pruned = prune_cache(cache_dir, live_hashes, max_mb * 1024 * 1024)
+            if pruned:
+                print(f":: Removed {pruned} {label} wallpapers")
+        from core.icons import TINTED_MAX_MB, prune_tinted
+        pruned = prune_tinted(TINTED_MAX_MB * 1024 * 1024)
+        if pruned:
+            print(f":: Removed {pruned} tinted icon sets")
         
-        for future in as_completed(futures):
-            name, results = future.result()
-            status = ", ".join(f"{m}:{s}" for m, s in results)
-            print(f"   {name}: {status}")
+    elif args.cache_command == "export":
+        rows = store.export()
+        payload = json.dumps(rows, indent=2)
+        if args.output:
+            atomic_write(Path(args.output), payload)
+            print(f":: Exported {len(rows)} palettes -> {args.output}")
+        else:
+            print(payload)
+
+
+def action_icon(args):
+    """Print the tinted icon path for one app (normally dispatched before the imports, see top)."""
+    from core.icons import icon_command
+    sys.exit(icon_command(args.argv))
+
+def action_icons(args):
+    """Tint every indexed icon for the active palette."""
+    if args.background:
+        spawn_icon_batch(args.atlas)
+        print(f":: Tinting icons in the background (nice {ICONS_NICE})")
+        return
+    from core.icons import batch_lock, icon_colors, tint_icons
+    with batch_lock():
+        try:
+            colors = icon_colors()
+            prim, acc = colors["primary"], colors["accent"]
+        except (OSError, ValueError, KeyError):
+            print("Error: No active palette (run `magician set` first)")
+            sys.exit(1)
+        tint_icons(prim, acc, force=args.force, atlas=args.atlas)
+
+def action_bench(args):
+    """Benchmark every pipeline stage on a synthetic corpus, track regressions."""
+    from core.bench import CORPUS, STAGES, compare_baseline, ensure_corpus, run_bench
+    
+    names = args.only.split(",") if args.only else list(CORPUS)
+    unknown = [n for n in names if n not in CORPUS]
+    if unknown:
+        print(f"Error: Unknown corpus images {unknown}. Available: {list(CORPUS)}")
+        sys.exit(1)
+    
+    print(f":: Preparing corpus in {BENCH_DIR}...")
+    images = ensure_corpus(BENCH_DIR, names)
+    print(f":: Benchmarking {len(images)} images × {args.repeat} runs [mood: {args.mood}] (median / p95 ms)\n")
+    
+    columns = STAGES + ["total"]
+    header = f"{'IMAGE':<10}" + "".join(f"{c:>15}" for c in columns)
+    print(header)
+    print("-" * len(header))
     
-    print(f"\n:: Precache complete. Cache at: {PALETTES_DIR}")
+    def on_image(name, stats):
+        print(f"{name:<10}" + "".join(f"{stats[c]['median']:>8.1f}/{stats[c]['p95']:<6.1f}" for c in columns), flush=True)
+    
+    profiler = Profiler() if args.trace else None
+    report = run_bench(images, mood=args.mood, repeat=args.repeat, warmup=args.warmup, on_image=on_image,
+                       trace=profiler)
+    if profiler:
+        profiler.save_trace(args.trace)
+        print(f"\n:: Chrome trace -> {args.trace}")
+    
+    if args.output:
+        atomic_write(Path(args.output), json.dumps(report, indent=2))
+        print(f"\n:: Results -> {args.output}")
+    
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        atomic_write(baseline_path, json.dumps(report, indent=2))
+        print(f":: Baseline saved -> {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"\n:: No baseline at {baseline_path} (create one with --save-baseline)")
+        return
+    
+    try:
+        baseline = json.loads(baseline_path.read_text())
+    except ValueError as e:
+        print(f"Error: Invalid baseline {baseline_path}: {e}")
+        sys.exit(1)
+    if baseline.get("meta", {}).get("corpus_version") != report["meta"]["corpus_version"]:
+        print(":: Warning: Baseline was recorded on a different corpus version")
+    
+    regressions = compare_baseline(report, baseline, args.threshold)
+    if regressions:
+        print(f"\n:: {len(regressions)} regressions beyond +{args.threshold * 100:.0f}% (vs {baseline_path}):")
+        for line in regressions:
+            print(f"   {line}")
+        sys.exit(1)
+    print(f"\n:: No regressions beyond +{args.threshold * 100:.0f}% (vs {baseline_path})")
+
+
+def action_fidelity(args):
+    """Measure palette drift of a candidate pipeline config against the reference."""
+    from core.fidelity import DEFAULT_GATES, ROLES, check_gates, parse_overrides, run_fidelity
+    from core.mood import MOOD_PRESETS
+    from core.precache import find_images
+    
+    try:
+        parse_overrides(args.set)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    if args.images:
+        images = []
+        for raw in args.images:
+            path = Path(raw).expanduser().resolve()
+            if not path.exists():
+                print(f"Error: Image not found: {path}")
+                sys.exit(1)
+            images.extend(find_images(path) if path.is_dir() else [path])
+    else:
+        from core.bench import ensure_corpus
+        images = list(ensure_corpus(BENCH_DIR).values())
+    
+    # One mood per effective config
+    moods = args.moods.split(",") if args.moods else [names[0] for names in group_moods(list(MOOD_PRESETS)).values()]
+    
+    print(f":: Candidate: {' '.join(args.set) or '(reference)'}")
+    print(f":: {len(images)} images × {len(moods)} moods, uncached\n")
+    
+    def on_result(img, mood, result):
+        ref_t, cand_t = result["template"]
+        template = ref_t if ref_t == cand_t else f"{ref_t}->{cand_t}"
+        print(f"   {img.name:<20} {mood:<18} max ΔE2000 {result['max_de2000']:6.2f} ({result['worst_role']:<14}) template {template}", flush=True)
+    
+    report = run_fidelity(images, moods, args.set, on_result=on_result)
+    
+    print(f"\n{'ROLE':<15}{'ΔE2000 med':>12}{'p95':>8}{'max':>8}{'ΔEOK med':>12}{'p95':>8}{'max':>8}")
+    print("-" * 71)
+    for role in ROLES + ["overall"]:
+        stats = report["overall"] if role == "overall" else report["roles"][role]
+        de, ok = stats["de2000"], stats["deok"]
+        print(f"{role:<15}{de['median']:>12.2f}{de['p95']:>8.2f}{de['max']:>8.2f}"
+              f"{ok['median']:>12.4f}{ok['p95']:>8.4f}{ok['max']:>8.4f}")
+    
+    print(f"\n   Anchor match:       {report['anchor_match'] * 100:.1f}%")
+    print(f"   Template agreement: {report['template_agreement'] * 100:.1f}%")
+    print(f"   Speedup:            {report['speedup']:.2f}x ({report['reference_s']:.2f}s -> {report['candidate_s']:.2f}s)")
+    
+    if args.output:
+        atomic_write(Path(args.output), json.dumps(report, indent=2))
+        print(f"\n:: Report -> {args.output}")
+    
+    gates = {gate: getattr(args, gate) for gate in DEFAULT_GATES}
+    failures = check_gates(report, gates)
+    if failures:
+        print("\n:: FAILED quality gates:")
+        for line in failures:
+            print(f"   {line}")
+        sys.exit(1)
+    print("\n:: All quality gates passed.")
 
 
 def main():
@@ -834,6 +1127,10 @@ def main():
         print("  test            Run stress tests")
         print("  daemon          Watch folder for changes")
         print("  precache        Pre-generate palettes")
+        print("  rotate          Rotate wallpapers on a timer")
+        print("  cache           Inspect/maintain palette cache")
+        print("  bench           Benchmark pipeline stages")
+        print("  fidelity        Measure palette drift of a faster config")
         print("")
         print("Run 'magician <command> --help' for more info.")
         sys.exit(0)
@@ -848,16 +1145,30 @@ def main():
     set_parser.add_argument("image", help="Path to image")
     set_parser.add_argument("--mood", help="Override active mood", default=None)
     set_parser.add_argument("--preset", help="Override with static preset", default=None)
-    set_parser.add_argument("--gowall", action="store_true", help="Tint wallpaper with Gowall")
+    set_parser.add_argument("--recolor", nargs="?", const="nearest", default=None, choices=RECOLOR_MODES,
+                            help="Map the wallpaper onto the palette (nearest, dither, blend; default nearest)")
+    set_parser.add_argument("--gowall", dest="recolor", action="store_const", const="nearest",
+                            help="Alias for --recolor nearest")
+    set_parser.add_argument("--grade", action="store_true",
+                            help="Show the wallpaper graded with the mood (full resolution, cached)")
+    set_parser.add_argument("--transition", nargs="?", type=int, const=CROSSFADE_FRAMES, default=None, metavar="FRAMES",
+                            help=f"Crossfade kitty/astal colors with the wallpaper transition (default {CROSSFADE_FRAMES} frames)")
+    set_parser.add_argument("--profile", action="store_true", help="Print per-step wall/CPU/memory and write a Chrome trace")
+    set_parser.add_argument("--trace", help="Trace output path (default: ~/.cache/theme-engine/trace-set.json)", default=None)
     set_parser.set_defaults(func=action_set)
     
     # COMPARE
     comp_parser = subparsers.add_parser("compare", help="Compare all moods against an image")
-    comp_parser.add_argument("image", help="Path to image")
+    comp_parser.add_argument("image", nargs="?", help="Path to image")
+    comp_parser.add_argument("--images", nargs="+", metavar="PATH", help="More images or folders; results stream as each finishes")
+    comp_parser.add_argument("--format", "-f", choices=["table", "json", "csv"], default="table", help="Output format (json: one object per line)")
+    comp_parser.add_argument("--jobs", "-j", type=int, default=None, help="Worker processes (default: CPU count)")
+    comp_parser.add_argument("--no-cache", action="store_true", help="Recompute every mood (true pipeline timings)")
     comp_parser.set_defaults(func=action_compare)
     
     # DAEMON
     daemon_parser = subparsers.add_parser("daemon", help="Run background daemon")
+    daemon_parser.add_argument("--debounce", type=int, default=500, help="Coalesce changes within this many ms (default: 500)")
     daemon_parser.set_defaults(func=action_daemon)
     
     # TEST
@@ -867,10 +1178,74 @@ def main():
     
     # PRECACHE
     precache_parser = subparsers.add_parser("precache", help="Pre-generate palettes for all images in a folder")
-    precache_parser.add_argument("folder", help="Path to wallpaper folder")
-    precache_parser.add_argument("--jobs", "-j", type=int, default=4, help="Parallel workers (default: 4)")
+    precache_parser.add_argument("folder", nargs="?", default=str(WALLPAPER_DIR), help=f"Path to wallpaper folder (default: {WALLPAPER_DIR})")
+    precache_parser.add_argument("--jobs", "-j", type=int, default=None, help="Worker processes (default: CPU count, 2 with --watch)")
+    precache_parser.add_argument("--watch", "-w", action="store_true", help="Keep running and precache new/modified images")
+    precache_parser.add_argument("--nice", type=int, default=10, help="Worker niceness increment in watch mode (default: 10)")
+    precache_parser.add_argument("--bundles", action="store_true", help="Also pre-render theme outputs (instant 'set')")
+    precache_parser.add_argument("--profile", action="store_true", help="Profile every task (wall/CPU/memory) and write a Chrome trace")
+    precache_parser.add_argument("--trace", help="Trace output path (default: ~/.cache/theme-engine/trace-precache.json)", default=None)
     precache_parser.set_defaults(func=action_precache)
     
+    # ROTATE
+    rotate_parser = subparsers.add_parser("rotate", help="Rotate wallpapers on a timer with prefetch")
+    rotate_parser.add_argument("folder", nargs="?", default=str(WALLPAPER_DIR), help=f"Wallpaper folder (default: {WALLPAPER_DIR})")
+    rotate_parser.add_argument("--interval", "-i", default="30m", help="Time per wallpaper, e.g. 90s, 15m, 1h (default: 30m)")
+    rotate_parser.add_argument("--order", choices=["sequential", "shuffle"], default="sequential", help="Rotation order")
+    rotate_parser.add_argument("--seed", type=int, default=None, help="Shuffle seed (reproducible order)")
+    rotate_parser.add_argument("--prefetch", type=int, default=2, help="Upcoming wallpapers to prepare ahead (default: 2)")
+    rotate_parser.add_argument("--mood", help="Mood to apply (default: active mood)", default=None)
+    rotate_parser.add_argument("--jobs", "-j", type=int, default=1, help="Prefetch worker processes (default: 1)")
+    rotate_parser.set_defaults(func=action_rotate)
+    
+    # CACHE
+    cache_parser = subparsers.add_parser("cache", help="Inspect and maintain the palette cache")
+    cache_sub = cache_parser.add_subparsers(dest="cache_command", required=True)
+    cache_sub.add_parser("stats", help="Show cache size and usage")
+    gc_parser = cache_sub.add_parser("gc", help="Evict least-recently-used palettes")
+    gc_parser.add_argument("--max-mb", type=float, default=None, help="Evict down to this size (default: configured cap)")
+    export_parser = cache_sub.add_parser("export", help="Dump all palettes as JSON")
+    export_parser.add_argument("--output", "-o", help="Write to file instead of stdout", default=None)
+    cache_parser.set_defaults(func=action_cache)
+    
+    # ICONS
+    icon_parser = subparsers.add_parser("icon", add_help=False,
+                                        help="Print the tinted path of one icon (tints on first request)")
+    icon_parser.add_argument("argv", nargs=argparse.REMAINDER, help="<name> [--role primary|accent] [--color HEX]")
+    icon_parser.set_defaults(func=action_icon)
+    icons_parser = subparsers.add_parser("icons", help="Tint all indexed icons for the active palette")
+    icons_parser.add_argument("--background", action="store_true", help=f"Detach and run at nice {ICONS_NICE}")
+    icons_parser.add_argument("--atlas", action="store_true", help="Also pack per-color atlases")
+    icons_parser.add_argument("--force", action="store_true", help="Re-tint even up-to-date icons")
+    icons_parser.set_defaults(func=action_icons)
+    
+    # BENCH
+    bench_parser = subparsers.add_parser("bench", help="Benchmark pipeline stages on a synthetic corpus")
+    bench_parser.add_argument("--repeat", "-n", type=int, default=5, help="Timed runs per image (default: 5)")
+    bench_parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per image (default: 1)")
+    bench_parser.add_argument("--mood", default="adaptive", help="Mood to run (default: adaptive)")
+    bench_parser.add_argument("--only", help="Comma-separated corpus images (e.g. 1080p,flat)", default=None)
+    bench_parser.add_argument("--output", "-o", help="Write results JSON", default=None)
+    bench_parser.add_argument("--trace", help="Write all timed runs as a Chrome trace", default=None)
+    bench_parser.add_argument("--baseline", default=str(BENCH_DIR / "baseline.json"), help="Baseline JSON to compare against")
+    bench_parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline")
+    bench_parser.add_argument("--threshold", type=float, default=0.2, help="Allowed median slowdown before failing (default: 0.2 = +20%%)")
+    bench_parser.set_defaults(func=action_bench)
+    
+    # FIDELITY
+    fid_parser = subparsers.add_parser("fidelity", help="Compare a candidate pipeline config against the reference")
+    fid_parser.add_argument("--set", "-s", action="append", default=[], metavar="KEY=VALUE",
+                            help="Candidate override, e.g. decode_size=256 or extraction.k_clusters=6 (repeatable)")
+    fid_parser.add_argument("--images", nargs="+", metavar="PATH", help="Images or folders (default: bench corpus)")
+    fid_parser.add_argument("--moods", help="Comma-separated moods (default: one per unique config)", default=None)
+    fid_parser.add_argument("--output", "-o", help="Write report JSON", default=None)
+    fid_parser.add_argument("--max-de2000-p95", type=float, default=2.0, help="Gate: pooled ΔE2000 p95 (default: 2.0)")
+    fid_parser.add_argument("--max-deok-p95", type=float, default=0.02, help="Gate: pooled ΔEOK p95 (default: 0.02)")
+    fid_parser.add_argument("--min-anchor-match", type=float, default=0.9, help="Gate: anchor match rate (default: 0.9)")
+    fid_parser.add_argument("--min-template-agreement", type=float, default=0.9, help="Gate: template agreement rate (default: 0.9)")
+    fid_parser.add_argument("--min-speedup", type=float, default=None, help="Gate: minimum speedup (default: none)")
+    fid_parser.set_defaults(func=action_fidelity)
+    
     args = parser.parse_args()
     args.func(args)
 
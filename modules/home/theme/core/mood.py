@@ -7,7 +7,9 @@ Applies color grading to wallpaper BEFORE extraction.
 from dataclasses import dataclass
 from typing import Tuple, Optional
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageFilter
+
+from core.profiler import timed
 
 @dataclass
 class MoodConfig:
@@ -24,6 +26,9 @@ class MoodConfig:
     lut_size: int = 17 
 
 
+# LUT size for grading the displayed wallpaper (trilinear error <= ~3/255 vs the direct math)
+DISPLAY_LUT_SIZE = 33
+
 # Mood presets
 MOOD_PRESETS = {
     # Default: mild cleanup, mostly identity
@@ -86,6 +91,19 @@ MOOD_PRESETS = {
     ),
 }
 
+@timed("decode")
+def load_image(img_path: str, max_size: int = 512) -> np.ndarray:
+    """
+    Decode an image and downsample it to Uint8 RGB.
+    Extraction downsamples to 128 anyway, so ~512 keeps grading cheap.
+    """
+    # Load with Pillow for formats
+    with Image.open(img_path) as pil_img:
+        pil_img = pil_img.convert('RGB')
+        pil_img.thumbnail((max_size, max_size))
+        return np.array(pil_img, dtype=np.uint8)
+
+
 class MoodEngine:
     """Applies mood-based color grading to images via 3D LUT."""
     
@@ -99,22 +117,22 @@ class MoodEngine:
         Resizes to manageable size for extraction if needed, but here we usually 
         process full or reasonably sized image.
         """
-        # Load with Pillow for formats
-        with Image.open(img_path) as pil_img:
-            pil_img = pil_img.convert('RGB')
-            # Extract can handle large images, but for performance let's cap at 1024px?
-            # Actually extraction.py downsamples to 128 anyway. 
-            # So let's downsample here to ~512 to apply LUT faster.
-            pil_img.thumbnail((512, 512))
-            
-            # Convert to numpy
-            img = np.array(pil_img, dtype=np.float32) / 255.0
-            
-            return self._apply_lut(img)
+        return self.grade(load_image(img_path))
+
+    @timed("mood")
+    def grade(self, img: np.ndarray) -> np.ndarray:
+        """Grade a decoded Uint8 RGB buffer, return float32 RGB (0-1)."""
+        return self._apply_lut(img.astype(np.float32) / 255.0)
 
-    def _generate_lut(self) -> np.ndarray:
+    def pillow_lut(self, size: Optional[int] = None) -> ImageFilter.Color3DLUT:
+        """The grading LUT as a Pillow filter (C trilinear interpolation, r varies fastest)."""
+        size = size or self.config.lut_size
+        lut = self._lut if size == self.config.lut_size else self._generate_lut(size)
+        return ImageFilter.Color3DLUT(size, lut.transpose(2, 1, 0, 3).reshape(-1).tolist())
+
+    def _generate_lut(self, size: Optional[int] = None) -> np.ndarray:
         """Generates a 3D LUT (size x size x size x 3) based on config."""
-        s = self.config.lut_size
+        s = size or self.config.lut_size
         
         # 1. Create Identity Cube
         x = np.linspace(0, 1, s)
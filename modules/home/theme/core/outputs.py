@@ -0,0 +1,108 @@
+"""
+outputs.py — Theme Outputs
+Everything a theme application writes, rendered in memory from a palette.
+
+Used directly by `magician set` and to pre-render output bundles.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.derive import ANTIGRAVITY, NOCTALIA, resolve_mapping
+from core.profiler import span, timed
+from core.renderer import RenderPass, render_string
+
+
+def template_targets(config_home: Path, cache_home: Path) -> List[Tuple[str, Path]]:
+    """(template name, destination) for every rendered template."""
+    return [
+        ("ags-colors.css", cache_home / "wal" / "ags-colors.css"),
+        ("kitty.conf", cache_home / "wal" / "colors-kitty.conf"),
+        ("rofi.rasi", cache_home / "wal" / "colors-rofi.rasi"),
+        ("starship.toml", config_home / "starship.toml"),
+        ("niri.kdl", config_home / "niri" / "colors.kdl"),
+        ("zed.json", config_home / "zed" / "themes" / "LisTheme.json"),
+        ("vesktop.css", config_home / "vesktop" / "themes" / "lis.css"),
+        ("wezterm.lua", cache_home / "wal" / "colors-wezterm.lua"),
+        ("antigravity.template", Path.home() / ".antigravity" / "extensions" / "lis-theme" / "themes" / "lis-theme.json"),
+        ("hyfetch.json", config_home / "hyfetch.json"),
+        ("zellij.kdl", config_home / "zellij" / "themes" / "default.kdl"),
+        ("gtk.css", config_home / "gtk-4.0" / "gtk.css"),
+        ("colors.sh", cache_home / "wal" / "colors.sh")
+    ]
+
+
+def antigravity_paths(config_home: Path) -> Tuple[Path, Path]:
+    """(settings-base.json, settings.json) for the Antigravity merge."""
+    user_dir = config_home / "Antigravity" / "User"
+    return user_dir / "settings-base.json", user_dir / "settings.json"
+
+
+def antigravity_settings(base_data: Dict, c: Dict) -> Dict:
+    """Merge palette workbench colors into the user's base settings."""
+    customizations = base_data.get("workbench.colorCustomizations", {})
+    customizations.update(resolve_mapping(c, ANTIGRAVITY))
+    base_data["workbench.colorCustomizations"] = customizations
+    return base_data
+
+
+def noctalia_colors(c: Dict) -> Dict:
+    """Noctalia (MD3-style) colors from Lis-OS keys (see derive.NOCTALIA)."""
+    return resolve_mapping(c, NOCTALIA)
+
+
+@timed("render")
+def render_outputs(palette: Dict, template_dir: Path, config_home: Path, cache_home: Path,
+                   inputs: Optional[Set[Path]] = None) -> Dict[Path, str]:
+    """
+    Render every output file for a palette, without touching the destinations.
+    With `inputs` (see output_inputs), only the outputs of those files are rendered.
+
+    Returns:
+        dict of destination path -> file content (insertion order = write order)
+    """
+    outputs: Dict[Path, str] = {}
+    if inputs is not None:
+        inputs = set(inputs)
+
+    # Palette State
+    if inputs is None:
+        palette_json = json.dumps(palette, indent=2)
+        outputs[cache_home / "theme-engine" / "palette.json"] = palette_json
+        outputs[config_home / "astal" / "appearance.json"] = palette_json
+
+    # Templates (filter results shared across all of them)
+    render_pass = RenderPass(palette)
+    for tpl_name, dest in template_targets(config_home, cache_home):
+        src = template_dir / tpl_name
+        if src.exists() and (inputs is None or src in inputs):
+            with span(f"template:{tpl_name}"):
+                outputs[dest] = render_string(src.read_text(), palette, render_pass)
+
+    # Antigravity Settings
+    settings_base, settings_final = antigravity_paths(config_home)
+    if settings_base.exists() and (inputs is None or settings_base in inputs):
+        try:
+            with span("antigravity"), open(settings_base) as f:
+                base_data = json.load(f)
+                outputs[settings_final] = json.dumps(antigravity_settings(base_data, palette["colors"]), indent=4)
+        except Exception as e:
+            print(f"Error updating Antigravity settings: {e}")
+
+    # Noctalia Shim
+    if inputs is not None:
+        return outputs
+    try:
+        with span("noctalia"):
+            outputs[config_home / "noctalia" / "colors.json"] = json.dumps(noctalia_colors(palette["colors"]), indent=2)
+    except Exception as e:
+        print(f"Error generating Noctalia shim: {e}")
+
+    return outputs
+
+
+def output_inputs(template_dir: Path, config_home: Path, cache_home: Path) -> List[Path]:
+    """Files whose changes invalidate pre-rendered outputs."""
+    inputs = [template_dir / tpl_name for tpl_name, _ in template_targets(config_home, cache_home)]
+    inputs.append(antigravity_paths(config_home)[0])
+    return inputs
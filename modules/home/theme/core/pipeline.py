@@ -0,0 +1,234 @@
+"""
+pipeline.py — Color Science v2
+Staged Mood -> Extract -> Generate pipeline with per-stage artifact caching.
+
+Every stage output is cached under a key derived from the image hash, the
+stage's algorithm version and the configs it (and its upstream stages)
+depends on. A generator-only change therefore re-runs only generation.
+"""
+import io
+import json
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import blake3
+
+from core.mood import MoodConfig, MoodEngine, get_mood, load_image
+from core.extraction import ExtractionConfig, PerceptualExtractor
+from core.generator import PaletteGenerator, PaletteConfig
+from core.derive import PALETTE_KEYS, resolve
+from core.profiler import timed
+
+# Bump a stage's version whenever its output changes for the same inputs.
+# Downstream stages are invalidated automatically (their keys chain upstream).
+STAGE_VERSIONS = {
+    "decode": 1,    # load_image (Pillow decode + thumbnail)
+    "saliency": 1,  # MoodEngine grading + spectral residual
+    "clusters": 1,  # Weighted K-Means
+    "palette": 1,   # PaletteGenerator + map_colors
+}
+
+DECODE_SIZE = 512
+
+
+def image_hash(image_path: str) -> str:
+    """Get Blake3 hash of file contents for cache key."""
+    hasher = blake3.blake3()
+    with open(image_path, 'rb') as f:
+        # Stream in chunks for large images
+        for chunk in iter(lambda: f.read(65536), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()[:16]  # Short hash is sufficient
+
+
+def fingerprint(*parts) -> str:
+    """Short stable hash of configs (dataclasses) and plain values."""
+    payload = [asdict(p) if hasattr(p, "__dataclass_fields__") else p for p in parts]
+    return blake3.blake3(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def resolve_mood(mood_name: str) -> Tuple[MoodConfig, PaletteConfig]:
+    """
+    Effective grading + generator configs for a mood name.
+    Unknown names (e.g. moods.json-only moods) resolve to the preset that
+    get_mood() falls back to, so the generator sees the same mood too.
+    """
+    mood_cfg = get_mood(mood_name)
+    return mood_cfg, PaletteConfig(mood=mood_cfg.name)
+
+
+def group_moods(mood_names: List[str]) -> Dict[str, List[str]]:
+    """
+    Group mood names that resolve to the same effective configs.
+    Keys are config fingerprints, values keep the input order.
+    """
+    groups: Dict[str, List[str]] = {}
+    for name in mood_names:
+        groups.setdefault(fingerprint(*resolve_mood(name)), []).append(name)
+    return groups
+
+
+@timed("map_colors")
+def map_colors(raw_colors):
+    """Map V2 scientific keys to V1 system keys w/ derivations (see derive.GRAPH)."""
+    return resolve(raw_colors, PALETTE_KEYS)
+
+
+def _pack_array(arr: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _unpack_array(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class Pipeline:
+    """
+    Runs Mood -> Extract -> Generate for (image, mood), reusing cached stages.
+
+    Stages are resolved lazily from the end: a palette hit skips everything,
+    a clusters hit skips decode/grading/saliency/K-Means, and so on.
+    Without a store every stage is computed (used for benchmarking).
+    """
+
+    def __init__(self, store=None, extraction: ExtractionConfig = ExtractionConfig(),
+                 decode_size: int = DECODE_SIZE):
+        self.store = store
+        self.extraction = extraction
+        self.decode_size = decode_size
+
+    # --- Keys ---
+
+    def variant(self, mood_name: str) -> str:
+        """Palette cache key component: stage versions + effective configs."""
+        mood_cfg, pal_cfg = resolve_mood(mood_name)
+        parts = [STAGE_VERSIONS, mood_cfg, self.extraction, pal_cfg]
+        if self.decode_size != DECODE_SIZE:
+            # Only non-default sizes enter the key, so existing entries stay valid
+            parts.append(self.decode_size)
+        return f"v{STAGE_VERSIONS['palette']}-{fingerprint(*parts)}"
+
+    def decode_key(self, img_hash: str) -> str:
+        return f"decode:{img_hash}:{fingerprint(STAGE_VERSIONS['decode'], self.decode_size)}"
+
+    def stage_keys(self, img_hash: str, mood_cfg: MoodConfig) -> Dict[str, str]:
+        v = STAGE_VERSIONS
+        decode = self.decode_key(img_hash)
+        saliency = f"saliency:{img_hash}:{fingerprint(decode, v['saliency'], mood_cfg, self.extraction.downsample_size)}"
+        clusters = f"clusters:{img_hash}:{fingerprint(saliency, v['clusters'], self.extraction)}"
+        return {"decode": decode, "saliency": saliency, "clusters": clusters}
+
+    # --- Cache Helpers ---
+
+    def _load(self, key: str) -> Optional[bytes]:
+        return self.store.get_artifact(key) if self.store else None
+
+    def _save(self, key: str, img_hash: str, data: bytes):
+        if self.store:
+            self.store.put_artifact(key, key.split(":", 1)[0], img_hash, data)
+
+    # --- Stages ---
+
+    def decode(self, img_path: Path, img_hash: str) -> np.ndarray:
+        """Decoded + downsampled Uint8 RGB buffer (shared by all moods)."""
+        key = self.decode_key(img_hash)
+        cached = self._load(key)
+        if cached is not None:
+            return _unpack_array(cached)
+        img = load_image(str(img_path), self.decode_size)
+        self._save(key, img_hash, _pack_array(img))
+        return img
+
+    def clusters(self, img_path: Path, img_hash: str, mood_cfg: MoodConfig,
+                 decoded: Optional[np.ndarray] = None) -> Dict:
+        """Anchor/palette/weights for this image under a mood's grading."""
+        keys = self.stage_keys(img_hash, mood_cfg)
+        cached = self._load(keys["clusters"])
+        if cached is not None:
+            return json.loads(cached)
+
+        if decoded is None:
+            decoded = self.decode(img_path, img_hash)
+        extractor = PerceptualExtractor(self.extraction)
+        img_rgb = extractor.load_rgb(MoodEngine(mood_cfg).grade(decoded))
+
+        cached = self._load(keys["saliency"])
+        if cached is not None:
+            saliency = _unpack_array(cached)
+        else:
+            saliency = extractor.saliency.get_saliency_map(img_rgb)
+            self._save(keys["saliency"], img_hash, _pack_array(saliency))
+
+        extracted = extractor.cluster(img_rgb, saliency)
+        self._save(keys["clusters"], img_hash, json.dumps(extracted).encode())
+        return extracted
+
+    def generate(self, extracted: Dict, mood_name: str) -> Dict:
+        """Harmonic palette in the V1 schema from clustered colors."""
+        _, pal_cfg = resolve_mood(mood_name)
+        generator = PaletteGenerator(config=pal_cfg)
+        gen_result = generator.generate(extracted['anchor'], extracted['palette'], extracted['weights'])
+        return {
+            "colors": map_colors(gen_result['colors']),
+            "active_mood": mood_name,
+            "harmonic_template": gen_result['template'],
+            "harmonic_rotation": gen_result['rotation']
+        }
+
+    # --- Entry Points ---
+
+    def cached(self, img_hash: str, mood_name: str) -> Optional[Dict]:
+        if not self.store:
+            return None
+        return self.store.get(img_hash, mood_name, self.variant(mood_name))
+
+    def run(self, img_path: Path, mood_name: str, img_hash: Optional[str] = None,
+            decoded: Optional[np.ndarray] = None) -> Dict:
+        """Full pipeline for one mood; stores every stage it had to compute."""
+        palettes, _ = self.run_group(img_path, [mood_name], img_hash, decoded)
+        return palettes[mood_name]
+
+    def run_group(self, img_path: Path, mood_names: List[str], img_hash: Optional[str] = None,
+                  decoded: Optional[np.ndarray] = None) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """
+        Run moods that share effective configs (see group_moods) once.
+
+        The palette is computed for the first missing name (or taken from
+        any cached row with the same config) and aliased to the others.
+
+        Returns:
+            (palettes by mood name, status by mood name: cached/aliased/generated)
+        """
+        img_hash = img_hash or image_hash(str(img_path))
+        variant = self.variant(mood_names[0])
+        palettes: Dict[str, Dict] = {}
+        status: Dict[str, str] = {}
+
+        for name in mood_names:
+            hit = self.cached(img_hash, name)
+            if hit:
+                palettes[name] = hit
+                status[name] = "cached"
+
+        missing = [name for name in mood_names if name not in palettes]
+        if not missing:
+            return palettes, status
+
+        base = next(iter(palettes.values()), None)
+        if base is None and self.store:
+            base = self.store.find(img_hash, variant)
+        if base is None:
+            mood_cfg, _ = resolve_mood(missing[0])
+            extracted = self.clusters(img_path, img_hash, mood_cfg, decoded)
+            base = self.generate(extracted, missing[0])
+            status[missing[0]] = "generated"
+
+        for name in missing:
+            palettes[name] = {**base, "active_mood": name}
+            status.setdefault(name, "aliased")
+            if self.store:
+                self.store.put(img_hash, name, variant, palettes[name], source=str(img_path))
+        return palettes, status
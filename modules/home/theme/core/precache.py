@@ -0,0 +1,292 @@
+"""
+precache.py — Palette Precache Scheduler
+Runs (image -> all moods) tasks on a process pool with live progress.
+
+The pipeline is GIL-bound Python (coloraide loops, template fitting, solver),
+so threads do not scale. Each task decodes its image once and runs every
+mood on the shared buffer; results are committed to the store as they
+finish, so an interrupted run resumes by simply running it again.
+"""
+import os
+import sys
+import time
+import signal
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.bundle import bundle_dir, ensure_bundle
+from core.cache import PaletteStore
+from core.pipeline import Pipeline, group_moods, image_hash
+from core.profiler import Profiler, span
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
+
+# Per-process pipeline, created by _init_worker
+_pipeline: Optional[Pipeline] = None
+
+
+def find_images(folder: Path) -> List[Path]:
+    return sorted(f for f in folder.iterdir() if f.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def _init_worker(db_path: Optional[str], max_bytes: int, niceness: int = 0):
+    """Pool initializer: ignore Ctrl-C (parent coordinates), open own store (None: uncached)."""
+    global _pipeline
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if niceness:
+        os.nice(niceness)
+    # One process per core already; keep BLAS/OpenMP (K-Means) single-threaded
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=1)
+    _pipeline = Pipeline(PaletteStore(Path(db_path), max_bytes=max_bytes) if db_path else None)
+
+
+def worker_pipeline() -> Pipeline:
+    """The pipeline of the current pool worker."""
+    return _pipeline
+
+
+def make_pool(db_path: Optional[Path], max_bytes: int, jobs: int, niceness: int = 0) -> ProcessPoolExecutor:
+    """Process pool whose workers each hold a Pipeline bound to the store."""
+    return ProcessPoolExecutor(
+        max_workers=max(1, jobs),
+        initializer=_init_worker,
+        initargs=(str(db_path) if db_path else None, max_bytes, niceness),
+    )
+
+
+def precache_image(
+    img_path: str,
+    groups: List[List[str]],
+    bundles: Optional[Dict] = None,
+    profile: bool = False,
+) -> Tuple[str, List[Tuple[str, str]], List[Dict]]:
+    """
+    Worker task: one image, every mood group, sharing a single decode.
+    Each group (moods with identical effective configs) is computed once.
+
+    With `bundles` (bundles_root, template_dir, config_home, cache_home),
+    the outputs of every mood are also pre-rendered. With `profile`, the
+    task's spans are returned for the parent to merge (else empty).
+    """
+    if not profile:
+        name, results = _precache_image(img_path, groups, bundles)
+        return name, results, []
+    profiler = Profiler(memory=True)
+    with profiler, span("precache_image", image=Path(img_path).name):
+        name, results = _precache_image(img_path, groups, bundles)
+    return name, results, profiler.spans
+
+
+def _precache_image(img_path: str, groups: List[List[str]], bundles: Optional[Dict]):
+    path = Path(img_path)
+    results = []
+    try:
+        img_hash = image_hash(img_path)
+        decoded = None
+        for group in groups:
+            palettes = {mood: _pipeline.cached(img_hash, mood) for mood in group}
+            if all(palettes.values()):
+                status = {mood: "cached" for mood in group}
+            else:
+                if decoded is None:
+                    decoded = _pipeline.decode(path, img_hash)
+                try:
+                    palettes, status = _pipeline.run_group(path, group, img_hash=img_hash, decoded=decoded)
+                except Exception as e:
+                    results.extend((mood, f"failed ({e})") for mood in group)
+                    continue
+            for mood in group:
+                if bundles and _bundle(img_hash, mood, palettes[mood], bundles):
+                    status[mood] += "+bundle"
+                results.append((mood, status[mood]))
+    except Exception as e:
+        results.append(("error", str(e)))
+    return path.name, results
+
+
+def _bundle(img_hash: str, mood: str, palette: Dict, opts: Dict) -> bool:
+    """Pre-render outputs for one palette. Returns True if a bundle was (re)built."""
+    target = bundle_dir(opts["bundles_root"], img_hash, mood)
+    return ensure_bundle(target, palette, opts["template_dir"], opts["config_home"], opts["cache_home"])
+
+
+class Progress:
+    """Single live status line: done/total, throughput and ETA."""
+
+    def __init__(self, total: int, unit: str = "img"):
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.start = time.time()
+        self.live = sys.stdout.isatty()
+
+    def line(self) -> str:
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - self.done) / rate if rate > 0 else 0.0
+        return (f"   [{self.done}/{self.total}] {rate:.2f} {self.unit}/s "
+                f"elapsed {_fmt_duration(elapsed)} ETA {_fmt_duration(remaining)}")
+
+    def log(self, message: str):
+        """Print a result line without clobbering the live status line."""
+        if self.live:
+            sys.stdout.write("\r\033[K" + message + "\n" + self.line())
+            sys.stdout.flush()
+        else:
+            print(message)
+
+    def advance(self, message: Optional[str] = None):
+        self.done += 1
+        if message:
+            self.log(message)
+        elif self.live:
+            sys.stdout.write("\r\033[K" + self.line())
+            sys.stdout.flush()
+
+    def finish(self):
+        if self.live:
+            sys.stdout.write("\r\033[K")
+        print(self.line())
+
+
+def _fmt_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def run_precache(
+    images: List[Path],
+    moods: List[str],
+    db_path: Path,
+    max_bytes: int,
+    jobs: Optional[int] = None,
+    on_result: Optional[Callable[[str, List[Tuple[str, str]]], None]] = None,
+    bundles: Optional[Dict] = None,
+    profiler: Optional[Profiler] = None,
+) -> Dict:
+    """
+    Precache every (image, mood) on a process pool.
+
+    Moods resolving to the same effective configs are computed once per
+    image and aliased. Tasks are submitted largest file first so big
+    images do not straggle at the end; idle workers pull the next task
+    from the shared queue.
+
+    A `profiler` receives the spans of every worker task.
+
+    Returns:
+        dict with done/total counts, status counts and whether the run was interrupted
+    """
+    jobs = jobs or os.cpu_count() or 1
+    groups = list(group_moods(moods).values())
+    ordered = sorted(images, key=lambda p: p.stat().st_size, reverse=True)
+    progress = Progress(len(ordered))
+    counts: Dict[str, int] = {}
+    interrupted = False
+
+    executor = make_pool(db_path, max_bytes, min(jobs, len(ordered)))
+    try:
+        futures = [executor.submit(precache_image, str(img), groups, bundles, profiler is not None) for img in ordered]
+        for future in as_completed(futures):
+            name, results, spans = future.result()
+            if profiler is not None:
+                profiler.extend(spans)
+            for _, status in results:
+                counts[status] = counts.get(status, 0) + 1
+            if on_result:
+                on_result(name, results)
+            status = ", ".join(f"{m}:{s}" for m, s in results)
+            progress.advance(f"   {name}: {status}")
+    except KeyboardInterrupt:
+        interrupted = True
+        if progress.live:
+            sys.stdout.write("\r\033[K")
+        print("\n:: Interrupted. Finishing running tasks (completed palettes are kept)...")
+        executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=True)
+
+    progress.finish()
+    return {"done": progress.done, "total": progress.total, "counts": counts, "interrupted": interrupted}
+
+
+def watch_precache(
+    folder: Path,
+    moods: List[str],
+    db_path: Path,
+    max_bytes: int,
+    jobs: int = 2,
+    niceness: int = 10,
+    debounce_ms: int = 2000,
+    settle_s: float = 2.0,
+    bundles: Optional[Dict] = None,
+):
+    """
+    Watch a folder and precache new or modified images in the background.
+
+    watchfiles already coalesces bursts into one batch per debounce window;
+    files are additionally held back until their size stops changing, so a
+    bulk copy is only processed once each file is complete. Workers run at
+    low priority and at most `jobs` at a time.
+    """
+    from watchfiles import watch, Change, DefaultFilter
+
+    class ImageFilter(DefaultFilter):
+        def __call__(self, change: Change, path: str) -> bool:
+            return super().__call__(change, path) and Path(path).suffix.lower() in IMAGE_EXTENSIONS
+
+    groups = list(group_moods(moods).values())
+    pending: Dict[Path, Tuple[int, float]] = {}  # path -> (last size, last change)
+    running: Dict[Path, object] = {}
+    requeue = set()
+
+    executor = make_pool(db_path, max_bytes, jobs, niceness)
+    print(f":: Watching {folder} ({jobs} workers, nice +{niceness}). Ctrl-C to stop.")
+    try:
+        for changes in watch(folder, watch_filter=ImageFilter(), debounce=debounce_ms,
+                             recursive=False, rust_timeout=int(settle_s * 1000), yield_on_timeout=True):
+            now = time.time()
+            for change, raw in changes:
+                path = Path(raw)
+                if change == Change.deleted:
+                    pending.pop(path, None)
+                elif path in running:
+                    requeue.add(path)
+                else:
+                    pending[path] = (-1, now)
+
+            # Reap finished tasks
+            for path, future in list(running.items()):
+                if future.done():
+                    del running[path]
+                    try:
+                        name, results, _ = future.result()
+                        print(f"   {name}: " + ", ".join(f"{m}:{st}" for m, st in results), flush=True)
+                    except Exception as e:
+                        print(f"   [!] {path.name}: {e}", flush=True)
+                    if path in requeue:
+                        requeue.discard(path)
+                        pending[path] = (-1, now)
+
+            # Submit files whose size has settled
+            for path, (last_size, changed_at) in list(pending.items()):
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    del pending[path]
+                    continue
+                if size != last_size:
+                    pending[path] = (size, now)
+                elif now - changed_at >= settle_s:
+                    del pending[path]
+                    running[path] = executor.submit(precache_image, str(path), groups, bundles)
+    except KeyboardInterrupt:
+        print("\n:: Watcher stopped.")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,191 @@
+"""
+profiler.py — Stage Profiler
+Named timing spans around pipeline stages and theme application steps.
+
+Spans cost a global lookup when no Profiler is active, so the hooks stay
+in place in production code. `magician bench` activates one per run,
+`set --profile` and `precache --profile` one per command (with memory).
+
+Each span records wall time, CPU time (process), nesting depth and,
+with memory=True, the tracemalloc peak above the span's starting usage.
+Results export as a Chrome trace (chrome://tracing, Perfetto) and as a
+text summary.
+"""
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional
+
+_active: Optional["Profiler"] = None
+
+
+class _Frame:
+    __slots__ = ("name", "args", "start", "cpu", "mem", "child_peak")
+
+    def __init__(self, name: str, args: Dict, start: float, cpu: float, mem: int):
+        self.name = name
+        self.args = args
+        self.start = start
+        self.cpu = cpu
+        self.mem = mem
+        self.child_peak = 0
+
+
+class Profiler:
+    """
+    Collects spans while active (use as a context manager).
+
+    Spans are dicts: name, args, start, wall, cpu (seconds), peak (bytes or None),
+    depth, pid, tid.
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.spans: List[Dict] = []
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def __enter__(self) -> "Profiler":
+        global _active
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    # --- Recording ---
+
+    def _stack(self) -> List[_Frame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def push(self, name: str, args: Optional[Dict] = None):
+        stack = self._stack()
+        mem = 0
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # Keep the parent's peak so far before resetting for the child
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            mem = current
+        stack.append(_Frame(name, args or {}, time.perf_counter(), time.process_time(), mem))
+
+    def pop(self):
+        stack = self._stack()
+        frame = stack.pop()
+        wall = time.perf_counter() - frame.start
+        cpu = time.process_time() - frame.cpu
+        peak = None
+        if self.memory:
+            absolute = max(tracemalloc.get_traced_memory()[1], frame.child_peak)
+            peak = max(0, absolute - frame.mem)
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, absolute)
+            tracemalloc.reset_peak()
+        self.spans.append({
+            "name": frame.name,
+            "args": frame.args,
+            "start": frame.start,
+            "wall": wall,
+            "cpu": cpu,
+            "peak": peak,
+            "depth": len(stack),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        })
+
+    def extend(self, spans: List[Dict]):
+        """Merge spans recorded elsewhere (e.g. by pool workers)."""
+        self.spans.extend(spans)
+
+    # --- Reports ---
+
+    def totals(self) -> Dict[str, float]:
+        """Summed wall seconds per span name (repeated stages add up)."""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s["name"]] = totals.get(s["name"], 0.0) + s["wall"]
+        return totals
+
+    def chrome_trace(self) -> Dict:
+        """Trace Event Format ("X" complete events, microseconds)."""
+        origin = min((s["start"] for s in self.spans), default=0.0)
+        events = []
+        for s in self.spans:
+            args = {**s.get("args", {}), "cpu_ms": round(s["cpu"] * 1000, 3)}
+            if s["peak"] is not None:
+                args["peak_kib"] = round(s["peak"] / 1024, 1)
+            events.append({
+                "name": s["name"],
+                "ph": "X",
+                "ts": round((s["start"] - origin) * 1e6, 1),
+                "dur": round(s["wall"] * 1e6, 1),
+                "pid": s["pid"],
+                "tid": s["tid"],
+                "args": args,
+            })
+        events.sort(key=lambda e: (e["pid"], e["ts"]))
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> str:
+        """Per-name totals (count, wall, CPU, max peak), in first-seen order, indented by depth."""
+        rows: Dict[str, Dict] = {}
+        for s in sorted(self.spans, key=lambda s: s["start"]):
+            row = rows.setdefault(s["name"], {"count": 0, "wall": 0.0, "cpu": 0.0, "peak": None, "depth": s["depth"]})
+            row["count"] += 1
+            row["wall"] += s["wall"]
+            row["cpu"] += s["cpu"]
+            if s["peak"] is not None:
+                row["peak"] = max(row["peak"] or 0, s["peak"])
+
+        lines = [f"{'STAGE':<34}{'COUNT':>6}{'WALL ms':>10}{'CPU ms':>10}{'PEAK KiB':>10}", "-" * 70]
+        for name, row in rows.items():
+            label = ("  " * row["depth"] + name)[:33]
+            peak = f"{row['peak'] / 1024:>10.1f}" if row["peak"] is not None else f"{'-':>10}"
+            lines.append(f"{label:<34}{row['count']:>6}{row['wall'] * 1000:>10.1f}{row['cpu'] * 1000:>10.1f}{peak}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def span(name: str, **args):
+    """Time a block under `name` if a Profiler is active (args go into the trace)."""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    profiler.push(name, args)
+    try:
+        yield
+    finally:
+        profiler.pop()
+
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
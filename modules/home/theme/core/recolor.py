@@ -0,0 +1,150 @@
+"""
+recolor.py — Wallpaper Recolor
+Maps every pixel of the wallpaper onto the palette, in process (replaces
+`gowall convert`).
+
+A 3D LUT over the sRGB cube holds the result for each cell: the nearest
+palette color in Oklab, or (blend) an Oklab mix of the closest ones. The
+full image is then mapped band by band (see tiles.py). Results are cached
+by (image hash, palette hash) so re-applying a theme is a file lookup.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import blake3
+import numpy as np
+from PIL import Image, ImageFilter
+
+from core.color import hex_to_array, oklab_to_srgb, srgb_to_oklab
+from core.profiler import span
+from core.tiles import load_rgb, map_tiles, save_rgb
+
+# Bump when the LUT/mapping changes (invalidates cached images)
+RECOLOR_VERSION = 1
+LUT_SIZE = 33
+MODES = ("nearest", "dither", "blend")
+
+# Ordered-dither amplitude (sRGB 0-1) and blend softness (Oklab distance)
+DITHER_STRENGTH = 0.08
+BLEND_SIGMA = 0.06
+
+# Roles the wallpaper is mapped onto, in priority order
+ROLES = [
+    "bg", "fg", "ui_prim", "ui_sec",
+    "sem_red", "sem_green", "sem_yellow", "sem_blue",
+    "surface", "surfaceLighter", "surfaceDarker",
+]
+
+_BAYER = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.float32) / 64.0 - 0.5
+
+
+def palette_colors(colors: Dict[str, str]) -> List[str]:
+    """Unique opaque role colors (lowercase hex), in ROLES order."""
+    out: List[str] = []
+    for role in ROLES:
+        value = str(colors.get(role, "")).lower()
+        if value.startswith("#") and len(value) == 7 and value not in out:
+            out.append(value)
+    return out
+
+
+def palette_hash(hexes: List[str], mode: str) -> str:
+    payload = json.dumps([RECOLOR_VERSION, LUT_SIZE, mode, hexes])
+    return blake3.blake3(payload.encode()).hexdigest()[:12]
+
+
+def build_lut(hexes: List[str], mode: str = "nearest", size: int = LUT_SIZE) -> np.ndarray:
+    """
+    (size, size, size, 3) float32 sRGB table indexed [r, g, b].
+
+    nearest/dither: every cell holds its nearest palette color (ΔE in Oklab).
+    blend: a Gaussian-weighted Oklab mix of the palette around the cell.
+    """
+    axis = np.linspace(0.0, 1.0, size)
+    grid = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+    cells = srgb_to_oklab(grid)
+
+    pal_rgb = hex_to_array(hexes)[:, :3]
+    pal_lab = srgb_to_oklab(pal_rgb)
+    d2 = ((cells[:, None, :] - pal_lab[None, :, :]) ** 2).sum(axis=-1)  # (cells, colors)
+
+    if mode == "blend":
+        weights = np.exp(-(d2 - d2.min(axis=1, keepdims=True)) / (2 * BLEND_SIGMA ** 2))
+        weights /= weights.sum(axis=1, keepdims=True)
+        table = oklab_to_srgb(weights @ pal_lab)
+    else:
+        table = pal_rgb[d2.argmin(axis=1)]
+    return table.reshape(size, size, size, 3).astype(np.float32)
+
+
+def recolor_array(rgb: np.ndarray, lut: np.ndarray, mode: str = "nearest",
+                  threads: Optional[int] = None) -> np.ndarray:
+    """Apply a build_lut() table to a uint8 RGB image, band by band."""
+    size = lut.shape[0]
+
+    if mode == "blend":
+        # Smooth table: trilinear interpolation in Pillow's C kernel (r varies fastest)
+        table = ImageFilter.Color3DLUT(size, lut.transpose(2, 1, 0, 3).reshape(-1).tolist())
+
+        def band(tile: np.ndarray, y0: int) -> np.ndarray:
+            return np.asarray(Image.fromarray(tile).filter(table))
+    else:
+        lut8 = np.rint(lut * 255).astype(np.uint8)
+        scale = (size - 1) / 255.0
+
+        def band(tile: np.ndarray, y0: int) -> np.ndarray:
+            x = tile.astype(np.float32) * scale
+            if mode == "dither":
+                h, w = tile.shape[:2]
+                rows = _BAYER[(np.arange(y0, y0 + h) % 8)[:, None], (np.arange(w) % 8)[None, :]]
+                x += rows[..., None] * (DITHER_STRENGTH * (size - 1))
+            idx = np.clip(np.rint(x), 0, size - 1).astype(np.intp)
+            return lut8[idx[..., 0], idx[..., 1], idx[..., 2]]
+
+    return map_tiles(rgb, band, threads)
+
+
+def recolor_path(cache_dir: Path, img_hash: str, colors: Dict[str, str], mode: str) -> Path:
+    return cache_dir / f"{img_hash}-{palette_hash(palette_colors(colors), mode)}.png"
+
+
+def ensure_recolored(img_path: Path, img_hash: str, colors: Dict[str, str], mode: str,
+                     cache_dir: Path, threads: Optional[int] = None) -> Path:
+    """
+    Recolored wallpaper for (image, palette, mode), built on first use.
+
+    Raises:
+        ValueError: unknown mode or no usable palette colors
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown recolor mode {mode!r} (available: {', '.join(MODES)})")
+    hexes = palette_colors(colors)
+    if not hexes:
+        raise ValueError("Palette has no opaque role colors")
+
+    dest = recolor_path(cache_dir, img_hash, colors, mode)
+    if dest.exists():
+        os.utime(dest)  # LRU order for tiles.prune_cache
+        return dest
+
+    with span("recolor:lut", mode=mode):
+        lut = build_lut(hexes, mode)
+    with span("recolor:decode"):
+        rgb = load_rgb(img_path)
+    with span("recolor:map", pixels=int(rgb.shape[0] * rgb.shape[1])):
+        out = recolor_array(rgb, lut, mode, threads)
+    with span("recolor:encode"):
+        save_rgb(out, dest)
+    return dest
+
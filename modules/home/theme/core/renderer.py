@@ -1,10 +1,108 @@
 """
 Template Renderer
 Performs {key} → value substitution for legacy template compatibility.
+
+Placeholders may carry filters, applied left to right and computed only
+when a template uses them:
+
+    {ui_prim|alpha:0.8}   #RRGGBBAA
+    {bg|rgb}              r, g, b (0-255)
+    {fg|lighten:0.1}      Oklch lightness +0.1 ({x|darken:0.1} for -0.1)
+    {bg|strip}            hex without the leading '#'
 """
+import re
 import shutil
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from core.derive import Derivations
+
+# {key} or {key|filter|filter:arg...}; anything else in braces is left alone
+PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)((?:\|[a-z_]+(?::[^|{}\s]+)?)*)\}")
+
+
+def _rgb(d: Derivations, value: str, arg: Optional[str]) -> str:
+    r, g, b = (round(v * 255) for v in d.color(value).convert("srgb").fit("srgb").coords())
+    return f"{r}, {g}, {b}"
+
+
+FILTERS: Dict[str, Callable[[Derivations, str, Optional[str]], str]] = {
+    "alpha": lambda d, value, arg: d.alpha(value, float(arg)),
+    "rgb": _rgb,
+    "lighten": lambda d, value, arg: d.shift(value, float(arg)),
+    "darken": lambda d, value, arg: d.shift(value, -float(arg)),
+    "strip": lambda d, value, arg: value.lstrip("#"),
+}
+
+
+class RenderPass:
+    """
+    Palette values plus filter results, shared by every template rendered
+    for one palette (each distinct expression is evaluated once).
+    """
+
+    def __init__(self, context: Dict[str, Any]):
+        # Flatten context: {"colors": {...}} → {...}
+        self.data = context.get("colors", context)
+        self.derivations = Derivations()
+        self._resolved: Dict[str, Optional[str]] = {}
+
+    def resolve(self, key: str, filters: str) -> Optional[str]:
+        """Value for `key` + `|filter...` chain, or None to leave the placeholder as-is."""
+        expr = key + filters
+        if expr in self._resolved:
+            return self._resolved[expr]
+
+        value = str(self.data[key]) if key in self.data else None
+        for item in filters.split("|")[1:] if value is not None else []:
+            name, _, arg = item.partition(":")
+            func = FILTERS.get(name)
+            try:
+                if func is None:
+                    raise ValueError(f"unknown filter '{name}'")
+                value = func(self.derivations, value, arg or None)
+            except Exception as e:
+                print(f"Warning: Cannot render {{{expr}}}: {e}")
+                value = None
+                break
+
+        self._resolved[expr] = value
+        return value
+
+
+def compile_template(content: str) -> List[Union[str, Tuple[str, str, str]]]:
+    """
+    Split template text into literals and (key, filters, original) placeholders,
+    so a template rendered many times (e.g. per crossfade frame) is parsed once.
+    """
+    parts: List[Union[str, Tuple[str, str, str]]] = []
+    pos = 0
+    for match in PLACEHOLDER.finditer(content):
+        parts.append(content[pos:match.start()])
+        parts.append((match.group(1), match.group(2), match.group(0)))
+        pos = match.end()
+    parts.append(content[pos:])
+    return parts
+
+
+def render_compiled(parts: List[Union[str, Tuple[str, str, str]]], render_pass: RenderPass) -> str:
+    """Render a compile_template() result against one palette."""
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+        else:
+            value = render_pass.resolve(part[0], part[1])
+            out.append(part[2] if value is None else value)
+    return "".join(out)
+
+
+def render_string(content: str, context: Dict[str, Any], render_pass: Optional[RenderPass] = None) -> str:
+    """
+    Replace {key} placeholders in template text with palette values.
+    Pass the same `render_pass` to share filter results between templates.
+    """
+    return render_compiled(compile_template(content), render_pass or RenderPass(context))
 
 
 def render_template(template_path: Path, output_path: Path, context: Dict[str, Any]):
@@ -18,20 +116,14 @@ def render_template(template_path: Path, output_path: Path, context: Dict[str, A
 
     with open(template_path, 'r') as f:
         content = f.read()
-        
-    # Flatten context: {"colors": {...}} → {...}
-    data = context.get("colors", context)
-    
-    # Legacy {key} replacement (matches sed s|{key}|val|g behavior)
-    for key, value in data.items():
-        placeholder = f"{{{key}}}"
-        content = content.replace(placeholder, str(value))
-        
+
+    content = render_string(content, context)
+
     # Atomic Write
     output_path.parent.mkdir(parents=True, exist_ok=True)
     tmp_path = output_path.with_suffix('.tmp')
-    
+
     with open(tmp_path, 'w') as f:
         f.write(content)
-        
+
     shutil.move(tmp_path, output_path)
@@ -1,19 +1,26 @@
+"""
+resolve_icons.py — Icon Resolver
+Prints (or writes with --output) `app_id|icon_path` for every .desktop entry
+(read by icons.py). Results are cached per .desktop file and mtime, so a run
+only resolves apps that were added or changed.
+
+Lookups follow the freedesktop icon theme spec in pure Python (theme
+inheritance, hicolor fallback, size matching, pixmaps); `--gtk` also asks
+Gtk.IconTheme and reports where the two disagree.
+
+Runs under its own python env (pygobject + pycairo only): keep it free of
+core imports and third-party packages.
+"""
+import argparse
 import configparser
+import hashlib
+import json
 import os
 import sys
 
-import gi
-
 # Enable Debugging
 # sys.stderr = open(os.devnull, 'w')
 
-try:
-    gi.require_version("Gtk", "3.0")
-    from gi.repository import GLib, Gtk
-except Exception as e:
-    print(f"GTK Import Error: {e}", file=sys.stderr)
-    sys.exit(1)
-
 # Aliases to force specific icons if the main one is missing/generic
 ALIASES = {
     "thunar": ["system-file-manager", "file-manager", "folder"],
@@ -25,6 +32,22 @@ ALIASES = {
 }
 
 
+# Theme index (see ThemeIndex)
+INDEX_VERSION = 3
+INDEX_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "lis-icons", "themes"
+)
+LOOKUP_SIZE = 48
+CONTEXTS = {"Applications": 0, "Places": 1}  # Preferred contexts, in order (others follow)
+DIR_CONTEXTS = {"apps": "Applications", "places": "Places"}  # For themes without index.theme
+EXTENSIONS = {".svg": 0, ".png": 1}
+PIXMAP_EXTENSIONS = {".svg": 0, ".png": 1, ".xpm": 2}
+
+# Per-.desktop resolutions (see resolve_icons)
+RESOLVE_VERSION = 3
+RESOLVE_CACHE = os.path.join(os.path.dirname(INDEX_DIR), "resolved.json")
+
+
 def get_current_theme():
     try:
         config_path = os.path.expanduser("~/.config/gtk-3.0/settings.ini")
@@ -39,9 +62,10 @@ def get_current_theme():
 
 
 def get_data_dirs():
-    dirs = list(GLib.get_system_data_dirs())
-    dirs.append(GLib.get_user_data_dir())
+    # Same as GLib.get_system_data_dirs() + GLib.get_user_data_dir()
     home = os.path.expanduser("~")
+    dirs = [d for d in (os.environ.get("XDG_DATA_DIRS") or "/usr/local/share/:/usr/share/").split(":") if d]
+    dirs.append(os.environ.get("XDG_DATA_HOME") or os.path.join(home, ".local", "share"))
     user = os.environ.get("USER", "lune")
     dirs.append(f"/etc/profiles/per-user/{user}/share")
     dirs.append(os.path.join(home, ".nix-profile", "share"))
@@ -49,146 +73,447 @@ def get_data_dirs():
     return dirs
 
 
-def manual_search(theme_name, icon_name):
-    """Brute force search in specific theme."""
-    if not icon_name or not theme_name:
-        return None
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def read_theme(root):
+    """
+    ({subdir: (context, type, size, min, max, threshold, scale)}, inherits)
+    from index.theme, or guessed from `<size>/<context>` names when the
+    theme has none.
+    """
+    dirs = {}
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    try:
+        parser.read(os.path.join(root, "index.theme"), encoding="utf-8")
+    except (configparser.Error, UnicodeDecodeError):
+        pass
 
-    for d in get_data_dirs():
-        theme_dir = os.path.join(d, "icons", theme_name)
-        if not os.path.isdir(theme_dir):
-            continue
+    if parser.has_section("Icon Theme"):
+        listed = parser.get("Icon Theme", "Directories", fallback="")
+        listed += "," + parser.get("Icon Theme", "ScaledDirectories", fallback="")
+        inherits = [t.strip() for t in parser.get("Icon Theme", "Inherits", fallback="").split(",") if t.strip()]
+        for sub in filter(None, (d.strip() for d in listed.split(","))):
+            if not parser.has_section(sub) or sub in dirs:
+                continue
+            sec = parser[sub]
+            size = _int(sec.get("Size"), 0)
+            dirs[sub] = (
+                sec.get("Context", ""),
+                sec.get("Type", "Threshold"),
+                size,
+                _int(sec.get("MinSize"), size),
+                _int(sec.get("MaxSize"), size),
+                _int(sec.get("Threshold"), 2),
+                _int(sec.get("Scale"), 1),
+            )
+        return dirs, inherits
 
-        # Check standard subdirs
-        subdirs = [
-            "scalable/apps",
-            "48x48/apps",
-            "32x32/apps",
-            "128x128/apps",
-            "scalable/places",
-            "48x48/places",
+    try:
+        for size_entry in os.scandir(root):
+            if not size_entry.is_dir():
+                continue
+            size = 0 if size_entry.name == "scalable" else _int(size_entry.name.split("x")[0], None)
+            if size is None:
+                continue
+            for ctx_entry in os.scandir(size_entry.path):
+                if not ctx_entry.is_dir():
+                    continue
+                sub = f"{size_entry.name}/{ctx_entry.name}"
+                context = DIR_CONTEXTS.get(ctx_entry.name, ctx_entry.name)
+                if size:
+                    dirs[sub] = (context, "Fixed", size, size, size, 0, 1)
+                else:
+                    dirs[sub] = (context, "Scalable", LOOKUP_SIZE, 1, 512, 0, 1)
+    except OSError:
+        pass
+    return dirs, []
+
+
+def size_distance(kind, size, min_size, max_size, threshold, target=LOOKUP_SIZE):
+    """Freedesktop DirectorySizeDistance (0 = the directory matches `target`)."""
+    if kind == "Fixed":
+        return abs(size - target)
+    if kind == "Scalable":
+        lo, hi = min_size, max_size
+    else:
+        lo, hi = size - threshold, size + threshold
+    if target < lo:
+        return lo - target
+    if target > hi:
+        return target - hi
+    return 0
+
+
+class ThemeIndex:
+    """
+    name -> best icon path for one theme, merged across all data dirs.
+
+    Built by one os.scandir pass over the theme's directories (per
+    index.theme); best = preferred context, unscaled, scalable, closest size
+    to LOOKUP_SIZE, earlier data dir, SVG over PNG. Persisted in
+    INDEX_DIR and reused while the theme's directories keep their mtimes;
+    `version` changes whenever the index content may have.
+    """
+
+    def __init__(self, theme_name):
+        self.theme_name = theme_name
+        self.roots = [
+            os.path.join(d, "icons", theme_name)
+            for d in get_data_dirs()
+            if os.path.isdir(os.path.join(d, "icons", theme_name))
         ]
-
-        for sub in subdirs:
-            # Try SVG
-            target = os.path.join(theme_dir, sub, f"{icon_name}.svg")
-            if os.path.exists(target):
-                return target
-            # Try PNG
-            target_png = os.path.join(theme_dir, sub, f"{icon_name}.png")
-            if os.path.exists(target_png):
-                return target_png
-
-    return None
+        self.cache_file = os.path.join(INDEX_DIR, f"{theme_name}.json")
+        loaded = self._load()
+        if loaded is None:
+            self.icons, self.inherits, self.stamp = self._build()
+            self._save()
+        else:
+            self.icons, self.inherits, self.stamp = loaded
+        payload = json.dumps([INDEX_VERSION, self.roots, self.stamp], sort_keys=True)
+        self.version = hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+    def get(self, icon_name):
+        return self.icons.get(icon_name)
+
+    @staticmethod
+    def _stamp(paths):
+        """
+        {path: [realpath, mtime_ns]}, keyed by the unresolved path so a
+        repointed symlink shows up (Nix store paths all have mtime 1, and the
+        old target usually still exists).
+        """
+        stamp = {}
+        for path in paths:
+            try:
+                real = os.path.realpath(path)
+                stamp[path] = [real, os.stat(real).st_mtime_ns]
+            except OSError:
+                pass
+        return stamp
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("version") != INDEX_VERSION or cached.get("roots") != self.roots:
+            return None
+        stamp = cached.get("stamp", {})
+        if self._stamp(stamp) != stamp:
+            return None
+        return cached.get("icons", {}), cached.get("inherits", []), stamp
+
+    def _build(self):
+        best = {}
+        inherits = None
+        scanned = []
+        for order, root in enumerate(self.roots):
+            scanned += [root, os.path.join(root, "index.theme")]
+            dirs, parents = read_theme(root)
+            if inherits is None and os.path.exists(os.path.join(root, "index.theme")):
+                inherits = parents  # The first index.theme wins, as in GTK
+            for sub, (context, kind, size, min_size, max_size, threshold, scale) in dirs.items():
+                path = os.path.join(root, sub)
+                rank = (
+                    CONTEXTS.get(context, len(CONTEXTS)),
+                    0 if scale == 1 else 1,
+                    0 if kind == "Scalable" else 1,
+                    size_distance(kind, size, min_size, max_size, threshold),
+                    order,
+                )
+                try:
+                    entries = list(os.scandir(path))
+                except OSError:
+                    continue
+                scanned.append(path)
+                for entry in entries:
+                    name, ext = os.path.splitext(entry.name)
+                    if ext not in EXTENSIONS:
+                        continue
+                    key = rank + (EXTENSIONS[ext],)
+                    if name not in best or key < best[name][0]:
+                        best[name] = (key, entry.path)
+        return {name: path for name, (_, path) in best.items()}, inherits or [], self._stamp(scanned)
+
+    def _save(self):
+        payload = {
+            "version": INDEX_VERSION, "roots": self.roots, "stamp": self.stamp,
+            "inherits": self.inherits, "icons": self.icons,
+        }
+        try:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            tmp = self.cache_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            print(f"Warning: could not save icon index for {self.theme_name}: {e}", file=sys.stderr)
+
+
+class ThemeChain:
+    """
+    Freedesktop lookup order for the user theme: the theme, then its
+    Inherits (depth first), then hicolor, then unthemed pixmaps.
+    """
+
+    def __init__(self, user_theme):
+        self.indexes = []
+        seen = set()
+
+        def visit(name):
+            if name in seen or name == "hicolor":
+                return
+            seen.add(name)
+            index = ThemeIndex(name)
+            self.indexes.append(index)
+            for parent in index.inherits:
+                visit(parent)
+
+        visit(user_theme)
+        self.indexes.append(ThemeIndex("hicolor"))
+
+        self.pixmaps = {}
+        pixmap_dirs = [os.path.join(d, "pixmaps") for d in get_data_dirs()]
+        for folder in pixmap_dirs:
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                if ext in PIXMAP_EXTENSIONS and name not in self.pixmaps:
+                    self.pixmaps[name] = entry.path
+
+        payload = json.dumps([[i.theme_name, i.version] for i in self.indexes] + [ThemeIndex._stamp(pixmap_dirs)])
+        self.version = hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+    def themed(self, icon_name):
+        """Icon from the user theme itself."""
+        return self.indexes[0].get(icon_name)
+
+    def lookup(self, icon_name):
+        for index in self.indexes:
+            path = index.get(icon_name)
+            if path:
+                return path
+        return self.pixmaps.get(icon_name)
 
 
 def scan_desktop_files():
+    """
+    {app_id: (desktop file, (realpath, mtime_ns))}; later data dirs override
+    earlier ones. The stamp follows symlinks by path: Nix store files all
+    have mtime 1, so a package update only shows as a new target.
+    """
     apps = {}
     for data_dir in get_data_dirs():
         app_dir = os.path.join(data_dir, "applications")
         if not os.path.isdir(app_dir):
             continue
         try:
-            for filename in os.listdir(app_dir):
-                if not filename.endswith(".desktop"):
+            for entry in os.scandir(app_dir):
+                if not entry.name.endswith(".desktop"):
                     continue
-                filepath = os.path.join(app_dir, filename)
-                icon_name = None
                 try:
-                    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                        for line in f:
-                            if line.strip().startswith("Icon="):
-                                icon_name = line.strip().split("=", 1)[1]
-                                break
-                except:
+                    real = os.path.realpath(entry.path)
+                    stamp = [real, os.stat(real).st_mtime_ns]
+                except OSError:
                     continue
-                if icon_name:
-                    clean_id = filename.replace(".desktop", "")
-                    apps[clean_id] = icon_name
+                apps[entry.name.replace(".desktop", "")] = (entry.path, stamp)
         except OSError:
             continue
     return apps
 
 
-def lookup_path(theme, icon_name, theme_name_str):
+def read_icon_name(filepath):
+    try:
+        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.strip().startswith("Icon="):
+                    return line.strip().split("=", 1)[1]
+    except OSError:
+        pass
+    return None
+
+
+def lookup_path(icon_name, chain, gtk_lookup=None):
     if not icon_name:
         return None
     if icon_name.startswith("/"):
         return icon_name if os.path.exists(icon_name) else None
 
-    # 1. Try GTK Standard Lookup (Might return hicolor)
-    gtk_path = None
-    try:
-        icon_info = theme.lookup_icon(icon_name, 48, Gtk.IconLookupFlags.USE_BUILTIN)
-        if icon_info:
-            f = icon_info.get_filename()
-            if f and not f.startswith("/org/") and os.path.exists(f):
-                gtk_path = f
-    except:
-        pass
-
-    # 2. Try Brute Force in User Theme (Prefer this!)
-    manual = manual_search(theme_name_str, icon_name)
+    # 1. Try the User Theme itself (Prefer this!)
+    manual = chain.themed(icon_name)
     if manual:
         return manual
 
-    # 3. Try Brute Force in Hicolor (Fallback for Zed etc)
-    if not gtk_path:
-        manual_fallback = manual_search("hicolor", icon_name)
-        if manual_fallback:
-            return manual_fallback
+    # 2. Standard Lookup: GTK when cross-checking, else the freedesktop chain
+    # (inherited themes, then hicolor: the fallback for Zed etc)
+    if gtk_lookup:
+        gtk_path = gtk_lookup(icon_name)
+        if gtk_path:
+            return gtk_path
+    return chain.lookup(icon_name)
 
-    return gtk_path
 
+def make_gtk_lookup(user_theme):
+    """Gtk.IconTheme lookup for --gtk (imported lazily: it dominates startup)."""
+    try:
+        import gi
+        gi.require_version("Gtk", "3.0")
+        from gi.repository import Gtk
+    except Exception as e:
+        print(f"GTK Import Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
-def resolve_icons():
     theme = Gtk.IconTheme.new()
-    user_theme = get_current_theme()
-    print(f"DEBUG: Active Theme: {user_theme}", file=sys.stderr)
     theme.set_custom_theme(user_theme)
 
     for d in get_data_dirs():
         theme.append_search_path(os.path.join(d, "icons"))
         theme.append_search_path(os.path.join(d, "pixmaps"))
 
-    apps = scan_desktop_files()
+    def lookup(icon_name):
+        try:
+            icon_info = theme.lookup_icon(icon_name, LOOKUP_SIZE, Gtk.IconLookupFlags.USE_BUILTIN)
+            if icon_info:
+                f = icon_info.get_filename()
+                if f and not f.startswith("/org/") and os.path.exists(f):
+                    return f
+        except Exception:
+            pass
+        return None
+
+    return lookup
+
+
+def resolve_app(app_id, icon_input, user_theme, chain, gtk_lookup=None):
+    # Step A: Get the "Best Effort" path for the requested icon name
+    # This might be Tela (Good) or Hicolor (Bad for Thunar, Good for Zed)
+    initial_path = lookup_path(icon_input, chain, gtk_lookup)
+
+    # Helper: Is this path "Themed" (Tela)?
+    def is_themed(p):
+        return p and user_theme in p
 
-    for app_id, icon_input in apps.items():
-        # Step A: Get the "Best Effort" path for the requested icon name
-        # This might be Tela (Good) or Hicolor (Bad for Thunar, Good for Zed)
-        initial_path = lookup_path(theme, icon_input, user_theme)
+    final_path = initial_path
 
-        # Helper: Is this path "Themed" (Tela)?
-        def is_themed(p):
-            return p and user_theme in p
+    # Step B: If the result is NOT themed (it's hicolor/system), try aliases to find a themed one
+    if not is_themed(initial_path):
+        candidates = []
+        if app_id in ALIASES:
+            candidates.extend(ALIASES[app_id])
+        if "." in icon_input:
+            candidates.append(icon_input.split(".")[-1])
+        if "-" in icon_input:
+            candidates.append(icon_input.split("-")[0])
+        candidates.append(icon_input.lower())
 
-        final_path = initial_path
+        for cand in candidates:
+            better = lookup_path(cand, chain, gtk_lookup)
 
-        # Step B: If the result is NOT themed (it's hicolor/system), try aliases to find a themed one
-        if not is_themed(initial_path):
-            candidates = []
-            if app_id in ALIASES:
-                candidates.extend(ALIASES[app_id])
-            if "." in icon_input:
-                candidates.append(icon_input.split(".")[-1])
-            if "-" in icon_input:
-                candidates.append(icon_input.split("-")[0])
-            candidates.append(icon_input.lower())
+            # If we found a THEMED version via alias, take it immediately!
+            if is_themed(better):
+                final_path = better
+                break
 
-            for cand in candidates:
-                better = lookup_path(theme, cand, user_theme)
+    if final_path and ("zed" in app_id or "thunar" in app_id):
+        print(f"DEBUG: {app_id} -> {final_path}", file=sys.stderr)
+    return final_path
 
-                # If we found a THEMED version via alias, take it immediately!
-                if is_themed(better):
-                    final_path = better
-                    break
 
-        # Output result (If final_path is None, we truly found nothing)
-        if final_path:
-            print(f"{app_id}|{final_path}")
-            if "zed" in app_id or "thunar" in app_id:
-                print(f"DEBUG: {app_id} -> {final_path}", file=sys.stderr)
+def load_resolved(key):
+    """Cached {desktop file: {"stamp", "path"}} if it was made for `key`."""
+    try:
+        with open(RESOLVE_CACHE, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cached.get("key") != key:
+        return {}
+    return cached.get("entries", {})
+
+
+def write_if_changed(path, text):
+    """Atomic write, skipped when the file already holds `text`. Returns True if written."""
+    try:
+        with open(path, "r") as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
+
+
+def resolve_icons(output=None, use_gtk=False):
+    user_theme = get_current_theme()
+    print(f"DEBUG: Active Theme: {user_theme}", file=sys.stderr)
+
+    chain = ThemeChain(user_theme)
+
+    # Any theme change re-resolves everything (index lookups are cheap)
+    key = [RESOLVE_VERSION, user_theme, chain.version, use_gtk]
+    cached = load_resolved(key)
+
+    gtk_lookup = make_gtk_lookup(user_theme) if use_gtk else None
+    mismatches = 0
+    entries = {}
+    lines = []
+    resolved = 0
+    for app_id, (desktop_file, stamp) in scan_desktop_files().items():
+        entry = cached.get(desktop_file)
+        # A resolved path can also vanish on its own (e.g. Icon=/nix/store/... after gc)
+        stale = not entry or entry.get("stamp") != stamp or (entry["path"] and not os.path.exists(entry["path"]))
+        if stale:
+            icon_input = read_icon_name(desktop_file)
+            final_path = None
+            if icon_input:
+                final_path = resolve_app(app_id, icon_input, user_theme, chain)
+                if gtk_lookup:
+                    gtk_path = resolve_app(app_id, icon_input, user_theme, chain, gtk_lookup)
+                    if gtk_path != final_path:
+                        mismatches += 1
+                        print(f"DEBUG: GTK differs for {app_id}: {final_path} (pure) vs {gtk_path} (gtk)", file=sys.stderr)
+                    final_path = gtk_path
+            entry = {"stamp": stamp, "path": final_path}
+            resolved += 1
+        entries[desktop_file] = entry
+
+        # Output result (If path is None, we truly found nothing)
+        if entry["path"]:
+            lines.append(f"{app_id}|{entry['path']}")
+
+    print(f"DEBUG: Resolved {resolved} of {len(entries)} apps", file=sys.stderr)
+    if gtk_lookup:
+        print(f"DEBUG: GTK cross-check: {mismatches} of {resolved} differ", file=sys.stderr)
+    if resolved or len(entries) != len(cached):
+        try:
+            write_if_changed(RESOLVE_CACHE, json.dumps({"key": key, "entries": entries}))
+        except OSError as e:
+            print(f"Warning: could not save resolve cache: {e}", file=sys.stderr)
+
+    text = "".join(f"{line}\n" for line in lines)
+    if output:
+        if write_if_changed(output, text):
+            print(f"DEBUG: Updated {output}", file=sys.stderr)
+    else:
+        sys.stdout.write(text)
 
 
 if __name__ == "__main__":
-    resolve_icons()
+    parser = argparse.ArgumentParser(description="Resolve .desktop icons to files (app_id|path)")
+    parser.add_argument("--output", "-o", help="Write the map here (only when it changed) instead of stdout")
+    parser.add_argument("--gtk", action="store_true", help="Also look up with Gtk.IconTheme, report differences and prefer GTK")
+    args = parser.parse_args()
+    resolve_icons(args.output, args.gtk)
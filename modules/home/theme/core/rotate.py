@@ -0,0 +1,66 @@
+"""
+rotate.py — Wallpaper Rotation
+Deterministic rotation order (sequential or seeded shuffle) with lookahead,
+so the scheduler can prefetch the next wallpapers while one is displayed.
+"""
+import re
+import random
+from pathlib import Path
+from typing import List, Optional
+
+from core.precache import find_images
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(text: str) -> float:
+    """Parse '90', '90s', '15m', '1h30m' into seconds."""
+    text = text.strip().lower()
+    if re.fullmatch(r"\d+(\.\d+)?", text):
+        return float(text)
+    parts = re.findall(r"(\d+(?:\.\d+)?)([smhd])", text)
+    if not parts or "".join(n + u for n, u in parts) != text:
+        raise ValueError(f"Invalid interval: {text!r} (use e.g. 90s, 15m, 1h30m)")
+    return sum(float(n) * _UNITS[u] for n, u in parts)
+
+
+class RotationQueue:
+    """
+    Endless wallpaper order over a folder.
+
+    Each pass over the folder is one cycle; shuffled cycles are drawn from a
+    single seeded RNG, so the full sequence is reproducible for a given seed.
+    The folder is rescanned at every cycle boundary to pick up new images.
+    """
+
+    def __init__(self, folder: Path, order: str = "sequential", seed: Optional[int] = None):
+        self.folder = folder
+        self.order = order
+        self.rng = random.Random(seed)
+        self._queue: List[Path] = []
+        self._last: Optional[Path] = None
+
+    def _refill(self):
+        cycle = find_images(self.folder)
+        if self.order == "shuffle":
+            self.rng.shuffle(cycle)
+            # Avoid showing the same wallpaper twice across a cycle boundary
+            if len(cycle) > 1 and cycle[0] == (self._queue[-1] if self._queue else self._last):
+                cycle.append(cycle.pop(0))
+        self._queue.extend(cycle)
+
+    def upcoming(self, n: int) -> List[Path]:
+        """Peek at the next n wallpapers without consuming them."""
+        while len(self._queue) < n:
+            before = len(self._queue)
+            self._refill()
+            if len(self._queue) == before:
+                break
+        return self._queue[:n]
+
+    def next(self) -> Optional[Path]:
+        upcoming = self.upcoming(1)
+        if not upcoming:
+            return None
+        self._last = self._queue.pop(0)
+        return self._last
@@ -7,6 +7,9 @@ Ensures all fg/bg pairs meet accessibility requirements.
 from coloraide import Color
 from typing import Tuple, Optional
 
+from core.profiler import timed
+
+@timed("solver")
 def solve_contrast(
     bg_hex: str,
     target_hue: float,
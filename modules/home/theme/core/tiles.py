@@ -0,0 +1,93 @@
+"""
+tiles.py — Tiled Image Processing
+Applies a per-pixel transform to a full-resolution image in row bands on a
+thread pool, so working buffers stay bounded (threads x band) whatever the
+resolution. NumPy and Pillow release the GIL in their kernels.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Set
+
+import numpy as np
+from PIL import Image, ImageOps
+
+TILE_ROWS = 256
+
+
+def default_threads() -> int:
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def map_tiles(
+    src: np.ndarray,
+    fn: Callable[[np.ndarray, int], np.ndarray],
+    threads: Optional[int] = None,
+    tile_rows: int = TILE_ROWS,
+) -> np.ndarray:
+    """
+    out[y0:y1] = fn(src[y0:y1], y0) for every band of `tile_rows` rows.
+    `fn` gets a read-only view and the band's first row (for positional
+    effects such as dithering) and returns uint8 of the same shape.
+    """
+    out = np.empty_like(src)
+
+    def work(y0: int):
+        out[y0:y0 + tile_rows] = fn(src[y0:y0 + tile_rows], y0)
+
+    starts = range(0, src.shape[0], tile_rows)
+    threads = threads or default_threads()
+    if threads == 1:
+        for y0 in starts:
+            work(y0)
+    else:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(work, starts))
+    return out
+
+
+def load_rgb(path: Path) -> np.ndarray:
+    """Full-resolution uint8 RGB (EXIF orientation applied)."""
+    with Image.open(path) as img:
+        return np.asarray(ImageOps.exif_transpose(img).convert("RGB"))
+
+
+def save_rgb(arr: np.ndarray, dest: Path):
+    """Atomic write by suffix: JPEG q95 or fast-compression PNG (these are caches, not archives)."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".tmp")
+    if dest.suffix.lower() in (".jpg", ".jpeg"):
+        Image.fromarray(arr).save(tmp, format="JPEG", quality=95)
+    else:
+        Image.fromarray(arr).save(tmp, format="PNG", compress_level=1)
+    os.replace(tmp, dest)
+
+
+def prune_cache(cache_dir: Path, live_hashes: Set[str], max_bytes: int) -> int:
+    """
+    For caches of derived images named `{img_hash}-{key}.ext`: remove those
+    whose image has no stored palette, then the least recently used (mtime)
+    until the directory fits `max_bytes`.
+    """
+    if not cache_dir.is_dir():
+        return 0
+    removed = 0
+    files = []
+    for path in cache_dir.iterdir():
+        if not path.is_file() or path.name.endswith(".tmp"):
+            continue
+        if path.name.split("-", 1)[0] not in live_hashes:
+            path.unlink(missing_ok=True)
+            removed += 1
+        else:
+            st = path.stat()
+            files.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
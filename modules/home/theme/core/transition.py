@@ -0,0 +1,119 @@
+"""
+transition.py — Palette Crossfade
+Intermediate palettes between the applied theme and the new one, played
+back at a fixed frame rate alongside the swww wallpaper transition.
+
+Every frame is computed up front in one vectorized Oklab interpolation;
+playback only renders precompiled templates and pushes them, dropping
+frames (never stretching the timeline) when a push runs late.
+"""
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from core.color import array_to_hex, hex_to_array, oklab_to_srgb, srgb_to_oklab
+from core.profiler import span
+
+
+def _is_hex(value) -> bool:
+    if not isinstance(value, str) or not value.startswith("#") or len(value) not in (7, 9):
+        return False
+    try:
+        int(value[1:], 16)
+        return True
+    except ValueError:
+        return False
+
+
+def ease(t: np.ndarray) -> np.ndarray:
+    """Smoothstep: eased in and out, like swww's default transition curve."""
+    return t * t * (3.0 - 2.0 * t)
+
+
+def interpolate_palettes(old: Dict[str, str], new: Dict[str, str], frames: int) -> List[Dict[str, str]]:
+    """
+    `frames` palettes stepping from `old` to `new` (the last one is `new` exactly).
+    Keys missing from `old`, or not plain hex, switch at the first frame.
+    """
+    frames = max(1, frames)
+    keys = [k for k, v in new.items() if _is_hex(v) and _is_hex(old.get(k))]
+
+    steps: List[Dict[str, str]] = [dict(new) for _ in range(frames)]
+    if not keys:
+        return steps
+
+    start, end = hex_to_array([old[k] for k in keys]), hex_to_array([new[k] for k in keys])
+    t = ease(np.arange(1, frames + 1) / frames)[:, None, None]  # (frames, 1, 1)
+
+    lab = srgb_to_oklab(start[:, :3]) + t * (srgb_to_oklab(end[:, :3]) - srgb_to_oklab(start[:, :3]))
+    alpha = start[:, 3:] + t * (end[:, 3:] - start[:, 3:])
+    rgba = np.concatenate([oklab_to_srgb(lab), alpha], axis=-1)  # (frames, keys, 4)
+
+    for i in range(frames - 1):
+        steps[i].update(zip(keys, array_to_hex(rgba[i])))
+    return steps
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"median": 0.0, "p95": 0.0, "max": 0.0}
+    arr = np.array(samples) * 1000
+    return {
+        "median": round(float(np.median(arr)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+def play(steps: List[Dict[str, str]], duration: float, push: Callable[[Dict[str, str]], None]) -> Dict:
+    """
+    Push each palette at its slot on a fixed timeline of `duration` seconds.
+    A frame is dropped when the next frame's slot has already passed (the
+    final frame is always pushed).
+
+    Returns:
+        frame stats: requested/pushed/dropped counts and push/lateness
+        distributions (ms)
+    """
+    interval = duration / max(1, len(steps))
+    push_times: List[float] = []
+    lateness: List[float] = []
+    dropped = 0
+
+    start = time.perf_counter()
+    for i, colors in enumerate(steps):
+        due = start + i * interval
+        now = time.perf_counter()
+        last = i == len(steps) - 1
+        if not last and now > due + interval:
+            dropped += 1
+            continue
+        if now < due:
+            time.sleep(due - now)
+
+        t0 = time.perf_counter()
+        lateness.append(max(0.0, t0 - due))
+        with span("crossfade:frame", frame=i):
+            push(colors)
+        push_times.append(time.perf_counter() - t0)
+
+    return {
+        "frames": len(steps),
+        "pushed": len(push_times),
+        "dropped": dropped,
+        "fps": round(len(steps) / duration, 1) if duration else 0.0,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "push_ms": _percentiles(push_times),
+        "late_ms": _percentiles(lateness),
+    }
+
+
+def format_stats(stats: Dict) -> str:
+    push, late = stats["push_ms"], stats["late_ms"]
+    return (
+        f"{stats['pushed']}/{stats['frames']} frames @ {stats['fps']} fps "
+        f"({stats['dropped']} dropped, {stats['elapsed_ms']:.0f} ms) | "
+        f"push p50 {push['median']:.1f} / p95 {push['p95']:.1f} / max {push['max']:.1f} ms | "
+        f"late p95 {late['p95']:.1f} ms"
+    )
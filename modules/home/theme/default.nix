@@ -44,6 +44,28 @@ in
     };
   };
 
+  # 2b. Background Precache (new wallpapers are cache hits by the time they are applied)
+  systemd.user.services.theme-precache-watch = {
+    Unit = {
+      Description = "Lis-OS Wallpaper Precache Watcher";
+      After = [ "graphical-session-pre.target" ];
+      PartOf = [ "graphical-session.target" ];
+      # No wallpaper dir: skip instead of restarting every 10s forever
+      ConditionPathIsDirectory = "%h/Pictures/Wallpapers";
+    };
+
+    Service = {
+      ExecStart = "${themePkgs.precacheScript}/bin/theme-precache --watch";
+      Nice = 10;
+      Restart = "on-failure";
+      RestartSec = "10s";
+    };
+
+    Install = {
+      WantedBy = [ "graphical-session.target" ];
+    };
+  };
+
   # 3. Import the actual config modules
   imports = [
     ./gtk.nix
@@ -1,6 +1,6 @@
 { pkgs, config, ... }:
 let
-  # 1. Python Environment (For icon resolution)
+  # 1. Python Environment (For icon resolution; GTK is only used by `resolve-icons --gtk`)
   pythonEnv = pkgs.python3.withPackages (ps: [
     ps.pygobject3
     ps.pycairo
@@ -19,16 +19,16 @@ let
   resolveIconsScript = pkgs.writeShellScriptBin "resolve-icons" ''
     export GI_TYPELIB_PATH="${typelibPath}:$GI_TYPELIB_PATH"
     export XDG_DATA_DIRS="$XDG_DATA_DIRS"
-    ${pythonEnv}/bin/python3 ${./core/resolve_icons.py}
+    exec ${pythonEnv}/bin/python3 ${./core/resolve_icons.py} "$@"
   '';
 
   # 3. Engine Runtime Dependencies
   runtimeDeps = [
     pkgs.coreutils
     pkgs.jq
-    pkgs.gowall
+    # pkgs.gowall  # REMOVED: Wallpaper recolor is in-process (core/recolor.py)
     # pkgs.pastel  # REMOVED: Now using native coloraide
-    # pkgs.imagemagick  # DISABLED: Only needed for icon tinting (see icons.py)
+    pkgs.imagemagick # Icon rasterization (icons.py)
     pkgs.swww
     pkgs.libnotify
     pkgs.procps
@@ -91,6 +91,8 @@ let
 
   magicianScript = pkgs.writeShellScriptBin "magician" ''
     export PYTHONPATH="${./.}:$PYTHONPATH"
+    # Icon commands exec these (the bar calls `magician icon` directly)
+    export PATH=${pkgs.lib.makeBinPath [ pkgs.imagemagick resolveIconsScript ]}:$PATH
     ${magicianEnv}/bin/python3 ${./core/magician.py} "$@"
   '';
 
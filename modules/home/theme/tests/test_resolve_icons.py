@@ -0,0 +1,90 @@
+"""
+test_resolve_icons.py — Theme index invalidation
+Run from modules/home/theme: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core import resolve_icons  # noqa: E402
+
+
+INDEX_THEME = """[Icon Theme]
+Name=Tela
+Directories=scalable/apps
+
+[scalable/apps]
+Context=Applications
+Size=16
+MinSize=16
+MaxSize=256
+Type=Scalable
+"""
+
+
+def make_package(store: Path, name: str, icons):
+    """A store-like theme package: index.theme + scalable/apps icons, mtime 1 like Nix."""
+    root = store / name / "share" / "icons" / "Tela"
+    (root / "scalable" / "apps").mkdir(parents=True)
+    (root / "index.theme").write_text(INDEX_THEME)
+    for icon in icons:
+        (root / "scalable" / "apps" / f"{icon}.svg").touch()
+    for path in [root, *root.rglob("*")]:
+        os.utime(path, ns=(1, 1))
+    return root
+
+
+class ThemeIndexTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.data = self.tmp / "profile" / "share"
+        (self.data / "icons").mkdir(parents=True)
+
+        env = mock.patch.dict(os.environ, {
+            "HOME": str(self.tmp / "home"),
+            "XDG_DATA_DIRS": str(self.data),
+            "XDG_DATA_HOME": str(self.tmp / "home" / ".local" / "share"),
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        index_dir = mock.patch.object(resolve_icons, "INDEX_DIR", str(self.tmp / "cache" / "themes"))
+        index_dir.start()
+        self.addCleanup(index_dir.stop)
+
+    def link_theme(self, root: Path):
+        link = self.data / "icons" / "Tela"
+        if link.is_symlink():
+            link.unlink()
+        link.symlink_to(root)
+
+    def test_repointed_root_symlink_rescans(self):
+        store = self.tmp / "store"
+        self.link_theme(make_package(store, "pkgA", ["firefox"]))
+        first = resolve_icons.ThemeIndex("Tela")
+        self.assertIsNotNone(first.get("firefox"))
+
+        # Nix rebuild: the profile now points at a new store path, the old one stays
+        self.link_theme(make_package(store, "pkgB", ["zed"]))
+        second = resolve_icons.ThemeIndex("Tela")
+        self.assertIsNone(second.get("firefox"))
+        self.assertIsNotNone(second.get("zed"))
+        self.assertNotEqual(first.version, second.version)
+
+    def test_unchanged_theme_uses_cache(self):
+        self.link_theme(make_package(self.tmp / "store", "pkgA", ["firefox"]))
+        first = resolve_icons.ThemeIndex("Tela")
+        with mock.patch.object(resolve_icons.ThemeIndex, "_build", side_effect=AssertionError("rescanned")):
+            second = resolve_icons.ThemeIndex("Tela")
+        self.assertEqual(first.version, second.version)
+        self.assertEqual(second.get("firefox"), first.get("firefox"))
+
+
+if __name__ == "__main__":
+    unittest.main()